@@ -1,10 +1,10 @@
 import numpy as np
-import os
 import sys
 from networks import Network
-from montecarlo import MCTS
-from copy import deepcopy
-from board import Board
+from montecarlo import MCTS, PersistentSearch
+from game_record import GameRecord, record_path
+from bitboard import make_board
+from vector_board import VectorBoard
 import config
 
 
@@ -25,49 +25,123 @@ def get_value(board, mode='selfmatch'):
             return 0.5
 
 
-def save_history(hists, epoch, process):
-    folders = ('histories_input', 'histories_policy', 'histories_value')
-    for i, f in enumerate(folders):
-        os.makedirs(os.path.join(f, epoch), exist_ok=True)
-        path = os.path.join(f, epoch, process + '.npy')
-        np.save(path, hists[i])
+def play_selfmatch(net, algo):
+    '''
+
+    Paramators
+    ----------
+    net : Neural Network
+        Network which has method "predict" for batched inputs.
+    algo : MCTS
+        Monte-Carlo algorithm class.
+
+    Returns
+    -------
+    record : GameRecord
+        Actions, visits of every move and value of the match.
+
+    '''
+    record = GameRecord()
+    board = make_board()
+    search = PersistentSearch(algo)
+
+    while not board.is_over():
+        probs = search.get_probs(net, board, config.SIMULATIONS, config.GAMMA)
+        takables = board.takable_actions()
+
+        action = np.random.choice(takables, p=probs)
+        record.add(takables, search.visits, action)
+        board = board.next_board(action)
+        search.advance(action)
+    record.finish(get_value(board))
+
+    return record
+
+
+def play_vector_selfmatch(net, algo, games):
+    '''
+
+    Paramators
+    ----------
+    net : Neural Network
+        Network which has method "predict" for batched inputs.
+    algo : MCTS
+        Monte-Carlo algorithm class.
+    games : int
+        Number of matches played at once.
+
+    Returns
+    -------
+    records : list
+        GameRecord of every match, same as play_selfmatch.
+        Legal actions, moves and ends of all matches are computed on one VectorBoard.
+        Every match keeps its own search over BitBoards.
+
+    '''
+    records = [GameRecord() for _ in range(games)]
+    boards = VectorBoard(games)
+    searches = [PersistentSearch(algo) for _ in range(games)]
+
+    while not boards.is_over().all():
+        masks = boards.takable_actions()
+        actions = np.full(games, -1)
+        for i in np.flatnonzero(masks.any(axis=1)):
+            takables = np.flatnonzero(masks[i]).tolist()
+            probs = searches[i].get_probs(net, boards.board(i), config.SIMULATIONS, config.GAMMA)
+
+            actions[i] = np.random.choice(takables, p=probs)
+            records[i].add(takables, searches[i].visits, actions[i])
+            searches[i].advance(actions[i])
+        boards.next_board(actions)
+
+    values = np.where(boards.is_lose(), np.where(boards.is_first(), -1, 1), 0)
+    for record, value in zip(records, values):
+        record.finish(int(value))
+
+    return records
 
 
 def single_match(epoch, process):
-    '''same as class method'''
+    '''same as class method.'''
     net = Network(load=True, )
     algo = MCTS()
-    board = Board()
-    hist_input, hist_policy = None, None
+    play_selfmatch(net, algo).save(record_path(epoch, process))
 
-    while not board.is_over():
-        probs = algo.get_probs(net, board, config.SIMULATIONS, config.GAMMA)
-        policy = np.zeros(config.OUTPUT_SHAPE)
-        for a, p in zip(board.takable_actions(), probs):
-            policy[a] = p
-
-        inp = board.reshape_input()
-        if hist_input is None:
-            hist_input = inp.copy()
-        else:
-            hist_input = np.vstack([hist_input, inp])
 
-        if hist_policy is None:
-            hist_policy = policy.copy()
-        else:
-            hist_policy = np.vstack([hist_policy, policy])
+def play_eval(nets, algo, mode):
+    '''
 
-        action = np.random.choice(board.takable_actions(), p=probs)
-        old_board = deepcopy(board)
-        board = old_board.next_board(action)
+    Paramators
+    ----------
+    nets : list
+        [first player's network, second player's network].
+    algo : MCTS
+        Monte-Carlo algorithm class.
+    mode : str
+        Match type passed to get_value.
 
-    value = get_value(board)
-    hist_value = np.zeros(hist_policy.shape[0])
-    for i in range(len(hist_value)):
-        hist_value[i] = value
-        value *= -1
+    Returns
+    -------
+    point : float
+        First player's point.
+
+    '''
+    board = make_board()
+    searches = [PersistentSearch(algo), PersistentSearch(algo)]
+    while not board.is_over():
+        if board.is_first():
+            action = searches[0].take_action(
+                nets[0], board, config.SIMULATIONS, 0,
+            )
+        else:
+            action = searches[1].take_action(
+                nets[1], board, config.SIMULATIONS, 0,
+            )
+        board = board.next_board(action)
+        for search in searches:
+            search.advance(action)
 
-    save_history([hist_input, hist_policy, hist_value], epoch, process)
+    return get_value(board, mode)
 
 
 def eval_match(mode, first):
@@ -88,20 +162,7 @@ def eval_match(mode, first):
     algo = MCTS()
     nets = [current_net, best_net] if first == 'True' else [best_net, current_net]
 
-    board = Board()
-    while not board.is_over():
-        if board.is_first():
-            action = algo.take_action(
-                nets[0], board, config.SIMULATIONS, 0,
-            )
-        else:
-            action = algo.take_action(
-                nets[1], board, config.SIMULATIONS, 0,
-            )
-        old_board = deepcopy(board)
-        board = old_board.next_board(action)
-
-    point = get_value(board, mode)
+    point = play_eval(nets, algo, mode)
     best_net.clean()
     current_net.clean()
     print(point)
@@ -0,0 +1,655 @@
+'''
+Bitboard implementation of Board.
+
+Every state is kept in first player's view (= absolute view) and never rotated.
+Squares are indexed as 'vertical * LENGTH + horizontal' and
+walls are packed into Python int bitmasks on the same square indexing.
+
+vertical_edges   : bit s is 1 when the gap between square s and s + 1 is blocked.
+horizontal_edges : bit s is 1 when the gap between square s and s + LENGTH is blocked.
+vertical_walls   : bit (v * (LENGTH - 1) + h) is 1 when vertical wall is built on (v, h).
+horizontal_walls : bit (v * (LENGTH - 1) + h) is 1 when horizontal wall is built on (v, h).
+
+Actions are the same as Board's ones, which are defined in self pawn's view.
+'''
+import numpy as np
+from board import Board, NEIGHBOURS, SIDES
+from config import LENGTH, BREAK, WALLS
+import config
+import zobrist
+
+
+SQUARES = LENGTH * LENGTH
+SLOTS = (LENGTH - 1) * (LENGTH - 1)
+ALL = (1 << SQUARES) - 1
+# Squares which have a square on their (+LENGTH) or (+1) side.
+NOT_TOP = (1 << (SQUARES - LENGTH)) - 1
+NOT_LAST_COLUMN = sum(1 << (v * LENGTH + h) for v in range(LENGTH) for h in range(LENGTH - 1))
+# Goal rows for first pawn (top) and second pawn (bottom).
+TOP_ROW = ALL ^ NOT_TOP
+BOTTOM_ROW = (1 << LENGTH) - 1
+# Edges blocked by each wall slot.
+VERTICAL_WALL_EDGES = [
+    (1 << (v * LENGTH + h)) | (1 << ((v + 1) * LENGTH + h))
+    for v in range(LENGTH - 1) for h in range(LENGTH - 1)
+]
+HORIZONTAL_WALL_EDGES = [
+    (1 << (v * LENGTH + h)) | (1 << (v * LENGTH + h + 1))
+    for v in range(LENGTH - 1) for h in range(LENGTH - 1)
+]
+# Index deltas for [forward, left, backward, right] in first pawn's view.
+DELTAS = (LENGTH, 1, -LENGTH, -1)
+# EDGE_BITS[square][k] is the bit of (horizontal_edges | vertical_edges << SQUARES)
+# which blocks the gap between square and NEIGHBOURS[square][k].
+EDGE_BITS = tuple(
+    (s, SQUARES + s, s - LENGTH, SQUARES + s - 1) for s in range(SQUARES)
+)
+
+
+def _flood(start, up, right):
+    '''
+
+    Parameters
+    ----------
+    start : int
+        Bitmask of the start square.
+    up : int
+        Bitmask of squares which can move to +LENGTH.
+    right : int
+        Bitmask of squares which can move to +1.
+
+    Returns
+    -------
+    reach : int
+        Bitmask of squares reachable from start.
+
+    '''
+    down = up << LENGTH
+    left = right << 1
+    reach = start
+    while True:
+        grown = reach | ((reach & up) << LENGTH) | ((reach & down) >> LENGTH) | ((reach & right) << 1) | ((reach & left) >> 1)
+        if grown == reach:
+            return reach
+        reach = grown
+
+
+def _bits_to_plane(bits):
+    '''
+
+    Parameters
+    ----------
+    bits : int
+        Bitmask on square indexing.
+
+    Returns
+    -------
+    plane : np.ndarray
+        (LENGTH, LENGTH) int32 array. 1 where bit is set.
+
+    '''
+    raw = np.frombuffer(bits.to_bytes((SQUARES + 7) // 8, 'little'), dtype=np.uint8)
+    plane = np.unpackbits(raw, bitorder='little')[:SQUARES].reshape(LENGTH, LENGTH)
+
+    return plane.astype(np.int32)
+
+
+class BitBoard:
+    '''
+
+    Attributes
+    ----------
+    pawns : tuple
+        (first pawn's square, second pawn's square) in first pawn's view.
+    walls : tuple
+        (first pawn's walls, second pawn's walls).
+    vertical_edges : int
+        Blocked gaps between square s and s + 1.
+    horizontal_edges : int
+        Blocked gaps between square s and s + LENGTH.
+    vertical_walls : int
+        Built vertical walls.
+    horizontal_walls : int
+        Built horizontal walls.
+    turn : int
+        Match turn.
+    key : int
+        Zobrist key of this position defined in zobrist.py.
+
+    '''
+    __slots__ = (
+        'pawns', 'walls', 'vertical_edges', 'horizontal_edges',
+        'vertical_walls', 'horizontal_walls', 'turn', 'key', '_records',
+    )
+
+    def __init__(
+            self,
+            pawns = None,
+            walls = None,
+            vertical_edges = 0,
+            horizontal_edges = 0,
+            vertical_walls = 0,
+            horizontal_walls = 0,
+            turn = 1,
+            key = None,
+        ):
+        '''
+
+        Paramators
+        ----------
+        pawns : tuple
+            (first pawn's square, second pawn's square) in first pawn's view.
+        walls : tuple
+            (first pawn's walls, second pawn's walls).
+        vertical_edges : int
+            Blocked gaps between square s and s + 1.
+        horizontal_edges : int
+            Blocked gaps between square s and s + LENGTH.
+        vertical_walls : int
+            Built vertical walls.
+        horizontal_walls : int
+            Built horizontal walls.
+        turn : int
+            Match turn.
+        key : int
+            Zobrist key of this position. Built from the state when None.
+
+        '''
+        mid = LENGTH // 2
+        self.pawns = (mid, SQUARES - 1 - mid) if pawns is None else pawns
+        self.walls = (WALLS, WALLS) if walls is None else walls
+        self.vertical_edges = vertical_edges
+        self.horizontal_edges = horizontal_edges
+        self.vertical_walls = vertical_walls
+        self.horizontal_walls = horizontal_walls
+        self.turn = turn
+        if key is None:
+            key = zobrist.board_key(
+                self.pawns,
+                self.walls,
+                [i for i in range(SLOTS) if (vertical_walls >> i) & 1],
+                [i for i in range(SLOTS) if (horizontal_walls >> i) & 1],
+                self.is_first(),
+            )
+        self.key = key
+        # Undo records for push / pop.
+        self._records = None
+
+    def __str__(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        s : str
+            Board's expression in string.
+
+        '''
+        return self._to_board().__str__()
+
+    @property
+    def walls_self(self):
+        return self.walls[0] if self.is_first() else self.walls[1]
+
+    @property
+    def walls_other(self):
+        return self.walls[1] if self.is_first() else self.walls[0]
+
+    def _to_board(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        board : Board
+            Board class which has the same state as this one.
+
+        '''
+        from board import Pawn, WallVertical, WallHorizontal, Wall
+
+        first = self.is_first()
+        self_idx = self.pawns[0] if first else SQUARES - 1 - self.pawns[1]
+        other_idx = SQUARES - 1 - self.pawns[1] if first else self.pawns[0]
+        open_vertical, open_horizontal = self._open_planes()
+        vertical = np.ones(SLOTS, dtype=np.int32)
+        horizontal = np.ones(SLOTS, dtype=np.int32)
+        for i in range(SLOTS):
+            vertical[i] -= (self.vertical_walls >> i) & 1
+            horizontal[i] -= (self.horizontal_walls >> i) & 1
+        vertical = vertical.reshape(LENGTH - 1, LENGTH - 1)
+        horizontal = horizontal.reshape(LENGTH - 1, LENGTH - 1)
+        if not first:
+            vertical = np.rot90(vertical, 2)
+            horizontal = np.rot90(horizontal, 2)
+
+        board = Board(
+            pawn_self = Pawn(position = np.array(divmod(self_idx, LENGTH))),
+            pawn_other = Pawn(position = np.array(divmod(other_idx, LENGTH))),
+            wall_vertical = WallVertical(vertical = np.ascontiguousarray(open_vertical[:, :LENGTH - 1])),
+            wall_horizontal = WallHorizontal(horizontal = np.ascontiguousarray(open_horizontal[:LENGTH - 1])),
+            wall = Wall(vertical = np.ascontiguousarray(vertical), horizontal = np.ascontiguousarray(horizontal)),
+            walls_self = self.walls_self,
+            walls_other = self.walls_other,
+            turn = self.turn,
+        )
+
+        return board
+
+    def _open_planes(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        open_vertical : np.ndarray
+            (LENGTH, LENGTH) passable vertical gaps in self pawn's view.
+            Last column is always 0.
+        open_horizontal : np.ndarray
+            (LENGTH, LENGTH) passable horizontal gaps in self pawn's view.
+            Last row is always 0.
+
+        '''
+        open_vertical = _bits_to_plane(NOT_LAST_COLUMN & ~self.vertical_edges)
+        open_horizontal = _bits_to_plane(NOT_TOP & ~self.horizontal_edges)
+        if not self.is_first():
+            # Rotate real gaps and keep padding on the last column / row.
+            open_vertical[:, :LENGTH - 1] = np.rot90(open_vertical[:, :LENGTH - 1], 2)
+            open_horizontal[:LENGTH - 1] = np.rot90(open_horizontal[:LENGTH - 1], 2)
+
+        return open_vertical, open_horizontal
+
+    def _self_square(self):
+        '''
+
+        Returns
+        -------
+        square : int
+            Self pawn's square in first pawn's view.
+
+        '''
+        return self.pawns[0] if self.is_first() else self.pawns[1]
+
+    def _other_square(self):
+        '''
+
+        Returns
+        -------
+        square : int
+            Other pawn's square in first pawn's view.
+
+        '''
+        return self.pawns[1] if self.is_first() else self.pawns[0]
+
+    def _passable(self, square, k, blocked):
+        '''
+
+        Parameters
+        ----------
+        square : int
+            Square index in first pawn's view.
+        k : int
+            Direction index of DELTAS.
+        blocked : int
+            horizontal_edges | vertical_edges << SQUARES.
+
+        Returns
+        -------
+        passable : bool
+            Whether pawn can move from square toward DELTAS[k].
+
+        '''
+        return NEIGHBOURS[square][k] >= 0 and not (blocked >> EDGE_BITS[square][k]) & 1
+
+    def _direction(self, i):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Direction index in self pawn's view.
+
+        Returns
+        -------
+        k : int
+            Direction index in first pawn's view.
+
+        '''
+        return i if self.is_first() else (i + 2) % 4
+
+    def is_lose(self):
+        '''
+
+        Returns
+        -------
+        lose : bool
+            Whether other pawn has already reached its goal.
+
+        '''
+        if self.is_first():
+            return self.pawns[1] < LENGTH
+        return self.pawns[0] >= SQUARES - LENGTH
+
+    def is_draw(self):
+        return self.turn >= BREAK
+
+    def is_over(self):
+        return self.is_lose() or self.is_draw()
+
+    def is_first(self):
+        return self.turn % 2 == 1
+
+    def movable(self):
+        '''
+
+        Returns
+        -------
+        movables : list
+            Takable actions for moving pawn. 1 means takable.
+            [forward, left, backward, right, jump_forward, jump_left, jump_backward, jump_right]
+
+        '''
+        movables = [0 for _ in range(8)]
+        me, other = self._self_square(), self._other_square()
+        blocked = self.horizontal_edges | self.vertical_edges << SQUARES
+        for i in range(4):
+            k = self._direction(i)
+            if not self._passable(me, k, blocked):
+                continue
+            nxt = NEIGHBOURS[me][k]
+            if nxt != other:
+                movables[i] = 1
+                continue
+
+            if self._passable(nxt, k, blocked):
+                movables[i + 4] = 1
+                continue
+            for j in SIDES[i]:
+                if self._passable(nxt, self._direction(j), blocked):
+                    movables[j + 4] = 1
+
+        return movables
+
+    def _goalable(self, vertical_edges, horizontal_edges):
+        '''
+
+        Parameters
+        ----------
+        vertical_edges : int
+            Blocked gaps between square s and s + 1.
+        horizontal_edges : int
+            Blocked gaps between square s and s + LENGTH.
+
+        Returns
+        -------
+        goalable : bool
+            Whether both pawns can still reach their goals.
+
+        '''
+        up = NOT_TOP & ~horizontal_edges
+        right = NOT_LAST_COLUMN & ~vertical_edges
+        if not _flood(1 << self.pawns[0], up, right) & TOP_ROW:
+            return False
+
+        return bool(_flood(1 << self.pawns[1], up, right) & BOTTOM_ROW)
+
+    def blockable(self):
+        '''
+
+        Returns
+        -------
+        blockable : list
+            blockable indecs in self pawn's view. 1 means takable.
+            [block_idx(vertical)...] + [block_idx(horizontal)...]
+
+        '''
+        vertical, horizontal = [0 for _ in range(SLOTS)], [0 for _ in range(SLOTS)]
+        if self.walls_self <= 0:
+            return vertical + horizontal
+
+        first = self.is_first()
+        for slot in range(SLOTS):
+            idx = slot if first else SLOTS - 1 - slot
+            crossed = (self.vertical_walls | self.horizontal_walls) >> slot & 1
+
+            edges = VERTICAL_WALL_EDGES[slot]
+            if not crossed and not self.vertical_edges & edges:
+                if self._goalable(self.vertical_edges | edges, self.horizontal_edges):
+                    vertical[idx] = 1
+
+            edges = HORIZONTAL_WALL_EDGES[slot]
+            if not crossed and not self.horizontal_edges & edges:
+                if self._goalable(self.vertical_edges, self.horizontal_edges | edges):
+                    horizontal[idx] = 1
+
+        return vertical + horizontal
+
+    def takable_actions(self):
+        '''
+
+        Returns
+        -------
+        actions : list
+            Takable actions indecs defined in Board.takable_actions.
+
+        '''
+        actions = self.movable() + self.blockable()
+
+        return [i for i, a in enumerate(actions) if a]
+
+    def _state(self):
+        '''
+
+        Returns
+        -------
+        state : tuple
+            Arguments of BitBoard which builds the same board as this one.
+
+        '''
+        return (
+            self.pawns, self.walls, self.vertical_edges, self.horizontal_edges,
+            self.vertical_walls, self.horizontal_walls, self.turn, self.key,
+        )
+
+    def _set_state(self, state):
+        '''
+
+        Parameters
+        ----------
+        state : tuple
+            State built by _state or _next_state.
+
+        Returns
+        -------
+        None
+
+        '''
+        (
+            self.pawns, self.walls, self.vertical_edges, self.horizontal_edges,
+            self.vertical_walls, self.horizontal_walls, self.turn, self.key,
+        ) = state
+
+    def _next_state(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action index defined in takable_actions.
+
+        Returns
+        -------
+        state : tuple
+            State after took arg's action. Same order as _state.
+
+        '''
+        # Actions from np.random.choice are numpy ints, whose shifts overflow at bit 63.
+        action = int(action)
+        first = self.is_first()
+        me = 0 if first else 1
+        pawns, walls = list(self.pawns), list(self.walls)
+        vertical_edges, horizontal_edges = self.vertical_edges, self.horizontal_edges
+        vertical_walls, horizontal_walls = self.vertical_walls, self.horizontal_walls
+        key = self.key ^ zobrist.SECOND
+
+        # Move Pawn
+        if action < 8:
+            if action < 4:
+                pawns[me] += DELTAS[self._direction(action)]
+            else:
+                pawns[me] = pawns[1 - me] + DELTAS[self._direction(action - 4)]
+            key ^= zobrist.PAWN[me][self.pawns[me]] ^ zobrist.PAWN[me][pawns[me]]
+
+        # Build Wall
+        elif action < SLOTS + 8:
+            slot = action - 8 if first else SLOTS - 1 - (action - 8)
+            vertical_edges |= VERTICAL_WALL_EDGES[slot]
+            vertical_walls |= 1 << slot
+            walls[me] -= 1
+            key ^= zobrist.VERTICAL[slot]
+        elif action < 2 * SLOTS + 8:
+            slot = action - SLOTS - 8 if first else SLOTS - 1 - (action - SLOTS - 8)
+            horizontal_edges |= HORIZONTAL_WALL_EDGES[slot]
+            horizontal_walls |= 1 << slot
+            walls[me] -= 1
+            key ^= zobrist.HORIZONTAL[slot]
+
+        if walls[me] != self.walls[me]:
+            key ^= zobrist.WALLS_LEFT[me][self.walls[me]] ^ zobrist.WALLS_LEFT[me][walls[me]]
+
+        state = (
+            tuple(pawns), tuple(walls), vertical_edges, horizontal_edges,
+            vertical_walls, horizontal_walls, self.turn + 1, key,
+        )
+
+        return state
+
+    def next_board(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action index defined in takable_actions.
+
+        Returns
+        -------
+        board : BitBoard
+            BitBoard class after took arg's action. This board isn't changed.
+
+        '''
+        return BitBoard(*self._next_state(action))
+
+    def push(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action index defined in takable_actions.
+
+        Returns
+        -------
+        None
+            Take arg's action in place. This board becomes the same as next_board(action).
+
+        '''
+        if self._records is None:
+            self._records = []
+        self._records.append((action, self._state()))
+        self._set_state(self._next_state(action))
+
+    def pop(self):
+        '''
+
+        Returns
+        -------
+        action : int
+            Action taken by the last push. This board is reverted to the one before it.
+
+        '''
+        action, state = self._records.pop()
+        self._set_state(state)
+
+        return action
+
+    def reshape_input(self, out=None):
+        '''
+
+        Parameters
+        ----------
+        out : np.ndarray
+            Buffer to write in. (9, 9, 24) or (1, 9, 9, 24) float32 array.
+            New buffer is allocated when None.
+
+        Returns
+        -------
+        array : np.ndarray
+            The same network input as Board.reshape_input. (1, 9, 9, 24)
+            This is 'out' itself when it is given.
+
+        '''
+        first = self.is_first()
+        array = np.empty(shape=(1, LENGTH, LENGTH, 4 + WALLS * 2), dtype=np.float32) if out is None else out
+        # Self pawn in self view, other pawn in other's own view.
+        me = self.pawns[0] if first else SQUARES - 1 - self.pawns[1]
+        other = SQUARES - 1 - self.pawns[1] if first else self.pawns[0]
+        array[..., :2] = 0
+        array[..., me // LENGTH, me % LENGTH, 0] = 1
+        array[..., other // LENGTH, other % LENGTH, 1] = 1
+        array[..., 2], array[..., 3] = self._open_planes()
+        array[..., 4:4 + self.walls_self] = 1
+        array[..., 4 + self.walls_self:4 + WALLS] = 0
+        array[..., 4 + WALLS:4 + WALLS + self.walls_other] = 1
+        array[..., 4 + WALLS + self.walls_other:] = 0
+
+        return array
+
+    def board_to_str(self):
+        me = self._self_square()
+        if not self.is_first():
+            me = SQUARES - 1 - me
+        open_vertical, open_horizontal = self._open_planes()
+        mark = ' 1 ' if self.is_first() else ' 2 '
+
+        s = ''
+        for v in range(LENGTH):
+            for h in range(LENGTH - 1):
+                s += mark if me == v * LENGTH + h else '   '
+                s += ' ' if open_vertical[v, h] else '|'
+
+            if me == v * LENGTH + LENGTH - 1:
+                s += mark
+            else:
+                s += '   \n'
+
+            if v == LENGTH - 1: continue
+            for h in range(LENGTH - 1):
+                s += '   *' if open_horizontal[v, h] else '---*'
+            s += '   \n' if open_horizontal[v, LENGTH - 1] else '---\n'
+
+        return s
+
+
+def make_board():
+    '''
+
+    Parameters
+    ----------
+    None.
+
+    Returns
+    -------
+    board : Board, BitBoard
+        Initial board of the engine selected by config.BITBOARD.
+
+    '''
+    return BitBoard() if config.BITBOARD else Board()
@@ -1,14 +1,61 @@
 '''
 1: Passable
 0: Blocked
-
-direction =  1: Go Left
-direction = -1: Go Right
-direction =  9: Go Forward
-direction = -9: Go Backward
 '''
 import numpy as np
 from config import LENGTH, BREAK, WALLS
+import zobrist
+
+
+def _build_move_tables():
+    '''
+
+    Parameters
+    ----------
+    None.
+
+    Returns
+    -------
+    neighbours : tuple
+        neighbours[idx][d] is the index next to idx toward direction d.
+        -1 when it is out of board.
+    guards : tuple
+        guards[idx][d] is the index of the gap between idx and neighbours[idx][d]
+        in (open_horizontal.ravel() + open_vertical.ravel()).
+        -1 when it is out of board.
+
+    '''
+    offset = (LENGTH - 1) * LENGTH
+    neighbours, guards = [], []
+    for idx in range(LENGTH * LENGTH):
+        v, h = divmod(idx, LENGTH)
+        neighbours.append((
+            idx + LENGTH if v < LENGTH - 1 else -1,
+            idx + 1 if h < LENGTH - 1 else -1,
+            idx - LENGTH if v > 0 else -1,
+            idx - 1 if h > 0 else -1,
+        ))
+        guards.append((
+            v * LENGTH + h if v < LENGTH - 1 else -1,
+            offset + v * (LENGTH - 1) + h if h < LENGTH - 1 else -1,
+            (v - 1) * LENGTH + h if v > 0 else -1,
+            offset + v * (LENGTH - 1) + h - 1 if h > 0 else -1,
+        ))
+
+    return tuple(neighbours), tuple(guards)
+
+
+# Pawn's moves [forward, left, backward, right] shared by every Board.
+FORWARD = np.array([1, 0])
+LEFT = np.array([0, 1])
+BACKWARD = np.array([-1, 0])
+RIGHT = np.array([0, -1])
+MOVES = (FORWARD, LEFT, BACKWARD, RIGHT)
+CORNER = np.array([LENGTH - 1, LENGTH - 1])
+# Directions are [forward, left, backward, right] same as MOVES.
+NEIGHBOURS, GUARDS = _build_move_tables()
+# Directions for diagonal jumps when straight jump is blocked.
+SIDES = ((1, 3), (0, 2), (1, 3), (0, 2))
 
 
 class WallHorizontal:
@@ -21,6 +68,8 @@ class WallHorizontal:
         1 means passible.
 
     '''
+    __slots__ = ('open_horizontal',)
+
     def __init__(self, horizontal=None):
         '''
 
@@ -50,31 +99,6 @@ class WallHorizontal:
         self.open_horizontal[v, h] = 0
         self.open_horizontal[v, h + 1] = 0
 
-    def passable(self, before_idx, direction):
-        '''
-
-        Parameters
-        ----------
-        before_idx : int
-            Index of board.
-        direction : int
-            Moving direction mentioned avobe.
-
-        Returns
-        -------
-        movable : int
-            Wheter this action from 'before_position' to 'after_action' is valid according to instance variable open_horizontal.
-            1 equals to that you can move(valid).
-
-        '''
-        v, h = divmod(before_idx, LENGTH) # == idx to position
-        # Go Forward
-        if direction == LENGTH:
-            return self.open_horizontal[v, h]
-        # Go Backward
-        elif direction == -LENGTH:
-            return self.open_horizontal[v - 1, h]
-
 
 class WallVertical:
     '''
@@ -86,6 +110,8 @@ class WallVertical:
         1 means passible.
 
     '''
+    __slots__ = ('open_vertical',)
+
     def __init__(self, vertical=None):
         '''
 
@@ -115,33 +141,6 @@ class WallVertical:
         self.open_vertical[v, h] = 0
         self.open_vertical[v + 1, h] = 0
 
-    def passable(self, before_idx, direction):
-        '''
-
-        Parameters
-        ----------
-        before_idx : int
-            Index of board.
-        direction : int
-            Moving direction mentioned avobe.
-
-        Returns
-        -------
-        movable : int
-            Wheter this action from 'before_position' to 'after_action' is valid according to instance variable open_vartical.
-            1 equals to that you can move(valid).
-
-        '''
-        # Go Left
-        v, h = divmod(before_idx, LENGTH)
-        if direction == 1:
-            movable = self.open_vertical[v, h]
-        # Go Right
-        elif direction == -1:
-            movable = self.open_vertical[v, h - 1]
-
-        return movable
-
 
 class Wall:
     '''
@@ -157,6 +156,8 @@ class Wall:
         1 means passible.
 
     '''
+    __slots__ = ('vertical', 'horizontal')
+
     def __init__(self, vertical=None, horizontal=None):
         '''
 
@@ -180,14 +181,15 @@ class Pawn:
 
     Attributes
     ----------
-    pawn : np.ndarray
-        Numpy array represents where pawn is and which is 1.
     position : np.nddarray
         Pawn's position index. [vertical, horizontal].
+        Pawn's plane for network input is made from this in Board.reshape_input.
     walls : int
         How many walls does this pawn have.
 
     '''
+    __slots__ = ('position', 'walls')
+
     def __init__(self, position=None):
         '''
 
@@ -198,39 +200,23 @@ class Pawn:
 
         '''
         mid = LENGTH // 2
-        self.pawn = np.zeros(shape=(LENGTH, LENGTH), dtype=np.int32)
         self.position = np.array([0, mid]) if position is None else position # [vertical, horitontal]
-        self.pawn[self.position[0], self.position[1]] = 1
         self.walls = WALLS
 
+    def place(self, position):
+        '''
 
-class UnionFind:
-    def __init__(self):
-        self.pars = [-1 for _ in range(LENGTH ** 2)]
-        self.sizes = [1 for _ in range(LENGTH ** 2)]
-
-    def root(self, x):
-        if self.pars[x] == -1:
-            return x
-        else:
-            self.pars[x] = self.root(self.pars[x])
-            return self.pars[x]
-
-    def issame(self, x, y):
-        return self.root(x) == self.root(y)
-
-    def unite(self, x, y):
-        x, y = self.root(x), self.root(y)
-        if x == y: return False
-        if self.size(x) < self.size(y):
-            x, y = y, x
-        self.pars[y] = x
-        self.sizes[x] += self.sizes[y]
+        Parameters
+        ----------
+        position : np.ndarray
+            Pawn's new position. [vertical, horizontal].
 
-        return True
+        Returns
+        -------
+        None
 
-    def size(self, x):
-        return self.sizes[self.root(x)]
+        '''
+        self.position = position
 
 
 class Board:
@@ -257,20 +243,28 @@ class Board:
         How many walls does other pawn have.
     turn : int
         Match turn.
+    key : int
+        Zobrist key of this position defined in zobrist.py.
     forward : np.ndarray
-        Pawn's move for forward.
+        Pawn's move for forward. Shared by every Board.
     left : np.ndarray
-        Pawn's move for left.
+        Pawn's move for left. Shared by every Board.
     backward : np.ndarray
-        Pawn's move for backward.
+        Pawn's move for backward. Shared by every Board.
     right : np.ndarray
-        Pawn's move for right.
+        Pawn's move for right. Shared by every Board.
     moves : tupple
-        4 moves tupple avobe.
-    attr_names : dict
-        This Class's attribute name for building class.
+        4 moves tupple avobe. Shared by every Board.
 
     '''
+    __slots__ = (
+        'pawn_self', 'pawn_other', 'pawn_other_position', 'wall_vertical',
+        'wall_horizontal', 'wall', 'walls_self', 'walls_other', 'turn', 'key',
+        '_records',
+    )
+    forward, left, backward, right = MOVES
+    moves = MOVES
+
     def __init__(
             self,
             pawn_self = None,
@@ -281,6 +275,7 @@ class Board:
             walls_self = None,
             walls_other = None,
             turn = 1,
+            key = None,
         ):
         '''
 
@@ -305,29 +300,22 @@ class Board:
             How many walls does other pawn have.
         turn : int
             Match turn.
+        key : int
+            Zobrist key of this position. Built from the state when None.
 
         '''
         self.pawn_self = Pawn() if pawn_self is None else pawn_self
         self.pawn_other = Pawn() if pawn_other is None else pawn_other
-        self.pawn_other_position = np.array([LENGTH - 1, LENGTH - 1]) - self.pawn_other.position
+        self.pawn_other_position = CORNER - self.pawn_other.position
         self.wall_vertical = WallVertical() if wall_vertical is None else wall_vertical
         self.wall_horizontal = WallHorizontal() if wall_horizontal is None else wall_horizontal
         self.wall = Wall() if wall is None else wall
         self.walls_self = WALLS if walls_self is None else walls_self
         self.walls_other = WALLS if walls_other is None else walls_other
         self.turn = turn
-        # Moves
-        self.forward = np.array([1, 0])
-        self.left = np.array([0, 1])
-        self.backward = np.array([-1, 0])
-        self.right = np.array([0, -1])
-        self.moves = (self.forward, self.left, self.backward, self.right)
-
-        self.attr_names = {
-            'pawn_self', 'pawn_other', 'pawn_other_position', 'wall_vertical',
-            'wall_horizontal', 'wall', 'walls_self', 'walls_other', 'turn',
-        }
-        self._build_attrs_dict()
+        self.key = self._build_key() if key is None else key
+        # Undo records for push / pop.
+        self._records = None
 
     def __str__(self):
         '''
@@ -345,7 +333,7 @@ class Board:
         s = ''
         for v in range(LENGTH):
             for h in range(LENGTH - 1):
-                if self.pawn_self.pawn[v, h]:
+                if self.pawn_self.position[0] == v and self.pawn_self.position[1] == h:
                     s += ' 1 ' if self.is_first() else ' 2 '
                 elif np.all(np.array([v, h]) == self.pawn_other_position):
                     s += ' 2 ' if self.is_first() else ' 1 '
@@ -353,7 +341,7 @@ class Board:
                     s += '   '
                 s += ' ' if self.wall_vertical.open_vertical[v, h] else '|'
 
-            if self.pawn_self.pawn[v, LENGTH - 1]:
+            if self.pawn_self.position[0] == v and self.pawn_self.position[1] == LENGTH - 1:
                 s += ' 1 \n' if self.is_first() else ' 2 \n'
             elif np.all(np.array([v, LENGTH - 1]) == self.pawn_other_position):
                 s += ' 2 \n' if self.is_first() else ' 1 \n'
@@ -367,36 +355,75 @@ class Board:
 
         return s
     
-    def _build_attrs_dict(self):
+    def _build_key(self):
         '''
 
         Parameters
         ----------
         None.
+
         Returns
         -------
-        None
+        key : int
+            Zobrist key of this position.
 
         '''
-        self.attrs = {}
-        for k in self.attr_names:
-            self.attrs[k] = getattr(self, k)
+        self_idx = self._position_to_idx(self.pawn_self.position)
+        other_idx = self._position_to_idx(self.pawn_other.position)
+        vertical = np.flatnonzero(self.wall.vertical == 0).tolist()
+        horizontal = np.flatnonzero(self.wall.horizontal == 0).tolist()
+
+        if self.is_first():
+            pawns = (self_idx, LENGTH * LENGTH - 1 - other_idx)
+            walls = (self.walls_self, self.walls_other)
+        else:
+            pawns = (other_idx, LENGTH * LENGTH - 1 - self_idx)
+            walls = (self.walls_other, self.walls_self)
+            vertical = [(LENGTH - 1) * (LENGTH - 1) - 1 - i for i in vertical]
+            horizontal = [(LENGTH - 1) * (LENGTH - 1) - 1 - i for i in horizontal]
+
+        return zobrist.board_key(pawns, walls, vertical, horizontal, self.is_first())
 
-    def _set_attrs(self):
+    def _next_key(self, action):
         '''
 
         Parameters
         ----------
-        None.
+        action : int
+            Action index defined in takable_actions. Not taken yet.
 
         Returns
         -------
-        None
+        key : int
+            Zobrist key after took arg's action.
 
         '''
-        for k, v in self.attrs.items():
-            delattr(self, k)
-            setattr(self, k, v)
+        first = self.is_first()
+        player = 0 if first else 1
+        key = self.key ^ zobrist.SECOND
+
+        # Move Pawn
+        if action < 8:
+            before = self._position_to_idx(self.pawn_self.position)
+            if action < 4:
+                after = self._position_to_idx(self.pawn_self.position + self.moves[action])
+            else:
+                after = self._position_to_idx(self.pawn_other_position + self.moves[action - 4])
+            if not first:
+                before, after = LENGTH * LENGTH - 1 - before, LENGTH * LENGTH - 1 - after
+            key ^= zobrist.PAWN[player][before] ^ zobrist.PAWN[player][after]
+
+        # Build Wall
+        elif action < 2 * (LENGTH - 1) * (LENGTH - 1) + 8:
+            slot, table = action - 8, zobrist.VERTICAL
+            if slot >= (LENGTH - 1) * (LENGTH - 1):
+                slot, table = slot - (LENGTH - 1) * (LENGTH - 1), zobrist.HORIZONTAL
+            if not first:
+                slot = (LENGTH - 1) * (LENGTH - 1) - 1 - slot
+            key ^= table[slot]
+            key ^= zobrist.WALLS_LEFT[player][self.walls_self] ^ zobrist.WALLS_LEFT[player][self.walls_self - 1]
+
+        return key
 
     def _position_to_idx(self, position):
         '''
@@ -416,71 +443,6 @@ class Board:
 
         return idx
 
-    def _idx_to_position(self, idx):
-        '''
-
-        Parameters
-        ----------
-        idx : int
-            Index of board.
-
-        Returns
-        -------
-        position : list
-            Position indecs list. [vertical, horizontal].
-
-        '''
-        position = divmod(idx, LENGTH)
-
-        return list(position)
-
-    def _is_out_board(self, after_position):
-        '''
-
-        Parameters
-        ----------
-        after_position : numpy.ndarray
-            Position after moving.
-
-        Returns
-        -------
-        movable : bool
-            Wheter this 'after_position' is valid. If this is out, return True.
-
-        '''
-        movable = after_position[0] < 0 or LENGTH <= after_position[0] or after_position[1] < 0 or LENGTH <= after_position[1]
-
-        return movable
-
-    def _is_movable_from_move(self, before_position, after_position):
-        '''
-
-        Parameters
-        ----------
-        before_position : numpy.ndarray
-            Position befre moving.
-
-        after_position : numpy.ndarray
-            Position after moving.
-
-        Returns
-        -------
-        movable : int
-            Wheter this action from 'before_position' to 'after_action' is valid.
-            If movable, return 1.(valid).
-
-        '''
-        before_idx = self._position_to_idx(before_position)
-        after_idx = self._position_to_idx(after_position)
-        direction = after_idx - before_idx
-
-        if direction in (LENGTH, -LENGTH):
-            movable = self.wall_horizontal.passable(before_idx, direction)
-        elif direction in (1, -1):
-            movable = self.wall_vertical.passable(before_idx, direction)
-
-        return movable
-
     def _is_blockable_vertical(self, vertical, horizontal):
         '''
 
@@ -533,57 +495,83 @@ class Board:
 
         return blockable
     
-    def _build_union_find(self):
+    def _shortest_path(self, position, goal, blocked=()):
         '''
 
         Parameters
         ----------
-        None.
+        position : np.ndarray, list
+            Start position. [vertical, horizontal].
+        goal : int
+            Vertical index of goal row.
+        blocked : tuple
+            Edges treated as blocked in addition to walls already built.
 
         Returns
         -------
-        uf : UnionFind
-            Union Find Class which considers for self.block.
-
-        '''
-        uf = UnionFind()
-        for i in range(LENGTH):
-            for j in range(LENGTH):
-                idx = self._position_to_idx([i, j])
-                if j < LENGTH - 1 and self.wall_vertical.open_vertical[i, j] == 1:
-                    uf.unite(idx, idx + 1)
-                if i < LENGTH - 1 and self.wall_horizontal.open_horizontal[i, j] == 1:
-                    uf.unite(idx, idx + LENGTH)
-
-        return uf
-
-    def _union_find_goalable(self, uf, is_self):
+        path : list
+            Edges on one of the shortest paths to goal like ('v', v, h) or ('h', v, h).
+            'v' is the index of open_vertical, 'h' is the one of open_horizontal.
+            None when pawn can't reach the goal.
+
+        '''
+        open_vertical = self.wall_vertical.open_vertical.tolist()
+        open_horizontal = self.wall_horizontal.open_horizontal.tolist()
+        start = (int(position[0]), int(position[1]))
+        parents = {start: None}
+        queue = [start]
+
+        for v, h in queue:
+            if v == goal:
+                path = []
+                while parents[(v, h)] is not None:
+                    edge, v, h = parents[(v, h)]
+                    path.append(edge)
+                return path
+
+            for kind, nv, nh, ev, eh, is_open in (
+                    ('h', v + 1, h, v, h, v < LENGTH - 1 and open_horizontal[v][h]),
+                    ('h', v - 1, h, v - 1, h, v > 0 and open_horizontal[v - 1][h]),
+                    ('v', v, h + 1, v, h, h < LENGTH - 1 and open_vertical[v][h]),
+                    ('v', v, h - 1, v, h - 1, h > 0 and open_vertical[v][h - 1]),
+                ):
+                if not is_open or (nv, nh) in parents:
+                    continue
+                edge = (kind, ev, eh)
+                if edge in blocked:
+                    continue
+                parents[(nv, nh)] = (edge, v, h)
+                queue.append((nv, nh))
+
+        return None
+
+    def _is_goalable_with(self, edges, cut):
         '''
 
         Parameters
         ----------
-        uf : UnionFind
-            Union Find Class which considers for self.block.
-
-        is_self : Bool
-            Is this check for Self or Other.
+        edges : tuple
+            Edges which a new wall blocks.
+        cut : tuple
+            Sets of edges on current shortest path for (self pawn, other pawn).
+            None means the pawn has to be checked for every wall.
 
         Returns
         -------
-        res : bool
-            Is this block valid. When valid, return True.
+        goalable : int
+            Whether both pawns can reach their goals after blocking edges.
+            If goalable, return 1.(valid).
 
         '''
-        self_idx = self._position_to_idx(self.pawn_self.position)
-        other_idx = self._position_to_idx(self.pawn_other_position)
-        for g in range(LENGTH):
-            if is_self:
-                res = uf.issame(self_idx, self._position_to_idx([LENGTH - 1, g]))
-            else:
-                res = uf.issame(other_idx, self._position_to_idx([0, g]))
-            if res: return True
+        cut_s, cut_o = cut
+        if cut_s is None or not cut_s.isdisjoint(edges):
+            if self._shortest_path(self.pawn_self.position, LENGTH - 1, edges) is None:
+                return 0
+        if cut_o is None or not cut_o.isdisjoint(edges):
+            if self._shortest_path(self.pawn_other_position, 0, edges) is None:
+                return 0
 
-        return False
+        return 1
 
     def is_lose(self):
         '''
@@ -597,7 +585,7 @@ class Board:
         None
 
         '''
-        return 1 in self.pawn_other.pawn[LENGTH - 1]
+        return self.pawn_other.position[0] == LENGTH - 1
 
     def is_draw(self):
         '''
@@ -656,33 +644,27 @@ class Board:
 
         '''
         movables = [0 for _ in range(8)]
-        for i, move in enumerate(self.moves):
-            next_position = self.pawn_self.position + move
-            if self._is_out_board(next_position):
+        gaps = self.wall_horizontal.open_horizontal.ravel().tolist() + self.wall_vertical.open_vertical.ravel().tolist()
+        idx = self._position_to_idx(self.pawn_self.position)
+        other_idx = self._position_to_idx(self.pawn_other_position)
+
+        for i in range(4):
+            next_idx = NEIGHBOURS[idx][i]
+            # Out of board or distructed by wall
+            if next_idx < 0 or not gaps[GUARDS[idx][i]]:
+                continue
+            # This move is valid. You dont have to jump.
+            if next_idx != other_idx:
+                movables[i] = 1
                 continue
 
-            # If this move is not distructed by wall (= pawn can move),
-            if self._is_movable_from_move(self.pawn_self.position, next_position):
-                # If there is other pawn on the next position
-                if np.all(self.pawn_other_position == next_position):
-                    # Repeat The same action => 2 * move
-                    jumped_position = next_position + move
-                    if not self._is_out_board(jumped_position) and self._is_movable_from_move(next_position, jumped_position):
-                        movables[i + 4] = 1
-                        continue
-
-                    else:
-                        for j, jump in enumerate(self.moves):
-                            # jump == move => Checked avobe, == -move => Return to before position.
-                            if np.all(jump == move) or np.all(jump == -move):
-                                continue
-                            jumped_position = next_position + jump
-                            # This jump is valid
-                            if not self._is_out_board(jumped_position) and self._is_movable_from_move(next_position, jumped_position):
-                                movables[j + 4] = 1
-                # This move is valid. You dont have to jump.
-                else:
-                    movables[i] = 1
+            # Repeat The same action => 2 * move
+            if NEIGHBOURS[next_idx][i] >= 0 and gaps[GUARDS[next_idx][i]]:
+                movables[i + 4] = 1
+                continue
+            for j in SIDES[i]:
+                if NEIGHBOURS[next_idx][j] >= 0 and gaps[GUARDS[next_idx][j]]:
+                    movables[j + 4] = 1
 
         return movables
 
@@ -702,48 +684,29 @@ class Board:
         '''
         # Whether you can have more than a bloc
         if self.walls_self <= 0:
-            blockable = [0 for _ in range(2 * (LENGTH - 1) * (LENGTH - 1))]
+            blockable = [0 for _ in range((LENGTH - 1) * (LENGTH - 1) * 2)]
             return blockable
 
-        # Where are blocks already build
-        vertical, horizontal = [1 for _ in range((LENGTH - 1) ** 2)], [1 for _ in range((LENGTH - 1) ** 2)]
+        # Only walls cutting one of these paths can make goal unreachable.
+        path_s = self._shortest_path(self.pawn_self.position, LENGTH - 1)
+        path_o = self._shortest_path(self.pawn_other_position, 0)
+        cut = (
+            None if path_s is None else set(path_s),
+            None if path_o is None else set(path_o),
+        )
+
+        vertical, horizontal = [0 for _ in range((LENGTH - 1) ** 2)], [0 for _ in range((LENGTH - 1) ** 2)]
         for v in range(LENGTH - 1):
             for h in range(LENGTH - 1):
                 # If this point hasnt been built wall
                 if self._is_blockable_vertical(v, h):
-                    self.wall_vertical.open_vertical[v, h] = 0
-                    self.wall_vertical.open_vertical[v + 1, h] = 0
-                    self.wall.vertical[v, h] = 0
-                    uf = self._build_union_find()
-                    res_s = self._union_find_goalable(uf, True)
-                    res_o = self._union_find_goalable(uf, False)
-
-                    if not res_s or not res_o:
-                        vertical[v * (LENGTH - 1) + h] = 0
-
-                    self.wall_vertical.open_vertical[v, h] = 1
-                    self.wall_vertical.open_vertical[v + 1, h] = 1
-                    self.wall.vertical[v, h] = 1
-                else:
-                    vertical[v * (LENGTH - 1) + h] = 0
+                    edges = (('v', v, h), ('v', v + 1, h))
+                    vertical[v * (LENGTH - 1) + h] = self._is_goalable_with(edges, cut)
 
                 # If this point hasnt been built wall
                 if self._is_blockable_horizontal(v, h):
-                    self.wall_horizontal.open_horizontal[v, h] = 0
-                    self.wall_horizontal.open_horizontal[v, h + 1] = 0
-                    self.wall.horizontal[v, h] = 0
-                    uf = self._build_union_find()
-                    res_s = self._union_find_goalable(uf, True)
-                    res_o = self._union_find_goalable(uf, False)
-
-                    if not res_s or not res_o:
-                        horizontal[v * (LENGTH - 1) + h] = 0
-
-                    self.wall_horizontal.open_horizontal[v, h] = 1
-                    self.wall_horizontal.open_horizontal[v, h + 1] = 1
-                    self.wall.horizontal[v, h] = 1
-                else:
-                    horizontal[v * (LENGTH - 1) + h] = 0
+                    edges = (('h', v, h), ('h', v, h + 1))
+                    horizontal[v * (LENGTH - 1) + h] = self._is_goalable_with(edges, cut)
 
         return vertical + horizontal
 
@@ -771,28 +734,6 @@ class Board:
 
         return actions
 
-    def move(self, action):
-        '''
-
-        Parameters
-        ----------
-        action : int
-            Action index defined in takable_actions.
-            [forward, left, backward, right, jump_forward, jump_left, jump_backward, jump_right]
-
-        Returns
-        -------
-        None
-
-        '''
-        # Just Move to the next
-        if action < 4:
-            self.pawn_self.position += self.moves[action]
-
-        # Move next to other pawn
-        elif 4 <= action < 8:
-            self.pawn_self.position = self.pawn_other_position + self.moves[action - 4]
-
     def block(self, action):
         '''
 
@@ -835,36 +776,61 @@ class Board:
         Returns
         -------
         Board : Board Class
-            Board Class after took arg's action.
+            Board Class after took arg's action. This board isn't changed.
+            Arrays which the action doesn't change are shared as rotated views.
 
         '''
-        # Move Pawn
-        if action < 8:
-            self.move(action)
+        key = self._next_key(action)
+        position = self.pawn_self.position
+        walls_self = self.walls_self
+        open_vertical = self.wall_vertical.open_vertical
+        open_horizontal = self.wall_horizontal.open_horizontal
+        wall_vertical = self.wall.vertical
+        wall_horizontal = self.wall.horizontal
 
-        # Build Wall
-        elif action < 2 * (LENGTH - 1) * (LENGTH - 1) + 8:
-            self.block(action)
+        # Just Move to the next
+        if action < 4:
+            position = position + self.moves[action]
 
-        open_vertical = np.rot90(self.wall_vertical.open_vertical, 2)
-        open_horizontal = np.rot90(self.wall_horizontal.open_horizontal, 2)
-        wall_vertical = np.rot90(self.wall.vertical, 2)
-        wall_horizontal = np.rot90(self.wall.horizontal, 2)
+        # Move next to other pawn
+        elif action < 8:
+            position = self.pawn_other_position + self.moves[action - 4]
+
+        # Build Wall Vertically
+        elif action < (LENGTH - 1) * (LENGTH - 1) + 8:
+            v, h = divmod(action - 8, LENGTH - 1)
+            open_vertical = open_vertical.copy()
+            wall_vertical = wall_vertical.copy()
+            open_vertical[v, h] = 0
+            open_vertical[v + 1, h] = 0
+            wall_vertical[v, h] = 0
+            walls_self -= 1
+
+        # Build Wall Horizontally
+        elif action < 2 * (LENGTH - 1) * (LENGTH - 1) + 8:
+            v, h = divmod(action - ((LENGTH - 1) * (LENGTH - 1) + 8), LENGTH - 1)
+            open_horizontal = open_horizontal.copy()
+            wall_horizontal = wall_horizontal.copy()
+            open_horizontal[v, h] = 0
+            open_horizontal[v, h + 1] = 0
+            wall_horizontal[v, h] = 0
+            walls_self -= 1
 
         new_board = Board(
             pawn_self = Pawn(position = self.pawn_other.position, ),
-            pawn_other = Pawn(position = self.pawn_self.position, ),
-            wall_vertical = WallVertical(vertical = open_vertical, ),
-            wall_horizontal = WallHorizontal(horizontal = open_horizontal, ),
-            wall = Wall(vertical = wall_vertical, horizontal = wall_horizontal),
+            pawn_other = Pawn(position = position, ),
+            wall_vertical = WallVertical(vertical = np.rot90(open_vertical, 2), ),
+            wall_horizontal = WallHorizontal(horizontal = np.rot90(open_horizontal, 2), ),
+            wall = Wall(vertical = np.rot90(wall_vertical, 2), horizontal = np.rot90(wall_horizontal, 2)),
             walls_self = self.walls_other,
-            walls_other = self.walls_self,
+            walls_other = walls_self,
             turn = self.turn + 1,
+            key = key,
         )
 
         return new_board
 
-    def reshape_input(self):
+    def _flip(self):
         '''
 
         Parameters
@@ -873,40 +839,144 @@ class Board:
 
         Returns
         -------
-        array : np.ndarray
-            Network Input like [self_pawan, other_pawan, wall_vertical, wall_horizontal].
-            Each array has (9, 9) shape. => (9, 9, 4) => reshape (1, 9, 9, 4) for batch training.
+        None
+            Change this board to other pawn's view in place.
+            Wall arrays are reversed as views, so they aren't copied.
 
         '''
-        add = np.zeros(LENGTH)
-        v = np.hstack((self.wall_vertical.open_vertical, add.reshape(LENGTH, 1)))
-        h = np.vstack((self.wall_horizontal.open_horizontal, add))
-        array = np.dstack([self.pawn_self.pawn, self.pawn_other.pawn, v, h])
+        self.pawn_self, self.pawn_other = self.pawn_other, self.pawn_self
+        self.pawn_other_position = CORNER - self.pawn_other.position
+        self.walls_self, self.walls_other = self.walls_other, self.walls_self
+        self.wall_vertical.open_vertical = self.wall_vertical.open_vertical[::-1, ::-1]
+        self.wall_horizontal.open_horizontal = self.wall_horizontal.open_horizontal[::-1, ::-1]
+        self.wall.vertical = self.wall.vertical[::-1, ::-1]
+        self.wall.horizontal = self.wall.horizontal[::-1, ::-1]
 
-        for _ in range(self.walls_self):
-            array = np.dstack([array, np.ones(shape=(LENGTH, LENGTH))])
-        for _ in range(WALLS - self.walls_self):
-            array = np.dstack([array, np.zeros(shape=(LENGTH, LENGTH))])
-        for _ in range(self.walls_other):
-            array = np.dstack([array, np.ones(shape=(LENGTH, LENGTH))])
-        for _ in range(WALLS - self.walls_other):
-            array = np.dstack([array, np.zeros(shape=(LENGTH, LENGTH))])
+    def push(self, action):
+        '''
 
-        array = array.reshape(1, LENGTH, LENGTH, 4 + WALLS * 2)
+        Parameters
+        ----------
+        action : int
+            Action index defined in takable_actions.
+
+        Returns
+        -------
+        None
+            Take arg's action in place. This board becomes the same as next_board(action).
+            Wall arrays are copied before built, because they can be shared with other boards.
+
+        '''
+        if self._records is None:
+            self._records = []
+        record = (action, self.pawn_self.position, self.key)
+        key = self._next_key(action)
+
+        # Just Move to the next
+        if action < 4:
+            self.pawn_self.place(self.pawn_self.position + self.moves[action])
+
+        # Move next to other pawn
+        elif action < 8:
+            self.pawn_self.place(self.pawn_other_position + self.moves[action - 4])
+
+        # Build Wall Vertically
+        elif action < (LENGTH - 1) * (LENGTH - 1) + 8:
+            record += (self.wall_vertical.open_vertical, self.wall.vertical)
+            self.wall_vertical.open_vertical = self.wall_vertical.open_vertical.copy()
+            self.wall.vertical = self.wall.vertical.copy()
+            self.block(action)
+
+        # Build Wall Horizontally
+        elif action < 2 * (LENGTH - 1) * (LENGTH - 1) + 8:
+            record += (self.wall_horizontal.open_horizontal, self.wall.horizontal)
+            self.wall_horizontal.open_horizontal = self.wall_horizontal.open_horizontal.copy()
+            self.wall.horizontal = self.wall.horizontal.copy()
+            self.block(action)
+
+        self._records.append(record)
+        self._flip()
+        self.turn += 1
+        self.key = key
+
+    def pop(self):
+        '''
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        action : int
+            Action taken by the last push. This board is reverted to the one before it.
+
+        '''
+        record = self._records.pop()
+        action, position, key = record[:3]
+        self._flip()
+        self.turn -= 1
+        self.key = key
+
+        if action < 8:
+            self.pawn_self.place(position)
+        elif action < (LENGTH - 1) * (LENGTH - 1) + 8:
+            self.wall_vertical.open_vertical = record[3]
+            self.wall.vertical = record[4]
+            self.walls_self += 1
+        elif action < 2 * (LENGTH - 1) * (LENGTH - 1) + 8:
+            self.wall_horizontal.open_horizontal = record[3]
+            self.wall.horizontal = record[4]
+            self.walls_self += 1
+
+        return action
+
+    def reshape_input(self, out=None):
+        '''
+
+        Parameters
+        ----------
+        out : np.ndarray
+            Buffer to write in. (9, 9, 24) or (1, 9, 9, 24) float32 array.
+            Every element is overwritten, so it doesn't need to be cleared.
+            New buffer is allocated when None.
+
+        Returns
+        -------
+        array : np.ndarray
+            Network Input like [self_pawan, other_pawan, wall_vertical, wall_horizontal, walls_self..., walls_other...].
+            Each array has (9, 9) shape. => (9, 9, 24) => reshape (1, 9, 9, 24) for batch training.
+            This is 'out' itself when it is given.
+
+        '''
+        array = np.empty(shape=(1, LENGTH, LENGTH, 4 + WALLS * 2), dtype=np.float32) if out is None else out
+
+        # Self pawn in self view, other pawn in other's own view.
+        array[..., :2] = 0
+        array[..., self.pawn_self.position[0], self.pawn_self.position[1], 0] = 1
+        array[..., self.pawn_other.position[0], self.pawn_other.position[1], 1] = 1
+        array[..., :LENGTH - 1, 2] = self.wall_vertical.open_vertical
+        array[..., LENGTH - 1, 2] = 0
+        array[..., :LENGTH - 1, :, 3] = self.wall_horizontal.open_horizontal
+        array[..., LENGTH - 1, :, 3] = 0
+        array[..., 4:4 + self.walls_self] = 1
+        array[..., 4 + self.walls_self:4 + WALLS] = 0
+        array[..., 4 + WALLS:4 + WALLS + self.walls_other] = 1
+        array[..., 4 + WALLS + self.walls_other:] = 0
 
         return array
-    
+
     def board_to_str(self):
         s = ''
         for v in range(LENGTH):
             for h in range(LENGTH - 1):
-                if self.pawn_self.pawn[v, h]:
+                if self.pawn_self.position[0] == v and self.pawn_self.position[1] == h:
                     s += ' 1 ' if self.is_first() else ' 2 '
                 else:
                     s += '   '
                 s += ' ' if self.wall_vertical.open_vertical[v, h] else '|'
 
-            if self.pawn_self.pawn[v, LENGTH - 1]:
+            if self.pawn_self.position[0] == v and self.pawn_self.position[1] == LENGTH - 1:
                     s += ' 1 ' if self.is_first() else ' 2 '
             else:
                 s += '   \n'
@@ -917,3 +987,29 @@ class Board:
             s += '   \n' if self.wall_horizontal.open_horizontal[v, LENGTH - 1] else '---\n'
 
         return s
+
+
+def reshape_inputs(boards, out=None):
+    '''
+
+    Parameters
+    ----------
+    boards : list
+        Boards which have reshape_input method (Board, BitBoard).
+    out : np.ndarray
+        Buffer to write in. (N, 9, 9, 24) float32 array whose N >= len(boards).
+        New buffer is allocated when None.
+
+    Returns
+    -------
+    array : np.ndarray
+        (len(boards), 9, 9, 24) network inputs. A view of 'out' when it is given.
+
+    '''
+    if out is None:
+        out = np.empty(shape=(len(boards), LENGTH, LENGTH, 4 + WALLS * 2), dtype=np.float32)
+    array = out[:len(boards)]
+    for i, board in enumerate(boards):
+        board.reshape_input(array[i])
+
+    return array
@@ -0,0 +1,569 @@
+'''
+TCP broker for self matches played on other hosts.
+
+The broker serves networks/best_network.h5 with a version number which goes up when the file changes,
+stores compressed game records pushed by workers under records/<cycle>/,
+and hands finished cycles to a trainer which may be on another host.
+Messages are framed as (command, json header, payload) over plain TCP.
+Every request can be sent again after reconnecting: pushes carry an id and duplicates are dropped.
+
+    python broker.py serve [port]
+    python broker.py work host [port]
+'''
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import struct
+import socket
+import threading
+import socketserver
+from collections import OrderedDict
+from game_record import GameRecord, RECORDS, record_path
+import config
+
+
+# command, header length, payload length.
+FRAME = struct.Struct('!4sII')
+BROKER_NETWORK = 'broker_network.h5'
+
+
+def _recv_exact(sock, size):
+    '''
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+    size : int
+        Bytes to read.
+
+    Returns
+    -------
+    data : bytearray
+        Exactly size bytes.
+
+    '''
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        n = sock.recv_into(view)
+        if n == 0:
+            raise ConnectionError('Connection closed by the peer.')
+        view = view[n:]
+
+    return data
+
+
+def send_message(sock, command, header=None, payload=b''):
+    '''
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+    command : bytes
+        4 bytes command.
+    header : dict
+        JSON serializable header.
+    payload : bytes
+        Payload.
+
+    Returns
+    -------
+    None.
+
+    '''
+    meta = json.dumps(header or {}).encode()
+    # One write per message, or Nagle's algorithm holds the payload until the peer's delayed ACK.
+    sock.sendall(b''.join((FRAME.pack(command, len(meta), len(payload)), meta, payload)))
+
+
+def recv_message(sock):
+    '''
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected socket.
+
+    Returns
+    -------
+    command : bytes
+        4 bytes command.
+    header : dict
+        Header.
+    payload : bytes
+        Payload.
+
+    '''
+    command, meta, size = FRAME.unpack(_recv_exact(sock, FRAME.size))
+    header = json.loads(bytes(_recv_exact(sock, meta)))
+
+    return command, header, bytes(_recv_exact(sock, size))
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = self.server.broker.handle(*request)
+            except Exception as e:
+                response = (b'FAIL', {'error': repr(e)}, b'')
+            send_message(self.request, *response)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class Broker:
+    '''
+
+    Attributes
+    ----------
+    per_cycle : int
+        Games in one cycle.
+    cycle : int
+        Cycle pushed games are stored in.
+    games : int
+        Games stored in the cycle.
+    version : int
+        Version of best_network.h5. Goes up when the file changes.
+    seen : OrderedDict
+        Ids of the latest pushed records, to drop ones sent again after reconnecting.
+    pushed : int
+        Records stored since start.
+    received : int
+        Payload bytes of stored records since start.
+    server : socketserver.ThreadingTCPServer
+        TCP server. None until start.
+
+    '''
+    def __init__(self, per_cycle=None):
+        '''
+
+        Paramators
+        ----------
+        per_cycle : int
+            Games in one cycle. config.SELFMATCH when None.
+
+        '''
+        self.per_cycle = config.SELFMATCH if per_cycle is None else per_cycle
+        # Continue the last cycle on disk, as train.py does.
+        cycles = sorted(int(os.path.basename(c)) for c in glob.glob(os.path.join(RECORDS, '[0-9]*')))
+        self.cycle = cycles[-1] if cycles else 0
+        self.games = len(glob.glob(os.path.join(RECORDS, str(self.cycle), '*.npz')))
+        if self.games >= self.per_cycle:
+            self.cycle, self.games = self.cycle + 1, 0
+        self.version = 0
+        self._stamp = None
+        self._network = b''
+        self.seen = OrderedDict()
+        self.pushed = 0
+        self.received = 0
+        self.server = None
+        self._lock = threading.Lock()
+
+    def _current_network(self):
+        '''
+
+        Returns
+        -------
+        version : int
+            Version of best_network.h5.
+        network : bytes
+            Contents of best_network.h5. Read again only when the file has changed.
+
+        '''
+        path = os.path.join('networks', 'best_network.h5')
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        if stamp != self._stamp:
+            with open(path, 'rb') as f:
+                self._network = f.read()
+            self._stamp = stamp
+            self.version += 1
+
+        return self.version, self._network
+
+    def _store(self, header, payload):
+        '''
+
+        Parameters
+        ----------
+        header : dict
+            {'id': record id, 'version': network version the game was played with}.
+        payload : bytes
+            GameRecord.dumps bytes.
+
+        Returns
+        -------
+        ack : dict
+            Cycle and game index the record is stored as.
+
+        '''
+        if header['id'] in self.seen:
+            return dict(self.seen[header['id']], duplicate=True)
+
+        path = record_path(self.cycle, self.games)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+        ack = {'cycle': self.cycle, 'game': self.games}
+        self.seen[header['id']] = ack
+        if len(self.seen) > 4 * self.per_cycle:
+            self.seen.popitem(last=False)
+        self.pushed += 1
+        self.received += len(payload)
+        self.games += 1
+        if self.games == self.per_cycle:
+            self.cycle, self.games = self.cycle + 1, 0
+
+        return ack
+
+    def handle(self, command, header, payload):
+        '''
+
+        Parameters
+        ----------
+        command : bytes
+            VERS, NETW, PUSH or PULL.
+        header : dict
+            Request header.
+        payload : bytes
+            Request payload.
+
+        Returns
+        -------
+        response : tuple
+            (command, header, payload) sent back.
+
+        '''
+        if command == b'PUSH':
+            # Broken payloads are refused before they reach training. Checked out of the lock.
+            GameRecord.loads(payload)
+
+        with self._lock:
+            if command == b'VERS':
+                version, _ = self._current_network()
+                return b'VERS', {'version': version}, b''
+
+            if command == b'NETW':
+                version, network = self._current_network()
+                return b'NETW', {'version': version}, network
+
+            if command == b'PUSH':
+                return b'OKAY', self._store(header, payload), b''
+
+            if command == b'PULL':
+                cycle = header['cycle']
+                if cycle >= self.cycle:
+                    return b'WAIT', {'cycle': self.cycle, 'games': self.games}, b''
+                records = []
+                for game in range(self.per_cycle):
+                    with open(record_path(cycle, game), 'rb') as f:
+                        records.append(f.read())
+                return b'RECS', {'sizes': [len(r) for r in records]}, b''.join(records)
+
+        raise ValueError('Unknown command {}.'.format(command))
+
+    def start(self, host=None, port=None):
+        '''
+
+        Parameters
+        ----------
+        host : str
+            Address to listen on. '' (all) when None.
+        port : int
+            Port to listen on. config.BROKER_PORT when None.
+
+        Returns
+        -------
+        thread : threading.Thread
+            Thread serving requests.
+
+        '''
+        self.server = _Server(('' if host is None else host, config.BROKER_PORT if port is None else port), _Handler)
+        self.server.broker = self
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+
+        return thread
+
+    def stop(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Stop serving and close the listening socket.
+
+        '''
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BrokerClient:
+    '''
+
+    Attributes
+    ----------
+    address : tuple
+        (host, port) of the broker.
+    retry : float
+        Max seconds between reconnection attempts.
+    sock : socket.socket
+        Connection. None while disconnected.
+
+    '''
+    def __init__(self, host=None, port=None, retry=None):
+        '''
+
+        Paramators
+        ----------
+        host : str
+            Broker's host. config.BROKER_HOST when None.
+        port : int
+            Broker's port. config.BROKER_PORT when None.
+        retry : float
+            Max seconds between reconnection attempts. config.BROKER_RETRY when None.
+
+        '''
+        self.address = (
+            config.BROKER_HOST if host is None else host,
+            config.BROKER_PORT if port is None else int(port),
+        )
+        self.retry = config.BROKER_RETRY if retry is None else retry
+        self.sock = None
+
+    def _request(self, command, header=None, payload=b''):
+        '''
+
+        Parameters
+        ----------
+        command : bytes
+            4 bytes command.
+        header : dict
+            Request header.
+        payload : bytes
+            Request payload.
+
+        Returns
+        -------
+        response : tuple
+            (command, header, payload) from the broker.
+            The request is sent again on a new connection until it is answered.
+
+        '''
+        wait = .1
+        while True:
+            try:
+                if self.sock is None:
+                    self.sock = socket.create_connection(self.address, timeout=60)
+                    self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                send_message(self.sock, command, header, payload)
+                response = recv_message(self.sock)
+                break
+            except OSError as e:
+                self.close()
+                print('Broker {}:{} unreachable ({}). Retry in {:.1f}s.'.format(*self.address, e, wait))
+                time.sleep(wait)
+                wait = min(wait * 2, self.retry)
+
+        if response[0] == b'FAIL':
+            raise RuntimeError('Broker failed: {}'.format(response[1]['error']))
+
+        return response
+
+    def version(self):
+        '''
+
+        Returns
+        -------
+        version : int
+            Version of the broker's best network.
+
+        '''
+        return self._request(b'VERS')[1]['version']
+
+    def network(self, filename=BROKER_NETWORK):
+        '''
+
+        Parameters
+        ----------
+        filename : str
+            File name in networks/ the network is saved as.
+
+        Returns
+        -------
+        version : int
+            Version of the saved network.
+
+        '''
+        _, header, payload = self._request(b'NETW')
+        os.makedirs('networks', exist_ok=True)
+        path = os.path.join('networks', filename)
+        # Workers on one host may share networks/, so the file is replaced at once.
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+        return header['version']
+
+    def push(self, record, version):
+        '''
+
+        Parameters
+        ----------
+        record : GameRecord
+            Finished self match.
+        version : int
+            Version of the network the match was played with.
+
+        Returns
+        -------
+        ack : dict
+            Cycle and game index the broker stored the record as.
+
+        '''
+        header = {'id': uuid.uuid4().hex, 'version': version}
+
+        return self._request(b'PUSH', header, record.dumps())[1]
+
+    def pull(self, cycle, wait=1.):
+        '''
+
+        Parameters
+        ----------
+        cycle : int
+            Cycle to fetch.
+        wait : float
+            Seconds between polls while the cycle isn't finished.
+
+        Returns
+        -------
+        records : list
+            GameRecord.dumps bytes of every game in the cycle.
+
+        '''
+        while True:
+            command, header, payload = self._request(b'PULL', {'cycle': cycle})
+            if command == b'RECS':
+                break
+            time.sleep(wait)
+
+        records, start = [], 0
+        for size in header['sizes']:
+            records.append(payload[start:start + size])
+            start += size
+
+        return records
+
+    def close(self):
+        '''
+
+        Returns
+        -------
+        None.
+
+        '''
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+
+def work(host=None, port=None, games=None):
+    '''
+
+    Parameters
+    ----------
+    host : str
+        Broker's host.
+    port : int
+        Broker's port.
+    games : int
+        Games to play. Forever when None.
+
+    Returns
+    -------
+    None.
+        Play self matches with the broker's network and push their records.
+        The network is downloaded again only when its version changes.
+
+    '''
+    from networks import Network
+    from montecarlo import MCTS
+    import async_match
+
+    client = BrokerClient(host, port)
+    algo = MCTS()
+    net, version = None, None
+    played = 0
+    while games is None or played < games:
+        latest = client.version()
+        if latest != version:
+            version = client.network()
+            if net is None:
+                net = Network(load=True, load_file=BROKER_NETWORK)
+            else:
+                net.load_network(filename=BROKER_NETWORK)
+
+        record = async_match.play_selfmatch(net, algo)
+        ack = client.push(record, version)
+        played += 1
+        print('Pushed game {cycle}-{game}'.format(**ack))
+    client.close()
+
+
+def pull(client, cycle):
+    '''
+
+    Parameters
+    ----------
+    client : BrokerClient
+        Client of the broker.
+    cycle : int
+        Cycle to fetch.
+
+    Returns
+    -------
+    positions : int
+        Positions appended to the local replay buffer.
+        Waits until the broker has the whole cycle, and saves its records under records/ first.
+
+    '''
+    from replay_buffer import ReplayBuffer
+
+    for game, data in enumerate(client.pull(cycle)):
+        path = record_path(cycle, game)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    return ReplayBuffer().ingest(cycle)
+
+
+if __name__ == '__main__':
+    mode, args = sys.argv[1], sys.argv[2:]
+
+    if mode == 'serve':
+        broker = Broker()
+        broker.start(port=int(args[0]) if args else None).join()
+    else:
+        work(*args)
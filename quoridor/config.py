@@ -6,24 +6,76 @@ WALLS = 10
 BREAK = 96
 INPUT_SHAPE = (LENGTH, LENGTH, 4 + WALLS * 2)
 OUTPUT_SHAPE = 8 + 2 * (LENGTH - 1) * (LENGTH - 1)
+# Use bitboard.BitBoard instead of board.Board for matches.
+BITBOARD = False
 # Train epoch for one cycle.
 EPOCHS = 200 # Training epoch number
 BATCH_SIZE = 256
+# Number of the latest cycles the replay buffer trains on.
+REPLAY_WINDOW = 5
+# Feed Network.train from dataset.make_dataset (tf.data) instead of ReplayBuffer.batches.
+TF_DATA = True
+# Positions held in the tf.data shuffle buffer.
+SHUFFLE_BUFFER = 20000
+# Mirror half of the training positions left and right.
+AUGMENT = False
 FILTER = 256
 KERNEL = 3
 STRIDE = 1
 INITIALIZER = 'he_normal'
 REGULARIZER = 0.0005
 RES_NUM = 19
+# Batch sizes Network.predict pads inputs to, in ascending order. Any batch size with one trace when empty.
+PREDICT_BUCKETS = ()
 # simulation times per one prediction.
 SIMULATIONS = 300 #1600
+# Leaves evaluated by the network at once in MCTS. 1 evaluates leaves one by one.
+EVAL_BATCH = 8
+# Virtual loss added to nodes on the paths waiting for evaluation.
+VIRTUAL_LOSS = 1
+# Use search_tree.SearchTree (numpy arrays) instead of mcts_node.Node objects in MCTS.
+ARRAY_TREE = False
+# Share nodes of the same position and turn in mcts_node.Node trees (transposition table).
+TRANSPOSITION = False
+# Max positions kept in the transposition table. Least recently used ones are evicted.
+TRANSPOSITION_SIZE = 200000
 GAMMA = 1.0
 # self match times.
 SELFMATCH = 200 # 25000
 CYCLES = 200
+# Play self matches, train and evaluate at the same time (orchestrator.Orchestrator) in train.py.
+ASYNC_PIPELINE = False
+# Train epochs between checkpoints saved by the orchestrator's trainer.
+CHECKPOINT_EPOCHS = 10
 PARALLEL_MATCH = 10
-# Evaluation times per one evaluation
-EVAL_MATCH = 10 # 400
+# Self matches one process plays at once on a vector_board.VectorBoard. 0 plays them one by one.
+VECTOR_GAMES = 0
+# Self-play workers share one network in inference_server instead of loading their own.
+INFERENCE_SERVER = False
+# Max boards the inference server predicts at once.
+INFERENCE_MAX_BATCH = 64
+# Max seconds a request waits in the inference server for a bigger batch.
+INFERENCE_MAX_WAIT = 0.002
+# Max seconds a self-play worker waits for the inference server before raising an error.
+INFERENCE_TIMEOUT = 60
+# Address of broker.Broker which self matches on other hosts connect to.
+BROKER_HOST = '127.0.0.1'
+BROKER_PORT = 50007
+# Max seconds a broker client waits between reconnection attempts.
+BROKER_RETRY = 10
+# Max evaluation times per one evaluation. SPRT stops earlier when it decides.
+EVAL_MATCH = 16 # 400
+# Expected point of a new network against the best one under H0 (not better) and H1 (better) of SPRT.
+SPRT_P0 = 0.5
+SPRT_P1 = 0.8
+# Probability SPRT promotes a network under H0, and rejects one under H1.
+# With these settings SPRT rejects after 2 straight losses and promotes after 5 straight wins.
+# An evaluation takes 6.7 matches on average for an equally strong network, and at most 9.2 for any network.
+SPRT_ALPHA = 0.1
+SPRT_BETA = 0.2
+# Average point needed for promotion when EVAL_MATCH runs out before SPRT decides.
+# An equally strong network is promoted in 11% of evaluations, a network scoring 0.8 in 86%.
+EVAL_THRESHOLD = 0.65
 C_PUT = 1.0
 ALPHA = 0.35
 EPS = 0.25
@@ -0,0 +1,149 @@
+'''
+tf.data input pipeline for Network.train.
+
+Shards of the replay buffer are read as fixed length records in parallel, shuffled with a bounded buffer,
+batched, decoded (uint8 => float32, optional mirror augmentation) and prefetched,
+so that reading and decoding run in TensorFlow threads and overlap training steps.
+'''
+import numpy as np
+import tensorflow as tf
+from board import MOVES, LEFT, RIGHT
+from config import LENGTH
+from replay_buffer import SAMPLE
+import config
+
+
+def _mirror_actions():
+    '''
+
+    Returns
+    -------
+    mirror : np.ndarray
+        mirror[a] is the action a becomes when the board is mirrored left and right.
+
+    '''
+    mirror = np.arange(config.OUTPUT_SHAPE)
+    left = [i for i, m in enumerate(MOVES) if np.array_equal(m, LEFT)][0]
+    right = [i for i, m in enumerate(MOVES) if np.array_equal(m, RIGHT)][0]
+    for offset in (0, len(MOVES)):
+        mirror[offset + left], mirror[offset + right] = offset + right, offset + left
+
+    slots = (LENGTH - 1) * (LENGTH - 1)
+    v, h = np.divmod(np.arange(slots), LENGTH - 1)
+    for offset in (8, 8 + slots):
+        mirror[offset:offset + slots] = offset + v * (LENGTH - 1) + (LENGTH - 2 - h)
+
+    return mirror
+
+
+MIRROR = _mirror_actions()
+
+
+def mirror(inputs, policies):
+    '''
+
+    Parameters
+    ----------
+    inputs : tf.Tensor
+        Boards. (N, 9, 9, 24) float32
+    policies : tf.Tensor
+        Policies. (N, OUTPUT_SHAPE)
+
+    Returns
+    -------
+    inputs : tf.Tensor
+        Boards mirrored left and right.
+    policies : tf.Tensor
+        Policies of the mirrored boards.
+
+    '''
+    flipped = tf.reverse(inputs, axis=[2])
+    # Plane 2 has edges between columns in its first LENGTH - 1 columns, the last one is 0.
+    edges = tf.concat([tf.reverse(inputs[:, :, :LENGTH - 1, 2:3], axis=[2]), inputs[:, :, LENGTH - 1:, 2:3]], axis=2)
+    inputs = tf.concat([flipped[..., :2], edges, flipped[..., 3:]], axis=-1)
+
+    return inputs, tf.gather(policies, MIRROR, axis=1)
+
+
+def _decode(records, augment):
+    '''
+
+    Parameters
+    ----------
+    records : tf.Tensor
+        Raw SAMPLE records. (N,) string
+    augment : bool
+        Mirror half of the positions randomly.
+
+    Returns
+    -------
+    inputs : tf.Tensor
+        Boards. (N, 9, 9, 24) float32
+    outputs : tuple
+        (policies, values) of the boards.
+
+    '''
+    raw = tf.io.decode_raw(records, tf.uint8)
+    fields = {}
+    for name in SAMPLE.names:
+        dtype, offset = SAMPLE.fields[name]
+        field = raw[:, offset:offset + dtype.itemsize]
+        if dtype.base == np.float32:
+            # Shards are little endian as numpy writes them on every supported platform.
+            field = tf.bitcast(tf.reshape(field, (-1, dtype.itemsize // 4, 4)), tf.float32)
+        fields[name] = tf.reshape(field, (-1, ) + dtype.shape)
+
+    inputs = tf.cast(fields['input'], tf.float32)
+    policies = fields['policy']
+    if augment:
+        mirrored, mirrored_policies = mirror(inputs, policies)
+        flip = tf.random.uniform((tf.shape(inputs)[0], )) < 0.5
+        inputs = tf.where(flip[:, None, None, None], mirrored, inputs)
+        policies = tf.where(flip[:, None], mirrored_policies, policies)
+
+    return inputs, (policies, fields['value'])
+
+
+def make_dataset(buffer, batch=None, augment=None, shuffle=None):
+    '''
+
+    Parameters
+    ----------
+    buffer : ReplayBuffer
+        Replay buffer whose shards in the window are read.
+    batch : int
+        Minibatch size. config.BATCH_SIZE when None.
+    augment : bool
+        Mirror half of the positions randomly. config.AUGMENT when None.
+    shuffle : int
+        Size of the shuffle buffer. config.SHUFFLE_BUFFER when None.
+
+    Returns
+    -------
+    dataset : tf.data.Dataset
+        Endless (input, (policy, value)) minibatches for model.fit.
+        Shards are the ones in the window when called.
+        ValueError is raised when the window has no positions.
+
+    '''
+    batch = config.BATCH_SIZE if batch is None else batch
+    augment = config.AUGMENT if augment is None else augment
+    shuffle = config.SHUFFLE_BUFFER if shuffle is None else shuffle
+    buffer.refresh()
+    if not len(buffer):
+        raise ValueError('Replay buffer has no positions in its window. Ingest self matches before training.')
+    paths = [buffer._shard_path(c) for c in buffer.shards]
+    # Shards are .npy files of fixed size records, so they are read without Python after the header.
+    headers = np.array([shard.offset for shard in buffer.shards.values()], dtype=np.int64)
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, headers)).repeat().shuffle(max(1, len(paths)))
+    dataset = dataset.interleave(
+        lambda path, header: tf.data.FixedLengthRecordDataset(path, SAMPLE.itemsize, header_bytes=header),
+        cycle_length=max(1, len(paths)),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=False,
+    )
+    dataset = dataset.shuffle(shuffle).batch(batch, drop_remainder=True)
+    dataset = dataset.map(lambda records: _decode(records, augment), num_parallel_calls=tf.data.AUTOTUNE)
+
+    return dataset.prefetch(tf.data.AUTOTUNE)
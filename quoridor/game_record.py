@@ -0,0 +1,231 @@
+'''
+Compact self match records.
+
+A match is saved as its actions, sparse (action, visits) pairs of every move and its value,
+instead of network inputs and dense policies of every position.
+Training tensors are rebuilt on demand by replaying the actions.
+'''
+import os
+import io
+import numpy as np
+from bitboard import BitBoard
+from recorder import GameRecorder
+import config
+
+
+RECORDS = 'records'
+
+
+class GameRecord:
+    '''
+
+    Attributes
+    ----------
+    actions : list
+        Actions taken in the match.
+    moves : list
+        (actions, visits) numpy arrays of every move. Only actions visited at least once.
+    value : float
+        Value of the match for the first player.
+
+    '''
+    def __init__(self):
+        '''
+
+        Paramators
+        ----------
+        None.
+
+        '''
+        self.actions = []
+        self.moves = []
+        self.value = 0
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add(self, takables, visits, action):
+        '''
+
+        Parameters
+        ----------
+        takables : list
+            Takable actions of the board.
+        visits : list, numpy.ndarray
+            Simulated times of root's children, in order of takables.
+        action : int
+            Action taken.
+
+        Returns
+        -------
+        None.
+
+        '''
+        visits = np.rint(np.asarray(visits, dtype=np.float64))
+        visited = np.flatnonzero(visits > 0)
+        self.moves.append((
+            np.asarray(takables, dtype=np.uint8)[visited],
+            np.minimum(visits[visited], np.iinfo(np.uint16).max).astype(np.uint16),
+        ))
+        self.actions.append(action)
+
+    def finish(self, value):
+        '''
+
+        Parameters
+        ----------
+        value : int, float
+            Value of the match for the first player.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.value = value
+
+    def _arrays(self):
+        '''
+
+        Returns
+        -------
+        arrays : dict
+            Name => numpy array saved in .npz.
+
+        '''
+        return dict(
+            actions=np.asarray(self.actions, dtype=np.uint8),
+            counts=np.array([len(a) for a, _ in self.moves], dtype=np.uint16),
+            sparse_actions=np.concatenate([a for a, _ in self.moves] or [np.zeros(0, np.uint8)]),
+            sparse_visits=np.concatenate([v for _, v in self.moves] or [np.zeros(0, np.uint16)]),
+            value=np.float32(self.value),
+        )
+
+    def save(self, path):
+        '''
+
+        Parameters
+        ----------
+        path : str
+            File path (.npz).
+
+        Returns
+        -------
+        None.
+
+        '''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, **self._arrays())
+
+    def dumps(self):
+        '''
+
+        Returns
+        -------
+        data : bytes
+            Compressed .npz bytes, which load reads from io.BytesIO too.
+
+        '''
+        f = io.BytesIO()
+        np.savez_compressed(f, **self._arrays())
+
+        return f.getvalue()
+
+    @classmethod
+    def load(cls, path):
+        '''
+
+        Parameters
+        ----------
+        path : str, file
+            File path saved by save, or a file object.
+
+        Returns
+        -------
+        record : GameRecord
+            Loaded record.
+
+        '''
+        record = cls()
+        with np.load(path) as f:
+            record.actions = f['actions'].tolist()
+            ends = np.cumsum(f['counts'])
+            record.moves = list(zip(
+                np.split(f['sparse_actions'], ends[:-1]),
+                np.split(f['sparse_visits'], ends[:-1]),
+            ))
+            record.value = float(f['value'])
+
+        return record
+
+    @classmethod
+    def loads(cls, data):
+        '''
+
+        Parameters
+        ----------
+        data : bytes
+            Bytes made by dumps.
+
+        Returns
+        -------
+        record : GameRecord
+            Loaded record.
+
+        '''
+        return cls.load(io.BytesIO(data))
+
+    def decode(self, recorder=None, gamma=None):
+        '''
+
+        Parameters
+        ----------
+        recorder : GameRecorder
+            Recorder positions are appended to. New one is used when None.
+        gamma : int, float
+            Constance used on Bolzman distribution for policies. config.GAMMA when None.
+
+        Returns
+        -------
+        hist_input : np.ndarray
+            Match's board history. A view of recorder's buffer.
+        hist_policy : np.ndarray
+            Match's policy history. A view of recorder's buffer.
+        hist_value : np.ndarray
+            Match's value history. A view of recorder's buffer.
+
+        '''
+        recorder = GameRecorder() if recorder is None else recorder
+        gamma = config.GAMMA if gamma is None else gamma
+        board = BitBoard()
+
+        for action, (actions, visits) in zip(self.actions, self.moves):
+            if gamma == 0:
+                probs = np.zeros(len(visits))
+                probs[np.argmax(visits)] = 1
+            else:
+                probs = np.power(visits.astype(np.float64), 1 / gamma)
+                probs /= probs.sum()
+            recorder.add(board, actions, probs)
+            board = board.next_board(action)
+
+        return recorder.finish(self.value)
+
+
+def record_path(epoch, process):
+    '''
+
+    Parameters
+    ----------
+    epoch : int, str
+        Train epoch.
+    process : int, str
+        Match index in the epoch.
+
+    Returns
+    -------
+    path : str
+        Path of the match's record.
+
+    '''
+    return os.path.join(RECORDS, str(epoch), '{}.npz'.format(process))
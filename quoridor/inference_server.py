@@ -0,0 +1,489 @@
+'''
+Inference server for self-play worker processes.
+
+One server process owns the only network model.
+Each worker has a ring buffer in shared memory, writes encoded boards into it
+and waits until the server writes policies and values back.
+The server batches requests of all workers dynamically:
+a batch is predicted when it reaches max_batch, when every worker is waiting,
+or when the oldest request has waited max_wait seconds.
+The server runs in a spawned process, so it never inherits TensorFlow state from its parent,
+and reloads best_network.h5 when the file changes, so it can live as long as the worker pool.
+'''
+import os
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+import config
+
+
+class RingBuffer:
+    '''
+    Single producer (worker) single consumer (server) ring in shared memory.
+    Slot of a request is its sequence number % slots.
+    Counters are written under lock after the slots they count and read under lock before them,
+    so neither side sees a counter before the data behind it.
+    A ring is passed to worker and server processes when they are started,
+    and attaches to the same shared memory and synchronisation objects there.
+
+    Attributes
+    ----------
+    shm : multiprocessing.shared_memory.SharedMemory
+        Shared memory block.
+    slots : int
+        Number of requests the ring holds.
+    lock : multiprocessing.Lock
+        Guards counters.
+    ready : multiprocessing.Semaphore
+        Released by the server after it has served requests of this ring.
+    requested : multiprocessing.Semaphore
+        Released by the worker after it has written requests. Shared by every ring of a server.
+    down : multiprocessing.Event
+        Set when the server has stopped. Shared by every ring of a server.
+        Semaphores are used to wake the other side because their release never blocks,
+        while Event.set can wait forever for a waiter which has died.
+    counters : np.ndarray
+        [written, served]. Sequence numbers the worker has written and the server has served.
+    inputs : np.ndarray
+        Encoded boards. (slots, 9, 9, 24)
+    policies : np.ndarray
+        Policies written by the server. (slots, OUTPUT_SHAPE)
+    values : np.ndarray
+        Values written by the server. (slots,)
+
+    '''
+    def __init__(self, requested, down, slots=None, attach=None):
+        '''
+
+        Paramators
+        ----------
+        requested : multiprocessing.Semaphore
+            Semaphore the worker releases after writing requests.
+        down : multiprocessing.Event
+            Event set when the server has stopped.
+        slots : int
+            Number of requests the ring holds. config.EVAL_BATCH when None.
+        attach : tuple
+            (shared memory name, lock, ready) of the ring to attach. A new ring is created when None.
+
+        '''
+        self.slots = config.EVAL_BATCH if slots is None else slots
+        self.requested = requested
+        self.down = down
+        shapes = (
+            ((2, ), np.int64),
+            ((self.slots, ) + config.INPUT_SHAPE, np.float32),
+            ((self.slots, config.OUTPUT_SHAPE), np.float32),
+            ((self.slots, ), np.float32),
+        )
+        size = sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in shapes)
+        if attach is None:
+            context = multiprocessing.get_context('spawn')
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.lock = context.Lock()
+            self.ready = context.Semaphore(0)
+        else:
+            name, self.lock, self.ready = attach
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        arrays, offset = [], 0
+        for shape, dtype in shapes:
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+            offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.counters, self.inputs, self.policies, self.values = arrays
+        if attach is None:
+            self.counters[:] = 0
+
+    def __reduce__(self):
+        # Attach to the same block in the child process instead of copying arrays.
+        return RingBuffer, (self.requested, self.down, self.slots, (self.name, self.lock, self.ready))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Detach from the shared memory. Arrays of this ring can't be used after this.
+
+        '''
+        self.counters = self.inputs = self.policies = self.values = None
+        self.shm.close()
+
+
+class InferenceClient:
+    '''
+    Worker side of a ring. Has "predict" as Network does, so MCTS can use it as a network.
+
+    Attributes
+    ----------
+    ring : RingBuffer
+        Ring of the worker.
+    timeout : float
+        Max seconds predict waits for the server.
+
+    '''
+    def __init__(self, ring, timeout=None):
+        '''
+
+        Paramators
+        ----------
+        ring : RingBuffer
+            Ring of the worker, passed to the worker process by start_server's caller.
+        timeout : float
+            Max seconds predict waits for the server. config.INFERENCE_TIMEOUT when None.
+
+        '''
+        self.ring = ring
+        self.timeout = config.INFERENCE_TIMEOUT if timeout is None else timeout
+
+    def _wait(self, seq):
+        '''
+
+        Parameters
+        ----------
+        seq : int
+            Sequence number the server has to serve up to.
+
+        Returns
+        -------
+        None.
+            Raise RuntimeError when the server is down, TimeoutError when it doesn't answer in time.
+
+        '''
+        ring = self.ring
+        deadline = time.perf_counter() + self.timeout
+        while True:
+            # ready may keep releases of earlier requests, so the counter decides.
+            with ring.lock:
+                served = int(ring.counters[1])
+            if served >= seq:
+                return
+            if ring.down.is_set():
+                raise RuntimeError('Inference server is down.')
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError('Inference server did not answer in {} seconds.'.format(self.timeout))
+            ring.ready.acquire(timeout=min(remaining, 1.))
+
+    def predict(self, xs):
+        '''
+
+        Parameters
+        ----------
+        xs : np.ndarray
+            Network inputs. (N, 9, 9, 24)
+
+        Returns
+        -------
+        policies : np.ndarray
+            Policies for all actions. (N, OUTPUT_SHAPE)
+        values : np.ndarray
+            Values. (N,)
+
+        '''
+        ring = self.ring
+        policies = np.empty((len(xs), config.OUTPUT_SHAPE), dtype=np.float32)
+        values = np.empty(len(xs), dtype=np.float32)
+
+        for start in range(0, len(xs), ring.slots):
+            end = min(start + ring.slots, len(xs))
+            # Only this worker writes counters[0].
+            seq = int(ring.counters[0])
+            idx = (seq + np.arange(end - start)) % ring.slots
+            ring.inputs[idx] = xs[start:end]
+            with ring.lock:
+                ring.counters[0] = seq + end - start
+            ring.requested.release()
+
+            self._wait(seq + end - start)
+            policies[start:end] = ring.policies[idx]
+            values[start:end] = ring.values[idx]
+
+        return policies, values
+
+    def close(self):
+        self.ring.close()
+
+
+class InferenceServer:
+    '''
+
+    Attributes
+    ----------
+    rings : list
+        RingBuffers of the workers.
+    max_batch : int
+        Max number of boards predicted at once.
+    max_wait : float
+        Max seconds the oldest request waits for a bigger batch.
+    net : Neural Network
+        Network which has method "predict" for batched inputs.
+    stamp : tuple
+        Stamp of best_network.h5 when it was loaded. None when net is given and never reloaded.
+    inputs : np.ndarray
+        Buffer for batched network inputs. (max_batch, 9, 9, 24)
+    batches : int
+        Number of predictions.
+    requests : int
+        Number of boards predicted.
+
+    '''
+    def __init__(self, rings, net=None, max_batch=None, max_wait=None):
+        '''
+
+        Paramators
+        ----------
+        rings : list
+            RingBuffers of the workers. They share requested and down events.
+        net : Neural Network
+            Network which has method "predict" for batched inputs.
+            best_network.h5 is loaded in run, and reloaded when it changes, when None.
+        max_batch : int
+            Max number of boards predicted at once. config.INFERENCE_MAX_BATCH when None.
+        max_wait : float
+            Max seconds the oldest request waits. config.INFERENCE_MAX_WAIT when None.
+
+        '''
+        self.rings = rings
+        self.max_batch = config.INFERENCE_MAX_BATCH if max_batch is None else max_batch
+        self.max_wait = config.INFERENCE_MAX_WAIT if max_wait is None else max_wait
+        self.net = net
+        self.stamp = None
+        self.inputs = np.empty((self.max_batch, ) + config.INPUT_SHAPE, dtype=np.float32)
+        self.batches = 0
+        self.requests = 0
+
+    def _reload(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Load best_network.h5 when it has changed since the last load.
+            Games in progress continue with the new network.
+            The loaded network is kept while the file is missing.
+
+        '''
+        try:
+            stat = os.stat(os.path.join('networks', 'best_network.h5'))
+        except FileNotFoundError:
+            if self.net is None:
+                raise
+            return
+        # Renaming current_network.h5 to best_network.h5 keeps the mtime, so inode is compared too.
+        stamp = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+        if stamp == self.stamp:
+            return
+
+        if self.net is None:
+            # TensorFlow is imported only in the server process.
+            from networks import Network
+            self.net = Network(load=True)
+        else:
+            self.net.load_network()
+        self.stamp = stamp
+
+    def _pending(self):
+        '''
+
+        Returns
+        -------
+        pendings : list
+            (ring, first sequence, number) of requests not served yet.
+
+        '''
+        pendings = []
+        for ring in self.rings:
+            with ring.lock:
+                written, served = int(ring.counters[0]), int(ring.counters[1])
+            if written > served:
+                pendings.append((ring, served, written - served))
+
+        return pendings
+
+    def _serve(self, pendings):
+        '''
+
+        Parameters
+        ----------
+        pendings : list
+            Built by _pending.
+
+        Returns
+        -------
+        None.
+            Predict up to max_batch requests at once and write results back to the rings.
+
+        '''
+        taken, size = [], 0
+        for ring, seq, number in pendings:
+            number = min(number, self.max_batch - size)
+            if number == 0:
+                break
+            idx = (seq + np.arange(number)) % ring.slots
+            self.inputs[size:size + number] = ring.inputs[idx]
+            taken.append((ring, seq, idx, size))
+            size += number
+
+        policies, values = self.net.predict(self.inputs[:size])
+        for ring, seq, idx, start in taken:
+            ring.policies[idx] = policies[start:start + len(idx)]
+            ring.values[idx] = values[start:start + len(idx)]
+            with ring.lock:
+                ring.counters[1] = seq + len(idx)
+            ring.ready.release()
+        self.batches += 1
+        self.requests += size
+
+    def run(self, stop):
+        '''
+
+        Parameters
+        ----------
+        stop : multiprocessing.Event
+            Server stops when this is set.
+
+        Returns
+        -------
+        None.
+            down is set when the server stops for any reason, so that waiting workers raise.
+
+        '''
+        requested, down = self.rings[0].requested, self.rings[0].down
+        reload = self.net is None
+        try:
+            checked = time.perf_counter()
+            if reload:
+                self._reload()
+
+            oldest = None
+            while not stop.is_set():
+                if reload and time.perf_counter() - checked >= 1.:
+                    self._reload()
+                    checked = time.perf_counter()
+                pendings = self._pending()
+                if not pendings:
+                    oldest = None
+                    requested.acquire(timeout=0.1)
+                    continue
+
+                if oldest is None:
+                    oldest = time.perf_counter()
+                size = sum(p[2] for p in pendings)
+                waited = time.perf_counter() - oldest
+                if size >= self.max_batch or len(pendings) == len(self.rings) or waited >= self.max_wait:
+                    self._serve(pendings)
+                    oldest = None
+                else:
+                    requested.acquire(timeout=self.max_wait - waited)
+        finally:
+            down.set()
+            for ring in self.rings:
+                ring.close()
+
+
+def serve(rings, stop, max_batch=None, max_wait=None):
+    '''
+
+    Parameters
+    ----------
+    rings : list
+        RingBuffers of the workers.
+    stop : multiprocessing.Event
+        Server stops when this is set.
+    max_batch : int
+        Max number of boards predicted at once.
+    max_wait : float
+        Max seconds the oldest request waits.
+
+    Returns
+    -------
+    None.
+        Target of the server process. best_network.h5 is loaded in it.
+
+    '''
+    InferenceServer(rings, None, max_batch, max_wait).run(stop)
+
+
+def start_server(workers, max_batch=None, max_wait=None):
+    '''
+
+    Parameters
+    ----------
+    workers : int
+        Number of worker processes, which is the number of rings.
+    max_batch : int
+        Max number of boards predicted at once.
+    max_wait : float
+        Max seconds the oldest request waits.
+
+    Returns
+    -------
+    server : tuple
+        (process, stop event, rings). Pass it to check_server and stop_server.
+        rings[i] is passed to worker i when it is started, which predicts with InferenceClient(rings[i]).
+
+    '''
+    # Spawned, not forked: a fork of a process which already runs TensorFlow hangs in it.
+    context = multiprocessing.get_context('spawn')
+    requested, down, stop = context.Semaphore(0), context.Event(), context.Event()
+    rings = [RingBuffer(requested, down) for _ in range(workers)]
+    process = context.Process(
+        target=serve,
+        args=(rings, stop, max_batch, max_wait),
+        daemon=True,
+    )
+    process.start()
+
+    return process, stop, rings
+
+
+def check_server(server):
+    '''
+
+    Parameters
+    ----------
+    server : tuple
+        Built by start_server.
+
+    Returns
+    -------
+    alive : bool
+        Whether the server process is running.
+        When it has died without setting down itself, down is set here so that waiting workers raise.
+
+    '''
+    process, _, rings = server
+    if process.is_alive():
+        return True
+    rings[0].down.set()
+
+    return False
+
+
+def stop_server(server):
+    '''
+
+    Parameters
+    ----------
+    server : tuple
+        Built by start_server.
+
+    Returns
+    -------
+    None.
+        Stop the server process and free the shared memories.
+
+    '''
+    process, stop, rings = server
+    stop.set()
+    process.join()
+    for ring in rings:
+        ring.close()
+        ring.shm.unlink()
@@ -1,10 +1,10 @@
 import os
-import subprocess
-from copy import deepcopy
-from board import Board
+from bitboard import make_board
 from networks import Network
-from montecarlo import MCTS
+from montecarlo import MCTS, PersistentSearch
 from logs import Log
+from worker_pool import WorkerPool
+from sprt import SPRT
 import config
 
 
@@ -15,17 +15,21 @@ class Match:
     ----------
     log : Log
         Logging class.
+    pool : WorkerPool
+        Worker processes playing evaluation matches. Built on first parallel_evaluate when not given.
 
     '''
-    def __init__(self):
+    def __init__(self, pool=None):
         '''
 
         Paramators
         ----------
-        None.
+        pool : WorkerPool
+            Worker processes shared with SelfMatch.
 
         '''
         self.log = Log()
+        self.pool = pool
 
     def _first_point(self, board):
         '''
@@ -60,8 +64,8 @@ class Match:
         None.
 
         '''
-        os.remove(os.path.join('networks', 'best_network.h5'))
-        os.rename(
+        # Replaced in one step, so processes watching best_network.h5 never miss it.
+        os.replace(
             os.path.join('networks', 'current_network.h5'),
             os.path.join('networks', 'best_network.h5'),
         )
@@ -82,23 +86,55 @@ class Match:
             Match's result point.
 
         '''
-        board = Board()
+        board = make_board()
+        # Each network keeps its own tree, and both trees follow every action.
+        searches = [PersistentSearch(algo), PersistentSearch(algo)]
         while not board.is_over():
             if board.is_first():
-                action = algo.take_action(
+                action = searches[0].take_action(
                     nets[0], board, config.SIMULATIONS, 0,
                 )
             else:
-                action = algo.take_action(
+                action = searches[1].take_action(
                     nets[1], board, config.SIMULATIONS, 0,
                 )
-            old_board = deepcopy(board)
-            board = old_board.next_board(action)
+            board = board.next_board(action)
+            for search in searches:
+                search.advance(action)
 
         point = self._first_point(board)
 
         return point
 
+    def _judge(self, sprt, results, epoches):
+        '''
+
+        Parameters
+        ----------
+        sprt : SPRT
+            Test of the evaluation matches.
+        results : list
+            Current network's points.
+        epoches : int
+            Played epoch times.
+
+        Returns
+        -------
+        promoted : bool
+            Current network replaced the best one.
+
+        '''
+        promoted = sprt.decision()
+        average = sum(results) / len(results) if results else 0.
+        print('\nAverage: {} in {} matches (LLR {:.2f}) => {}'.format(
+            average, len(results), sprt.llr, 'promoted' if promoted else 'rejected',
+        ))
+        self.log.log_result(results, epoches)
+        if promoted:
+            self._update_network()
+
+        return promoted
+
     def evaluate(self, epoches=0):
         '''
 
@@ -109,7 +145,8 @@ class Match:
 
         Returns
         -------
-        None.
+        promoted : bool
+            Current network replaced the best one.
 
         '''
         current_net = Network(load=True, load_file='current_network.h5')
@@ -117,7 +154,7 @@ class Match:
         mcts = MCTS()
 
         nets = [current_net, best_net]
-        total_points = 0
+        sprt = SPRT()
         results = []
 
         for i in range(config.EVAL_MATCH):
@@ -126,17 +163,15 @@ class Match:
             else:
                 v = 1 - self.play(mcts, list(reversed(nets)))
 
-            total_points += v
             results.append(v)
             print('\rEvaluation: {}/{}'.format(i + 1, config.EVAL_MATCH), end=' ')
-
-        av = total_points / config.EVAL_MATCH
-        print('Average: {}'.format(av))
+            if sprt.update(v) is not None:
+                break
 
         best_net.clean()
         current_net.clean()
-        self.log.log_result(results, epoches)
-        self._update_network()
+
+        return self._judge(sprt, results, epoches)
 
     def parallel_evaluate(self, epoches=0):
         '''
@@ -148,33 +183,39 @@ class Match:
 
         Returns
         -------
-        None.
+        promoted : bool
+            Current network replaced the best one.
+            Matches stop as soon as SPRT decides on the matches in submission order, up to config.EVAL_MATCH.
 
         '''
-        total_points = 0
-        results = []
-
-        for i in range(config.EVAL_MATCH // config.PARALLEL_MATCH):
-            rs = []
-            for p in range(config.PARALLEL_MATCH):
-                if p % 2 == 0:
-                    sh = 'python async_match.py {} {}'.format('eval_match', 'True')
-                else:
-                    sh = 'python async_match.py {} {}'.format('eval_match', 'False')
-                r = subprocess.Popen(sh, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                rs.append(r)
-            for j, r in enumerate(rs):
-                point = r.stdout.readline().decode()
-                point = float(point.rstrip('\n'))
-                v = point if i % 2 == 0 else 1 - point
-                total_points += v
-                results.append(v)
-                print('\rEvaluation: {}/{} => {}'.format(i * config.PARALLEL_MATCH + j + 1, config.EVAL_MATCH, v), end='')
-
-        av = total_points / config.EVAL_MATCH
-        print('\nAverage: {}'.format(av))
-        self.log.log_result(results, epoches)
-        self._update_network()
+        if self.pool is None:
+            self.pool = WorkerPool()
+        self.pool.reset_usage()
+        workers = len(self.pool.processes)
+        sprt = SPRT()
+        submitted = inflight = 0
+
+        while sprt.accepted is None and (submitted < config.EVAL_MATCH or inflight):
+            # Only as many matches as workers are queued, so no match is left to cancel on the decision.
+            while inflight < workers and submitted < config.EVAL_MATCH:
+                # Current network plays first in even matches.
+                self.pool.submit(('eval_match', (submitted % 2 == 0, 'current_network.h5', submitted)))
+                submitted += 1
+                inflight += 1
+
+            _, (first, _, i), point = self.pool.collect()
+            inflight -= 1
+            v = point if first else 1 - point
+            sprt.add(i, v)
+            print('\rEvaluation: {}/{} => {}'.format(sprt.games, config.EVAL_MATCH, v), end='')
+
+        # Matches still played don't change the decision, but their results must leave the queue.
+        for _ in range(inflight):
+            self.pool.collect()
+        promoted = self._judge(sprt, sprt.points, epoches)
+        print(self.pool.usage.report())
+
+        return promoted
 
     def play_with(self, board, actions, action_idx, cwd=None):
         '''
@@ -212,7 +253,6 @@ class Match:
             else:
                 action = actions[1](net, board, action_idx)
 
-            old_board = deepcopy(board)
-            new_board = old_board.next_board(action)
+            new_board = board.next_board(action)
 
         return False, new_board, None
@@ -1,5 +1,4 @@
 import numpy as np
-from copy import deepcopy
 import config
 
 
@@ -18,6 +17,17 @@ class Node:
         How many times this node ever simulated.
     children : list
         Contains Node classes this node has.
+        None for a child which hasn't been selected yet (not materialised).
+    actions : list
+        Actions of the edges to children.
+    priors : numpy.ndarray
+        Policies of the edges to children. A child shared by a transposition
+        has a different prior for each parent.
+    edge_n : list
+        Simulated times of the edges to children. A child shared by a transposition
+        counts visits through every parent in its n, so PUCT and visits use these instead.
+    linked : set
+        ids of children shared from the transposition table and not selected yet.
     root : bool
         Is this node root.
     history : set
@@ -28,9 +38,11 @@ class Node:
         Constance for noise.
     alpha : float
         Constance for noise.
+    table : TranspositionTable
+        Table shared with the whole tree. None when positions aren't shared.
 
     '''
-    def __init__(self, board, policy, cpuct, root = False, history = None, dammy = False):
+    def __init__(self, board, policy, cpuct, root = False, history = None, dammy = False, table = None):
         '''
 
         Parameters
@@ -43,10 +55,12 @@ class Node:
             Constant used for node evaluation
         root : bool
             Wether this node is root one.
-        history : dict
-            Board's history contains board's string expression.
+        history : set
+            Board's history contains board's zobrist key.
         dammy : bool
             Is this instance dammy (has this node's board already appeared)?
+        table : TranspositionTable
+            Table shared with the whole tree. None when positions aren't shared.
 
         Returns
         -------
@@ -59,11 +73,16 @@ class Node:
         self.w = 0
         self.n = 0
         self.children = None
+        self.actions = None
+        self.priors = None
+        self.edge_n = None
+        self.linked = None
         self.root = root
         self.history = set() if history is None else history
         self.dammy = dammy
         self.eps = config.EPS
         self.alpha = config.ALPHA
+        self.table = table
 
     def _select(self):
         '''
@@ -74,25 +93,32 @@ class Node:
 
         Returns
         -------
-        node : Node class
-            Node class of this node's children which has highest value.
+        idx : int
+            Index of the edge to the child which has highest value.
 
         '''
-        t = sum([c.n for c in self.children])
-        sq = np.sqrt(t)
+        sq = np.sqrt(sum(self.edge_n))
         values = []
 
-        for c in self.children:
-            if c.dammy:
+        for c, p, n in zip(self.children, self.priors, self.edge_n):
+            if c is not None and c.dammy:
                 v = -np.inf
-            elif c.n == 0:
-                v = self.cput * c.policy * sq / (1 + c.n)
+            elif c is None or c.n == 0:
+                v = self.cput * p * sq / (1 + n)
             else:
-                v = -c.w / c.n + self.cput * c.policy * sq / (1 + c.n)
+                # Value is shared by every parent, exploration is counted on this edge.
+                v = -c.w / c.n + self.cput * p * sq / (1 + n)
             values.append(v)
-        node = self.children[np.argmax(values)]
 
-        return node
+        while True:
+            idx = int(np.argmax(values))
+            if self.children[idx] is not None:
+                return idx
+            # Repetition is found when the child is materialised. Select again without it.
+            node = self._materialise(idx)
+            if not node.dammy:
+                return idx
+            values[idx] = -np.inf
 
     def _select_without_net(self):
         '''
@@ -145,16 +171,42 @@ class Node:
         Returns
         -------
         value : int
-            Value got in playout. This works recursivly.
+            Value got in playout. Actions are pushed to the board and popped after the playout,
+            so the board is the same as before.
+
+        '''
+        depth = 0
+        while not board.is_over():
+            board.push(self._random_action(board))
+            depth += 1
+
+        value = -1 if board.is_lose() else 0
+        for _ in range(depth):
+            board.pop()
+            value = -value
+
+        return value
 
+    def _mask_policy(self, policy, takables):
         '''
-        if board.is_lose():
-            return -1
-        elif board.is_draw():
-            return 0
-        old_board = deepcopy(board)
 
-        return -self._playout(old_board.next_board(self._random_action(board)))
+        Parameters
+        ----------
+        policy : numpy.ndarray
+            Network's policy for all actions. (OUTPUT_SHAPE,)
+        takables : list
+            Takable actions of the board.
+
+        Returns
+        -------
+        policy : numpy.ndarray
+            Monte-Carlo's policy only for movable actions.
+
+        '''
+        policy = policy[takables]
+        policy /=  sum(policy) if sum(policy) else 1
+
+        return policy
 
     def _predict(self, net, board):
         '''
@@ -163,8 +215,7 @@ class Node:
         ----------
         net : Neural Network
             Neural network class defined in network.py.
-            This class has instance variable "model",
-            which is tensorflow.keras.models.Model.
+            This class has method "predict" for batched inputs.
         board : Board
             Board class defined in game.py.
 
@@ -177,15 +228,280 @@ class Node:
 
         '''
         x = board.reshape_input()
-        y = net.model.predict(x, batch_size=1)
+        policies, values = net.predict(x)
         takables = board.takable_actions()
 
-        policy = y[0][0][takables]
-        policy /=  sum(policy) if sum(policy) else 1
-        value = y[1][0][0]
+        policy = self._mask_policy(policies[0], takables)
+        value = values[0]
 
         return policy, value
 
+    def expand(self, policy, takables):
+        '''
+
+        Parameters
+        ----------
+        policy : numpy.ndarray
+            Monte-Carlo's policy only for movable actions.
+        takables : list
+            Takable actions of this node's board.
+
+        Returns
+        -------
+        None.
+            Keep actions and priors for this node's children. A child's board is built
+            only when _select picks the edge first time. Statistics (w, n) are not changed.
+
+        '''
+        noises = np.random.dirichlet(alpha=[self.alpha] * len(policy))
+        if self.root:
+            policy = (1 - self.eps) * policy + self.eps * noises
+
+        self.children = [None] * len(takables)
+        self.actions = takables
+        self.priors = policy
+        self.edge_n = [0] * len(takables)
+        self.linked = set()
+
+    def _materialise(self, idx):
+        '''
+
+        Parameters
+        ----------
+        idx : int
+            Index of the edge selected first time.
+
+        Returns
+        -------
+        node : Node
+            Child for the edge. Built from the board after the action,
+            and marked dammy when the board has already appeared in the tree.
+
+        '''
+        next_board = self.board.next_board(self.actions[idx])
+        s = next_board.key
+        node = None if self.table is None else self.table.get(next_board)
+
+        if node is not None:
+            # Transposition: the same position at the same turn shares statistics.
+            self.linked.add(id(node))
+        elif s in self.history:
+            node = Node(next_board, self.priors[idx], self.cput, history=self.history, dammy=True, table=self.table)
+        else:
+            self.history.add(s)
+            node = Node(next_board, self.priors[idx], self.cput, history=self.history, table=self.table)
+            if self.table is not None:
+                self.table.put(node)
+        self.children[idx] = node
+
+        return node
+
+    def child(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action of an edge of this expanded node.
+
+        Returns
+        -------
+        node : Node
+            Child for the action. Materialised when not selected yet.
+
+        '''
+        idx = self.actions.index(action)
+        node = self.children[idx]
+
+        return self._materialise(idx) if node is None else node
+
+    def visits(self):
+        '''
+
+        Returns
+        -------
+        visits : list
+            Simulated times of the edges to children, in order of takable actions.
+
+        '''
+        return list(self.edge_n)
+
+    def add_noise(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        None.
+            Mix dirichlet noise into policies of this node's children.
+
+        '''
+        noises = np.random.dirichlet(alpha=[self.alpha] * len(self.children))
+        self.priors = (1 - self.eps) * self.priors + self.eps * noises
+
+    def make_root(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        None.
+            Make this node the root of the tree reused for the next move.
+            History and dammy flags are rebuilt only from this node's subtree,
+            transpositions out of the subtree are dropped from the table,
+            and dirichlet noise is applied to the children when already expanded.
+
+        '''
+        self.root = True
+        self.history = set()
+        nodes = [self]
+        visited = {id(self)}
+        for node in nodes:
+            node.history = self.history
+            if node.children is None:
+                continue
+            for c in node.children:
+                # Not materialised, or shared by a transposition and already walked from another parent.
+                if c is None or id(c) in visited:
+                    continue
+                visited.add(id(c))
+                s = c.board.key
+                c.dammy = s in self.history
+                self.history.add(s)
+                nodes.append(c)
+
+        if self.table is not None:
+            self.table.retain(visited)
+        if self.children is not None:
+            self.add_noise()
+
+    def _take_link(self, child):
+        '''
+
+        Parameters
+        ----------
+        child : Node
+            Child chosen by _select.
+
+        Returns
+        -------
+        stop : bool
+            Is this the first selection of a child shared from the transposition table
+            which is already evaluated. Its stored value is backed up instead of searching below it.
+
+        '''
+        if not self.linked or id(child) not in self.linked:
+            return False
+        self.linked.discard(id(child))
+
+        return child.children is not None
+
+    def transposition_value(self):
+        '''
+
+        Returns
+        -------
+        value : float
+            Mean value this node already has, for this node's player.
+
+        '''
+        return self.w / self.n
+
+    def select_path(self):
+        '''
+
+        Parameters
+        ----------
+        None.
+
+        Returns
+        -------
+        path : list
+            Nodes from this node to a leaf (not expanded or over) chosen by _select.
+            The path ends at an expanded node when it is a transposition selected first time.
+
+        '''
+        path = [self]
+        node = self
+        while node.children is not None and not node.board.is_over():
+            child = node.children[node._select()]
+            path.append(child)
+            if node._take_link(child):
+                break
+            node = child
+
+        return path
+
+    @staticmethod
+    def add_virtual_loss(path, loss):
+        '''
+
+        Parameters
+        ----------
+        path : list
+            Nodes built by select_path.
+        loss : int, float
+            Virtual loss. Negative value removes it.
+
+        Returns
+        -------
+        None.
+            Nodes on the path look visited and lost for their parents
+            until the leaf is evaluated, so that other simulations choose other paths.
+
+        '''
+        for node in path:
+            node.n += loss
+            node.w += loss
+        for parent, child in zip(path, path[1:]):
+            parent.edge_n[parent.children.index(child)] += loss
+
+    @staticmethod
+    def backup(path, value, link=False):
+        '''
+
+        Parameters
+        ----------
+        path : list
+            Nodes built by select_path.
+        value : float
+            Value of the leaf for the leaf's player.
+        link : bool
+            Is the leaf a transposition already evaluated through another parent.
+            Its statistics are shared with the other parents, so only the nodes before it
+            and the edges of the path count the visit.
+
+        Returns
+        -------
+        None.
+
+        '''
+        nodes = path[:-1] if link else path
+        value = -value if link else value
+        for node in reversed(nodes):
+            node.w += value
+            node.n += 1
+            value = -value
+        for parent, child in zip(path, path[1:]):
+            parent.edge_n[parent.children.index(child)] += 1
+
+    def terminal_value(self):
+        '''
+
+        Returns
+        -------
+        value : int
+            Value of this node's board which is already over.
+
+        '''
+        return -1 if self.board.is_lose() else 0
+
     def eval(self, net):
         '''
 
@@ -193,8 +509,7 @@ class Node:
         ----------
         net : Neural Network
             Neural network class defined in network.py.
-            This class has instance variable "model",
-            which is tensorflow.keras.models.Model
+            This class has method "predict" for batched inputs.
 
         Returns
         -------
@@ -203,7 +518,7 @@ class Node:
 
         '''
         if self.board.is_over():
-            value = -1 if self.board.is_lose() else 0
+            value = self.terminal_value()
             self.w += value
             self.n += 1
 
@@ -211,31 +526,19 @@ class Node:
 
         if self.children is None:
             policy, value = self._predict(net, self.board)
-            noises = np.random.dirichlet(alpha=[self.alpha] * len(policy))
-            if self.root:
-                policy = (1 - self.eps) * policy + self.eps * noises
-
             self.w += value
             self.n += 1
-            takables = self.board.takable_actions()
-            self.children = []
-            idx = 0
-
-            for a, p in zip(takables, policy):
-                old_board = deepcopy(self.board)
-                next_board = old_board.next_board(a)
-                s = next_board.board_to_str()
-
-                if s in self.history:
-                    policy[idx] = -pow(10, 10)
-                    self.children.append(Node(next_board, p, self.cput, history=self.history, dammy=True))
-                else:
-                    self.history.add(s)
-                    self.children.append(Node(next_board, p, self.cput, history=self.history, ))
-                idx += 1
+            self.expand(policy, self.board.takable_actions())
 
         else:
-            value = -self._select().eval(net)
+            idx = self._select()
+            child = self.children[idx]
+            self.edge_n[idx] += 1
+            if self._take_link(child):
+                # Only this node and the edge count the visit. The shared child wasn't evaluated again.
+                value = -child.transposition_value()
+            else:
+                value = -child.eval(net)
             self.w += value
             self.n += 1
 
@@ -270,9 +573,8 @@ class Node:
                 self.children = []
 
                 for a in takables:
-                    old_board = deepcopy(self.board)
-                    next_board = old_board.next_board(a)
-                    s = next_board.board_to_str()
+                    next_board = self.board.next_board(a)
+                    s = next_board.key
 
                     if s in self.history:
                         self.children.append(Node(next_board, 0, self.cput, history=self.history, dammy=True))
@@ -1,6 +1,8 @@
-from copy import deepcopy
 import numpy as np
 from mcts_node import Node
+from search_tree import SearchTree
+from transposition import TranspositionTable
+from board import reshape_inputs
 import config
 
 
@@ -11,17 +13,26 @@ class MCTS:
     ----------
     cpuct : float
         Constant used for node evaluation
+    batch : int
+        Leaves evaluated by the network at once.
+    inputs : np.ndarray
+        Buffer for batched network inputs.
 
     '''
-    def __init__(self):
+    def __init__(self, cpuct=None, batch=None):
         '''
 
         Paramators
         ----------
-        None.
+        cpuct : float
+            Constant used for node evaluation. config.C_PUT when None.
+        batch : int
+            Leaves evaluated by the network at once. config.EVAL_BATCH when None.
 
         '''
-        self.cpuct = config.C_PUT
+        self.cpuct = config.C_PUT if cpuct is None else cpuct
+        self.batch = config.EVAL_BATCH if batch is None else batch
+        self.inputs = np.empty(shape=(self.batch, ) + config.INPUT_SHAPE, dtype=np.float32)
 
     def _bolzman_distribution(self, probs, gamma):
         '''
@@ -44,19 +55,119 @@ class MCTS:
 
         return probs
 
-    def get_probs(self, net, board, simulations, gamma):
+    def _batch_search(self, net, root, simulations):
         '''
 
         Parameters
         ----------
         net : Neural Network
             Neural network class defined in network.py.
-            This class has instance variable "model",
-            which is tensorflow.keras.models.Model
+            This class has method "predict" for batched inputs.
+        root : Node
+            Root node to search.
+        simulations : int
+            Number you want to repeat for root noe evaluation.
+
+        Returns
+        -------
+        None.
+            Collect up to self.batch leaves with virtual loss,
+            evaluate them in one prediction and back all of them up.
+
+        '''
+        done = 0
+        while done < simulations:
+            paths = []
+            while len(paths) < min(self.batch, simulations - done):
+                path = root.select_path()
+                leaf = path[-1]
+                if leaf.board.is_over():
+                    Node.backup(path, leaf.terminal_value())
+                    done += 1
+                    continue
+                # Transposition already evaluated through another parent.
+                if leaf.children is not None:
+                    Node.backup(path, leaf.transposition_value(), link=True)
+                    done += 1
+                    continue
+                # The same leaf is already waiting for evaluation.
+                if any(leaf is p[-1] for p in paths):
+                    break
+                Node.add_virtual_loss(path, config.VIRTUAL_LOSS)
+                paths.append(path)
+
+            if not paths:
+                continue
+            xs = reshape_inputs([p[-1].board for p in paths], self.inputs)
+            policies, values = net.predict(xs)
+            for path, policy, value in zip(paths, policies, values):
+                leaf = path[-1]
+                takables = leaf.board.takable_actions()
+                Node.add_virtual_loss(path, -config.VIRTUAL_LOSS)
+                leaf.expand(leaf._mask_policy(policy, takables), takables)
+                Node.backup(path, value)
+            done += len(paths)
+
+    def _new_root(self, board):
+        '''
+
+        Parameters
+        ----------
         board : Board
-            Board class defined in game.py.
+            Root board.
+
+        Returns
+        -------
+        root : Node, SearchTree
+            SearchTree when config.ARRAY_TREE, otherwise root Node.
+            The root Node has a new transposition table when config.TRANSPOSITION.
+
+        '''
+        if config.ARRAY_TREE:
+            return SearchTree(board, self.cpuct)
+
+        table = TranspositionTable() if config.TRANSPOSITION else None
+
+        return Node(board, 0, self.cpuct, root=True, table=table)
+
+    def _search(self, net, root, simulations):
+        '''
+
+        Parameters
+        ----------
+        net : Neural Network
+            Neural network class defined in network.py.
+            This class has method "predict" for batched inputs.
+        root : Node, SearchTree
+            Root built by _new_root. Statistics it already has are kept.
         simulations : int
             Number you want to repeat for root noe evaluation.
+
+        Returns
+        -------
+        visits : list, numpy.ndarray
+            Simulated times of root's children, in order of takable_actions.
+
+        '''
+        if config.ARRAY_TREE:
+            root.search(net, simulations, self.batch, self.inputs)
+            return root.visits()
+
+        if self.batch > 1:
+            self._batch_search(net, root, simulations)
+        else:
+            for _ in range(simulations):
+                root.eval(net)
+
+        return root.visits()
+
+    def _to_probs(self, visits, gamma):
+        '''
+
+        Parameters
+        ----------
+        visits : list, numpy.ndarray
+            Simulated times of root's children.
         gamma : int, float
             Constance used on Bolzman distribution.
 
@@ -66,20 +177,41 @@ class MCTS:
             Rate distribution only for movale actions.
 
         '''
-        root = Node(board, 0, self.cpuct, root=True)
-        for _ in range(simulations):
-            root.eval(net)
-        probs = [c.n for c in root.children]
-
         if gamma == 0:
-            action = np.argmax(probs)
-            probs = np.zeros_like(probs)
+            action = np.argmax(visits)
+            probs = np.zeros(len(visits))
             probs[action] = 1
         else:
-            probs = self._bolzman_distribution(probs, gamma)
+            probs = self._bolzman_distribution(visits, gamma)
 
         return probs
 
+    def get_probs(self, net, board, simulations, gamma):
+        '''
+
+        Parameters
+        ----------
+        net : Neural Network
+            Neural network class defined in network.py.
+            This class has instance variable "model",
+            which is tensorflow.keras.models.Model
+        board : Board
+            Board class defined in game.py.
+        simulations : int
+            Number you want to repeat for root noe evaluation.
+        gamma : int, float
+            Constance used on Bolzman distribution.
+
+        Returns
+        -------
+        probs : numpy.ndarray
+            Rate distribution only for movale actions.
+
+        '''
+        visits = self._search(net, self._new_root(board), simulations)
+
+        return self._to_probs(visits, gamma)
+
     def take_action(self, net, board, simulations, gamma=0):
         '''
 
@@ -134,8 +266,7 @@ class MCTS:
         root.children = []
 
         for a in takables:
-            old_board = deepcopy(board)
-            root.children.append(Node(old_board.next_board(a), 0, self.cpuct))
+            root.children.append(Node(board.next_board(a), 0, self.cpuct))
 
         for _ in range(100):
             root.eval_without_net()
@@ -167,10 +298,10 @@ class MCTS:
 
         '''
         xs = board.reshape_input()
-        y = net.model.predict(xs, batch_size = 1)
+        policies, _ = net.predict(xs)
         takables = board.takable_actions()
 
-        policy = y[0][0][takables]
+        policy = policies[0][takables]
         argmax = np.argmax(policy)
         action = takables[argmax]
 
@@ -197,3 +328,124 @@ class MCTS:
 
         '''
         return action_idx
+
+
+class PersistentSearch:
+    '''
+    Search tree kept over a match.
+    After an action is played, the child for the action becomes the new root
+    with its statistics, so simulations spent on it are reused on the next move.
+
+    Attributes
+    ----------
+    algo : MCTS
+        Monte-Carlo algorithm class used for searching.
+    root : Node, SearchTree
+        Current root. None until the first search or after the tree is dropped.
+    visits : list, numpy.ndarray
+        Simulated times of root's children got by the last get_probs, in order of takable_actions.
+
+    '''
+    def __init__(self, algo=None):
+        '''
+
+        Paramators
+        ----------
+        algo : MCTS
+            Monte-Carlo algorithm class. MCTS() when None.
+
+        '''
+        self.algo = MCTS() if algo is None else algo
+        self.root = None
+        self.visits = None
+
+    def _root_board(self):
+        '''
+
+        Returns
+        -------
+        board : Board
+            Board of the current root.
+
+        '''
+        return self.root.boards[0] if config.ARRAY_TREE else self.root.board
+
+    def get_probs(self, net, board, simulations, gamma):
+        '''
+
+        Parameters
+        ----------
+        net : Neural Network
+            Neural network class defined in network.py.
+            This class has method "predict" for batched inputs.
+        board : Board
+            Board class defined in game.py.
+        simulations : int
+            Number you want to add to the root's simulations.
+        gamma : int, float
+            Constance used on Bolzman distribution.
+
+        Returns
+        -------
+        probs : numpy.ndarray
+            Rate distribution only for movale actions.
+
+        '''
+        if self.root is None or self._root_board().key != board.key:
+            self.root = self.algo._new_root(board)
+        self.visits = self.algo._search(net, self.root, simulations)
+
+        return self.algo._to_probs(self.visits, gamma)
+
+    def take_action(self, net, board, simulations, gamma=0):
+        '''
+
+        Parameters
+        ----------
+        net : Neural Network
+            Neural network class defined in network.py.
+            This class has method "predict" for batched inputs.
+        board : Board
+            Board class defined in game.py.
+        simulations : int
+            Number you want to add to the root's simulations.
+        gamma : int, float
+            Constance used on Bolzman distribution.
+
+        Returns
+        -------
+        action : int
+            Next action this Monte-Carlo Algorithm says you should choose.
+
+        '''
+        probs = self.get_probs(net, board, simulations, gamma)
+        action = np.random.choice(board.takable_actions(), p=probs)
+
+        return action
+
+    def advance(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action played on the root's board. Either player's action.
+
+        Returns
+        -------
+        None.
+            The child for the action becomes the new root.
+            The tree is dropped when the root hasn't been expanded yet.
+
+        '''
+        if self.root is None:
+            return
+
+        if config.ARRAY_TREE:
+            self.root = self.root.advance(action) if self.root.first[0] >= 0 else None
+        elif self.root.children is None:
+            self.root = None
+        else:
+            child = self.root.child(action)
+            child.make_root()
+            self.root = child
@@ -4,6 +4,7 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 import numpy as np
 import os
+import tensorflow as tf
 from tensorflow.keras.layers import (Dense, Activation, Input, Conv2D, Add, LeakyReLU,
                                      BatchNormalization, GlobalAveragePooling2D,
                                      )
@@ -12,6 +13,8 @@ from tensorflow.keras.regularizers import l2
 import tensorflow.keras.backend as K
 from tensorflow.keras.callbacks import LearningRateScheduler, LambdaCallback
 from logs import Log
+from replay_buffer import ReplayBuffer
+from dataset import make_dataset
 import config
 
 
@@ -74,6 +77,7 @@ class Network:
         self.regularizers = config.REGULARIZER
         self.res_num = config.RES_NUM
         self.cwd = cwd
+        self._infer = None
         self.args = set((
             'input_shape',
             'output_shape',
@@ -211,41 +215,6 @@ class Network:
                 continue
             setattr(self, key, [member] * (self.res_num + 1))
 
-    def _load_history(self, epoch):
-        '''
-
-        Parameters
-        ----------
-        e : int
-            History file's index.
-
-        Returns
-        -------
-        None.
-
-        '''
-        if self.cwd is None:
-            path_i = os.path.abspath(os.path.join('histories_input', str(epoch)))
-            path_p = os.path.abspath(os.path.join('histories_policy', str(epoch)))
-            path_v = os.path.abspath(os.path.join('histories_value', str(epoch)))
-        else:
-            path_i = os.path.abspath(os.path.join(self.cwd, 'histories_input', str(epoch)))
-            path_p = os.path.abspath(os.path.join(self.cwd, 'histories_policy', str(epoch)))
-            path_v = os.path.abspath(os.path.join(self.cwd, 'histories_value', str(epoch)))
-
-        for i in range(config.SELFMATCH):
-            if i == 0:
-                self.history_input = np.load(os.path.join(path_i, '{}.npy'.format(i)))
-                self.history_policy = np.load(os.path.join(path_p, '{}.npy'.format(i)))
-                self.history_value = np.load(os.path.join(path_v, '{}.npy'.format(i)))
-            else:
-                load_i = np.load(os.path.join(path_i, '{}.npy'.format(i)))
-                load_p = np.load(os.path.join(path_p, '{}.npy'.format(i)))
-                load_v = np.load(os.path.join(path_v, '{}.npy'.format(i)))
-                self.history_input = np.vstack([self.history_input, load_i])
-                self.history_policy = np.vstack([self.history_policy, load_p])
-                self.history_value = np.append(self.history_value, load_v)
-
     def clean(self):
         '''
 
@@ -261,20 +230,27 @@ class Network:
         K.clear_session()
         self.model = None
 
-    def train(self, cycle_epoch):
+    def fit(self, buffer, epochs, initial_epoch=0):
         '''
 
         Parameters
         ----------
-        cycle_epoch : int
-            How many epochs done for overall training.
+        buffer : ReplayBuffer
+            Replay buffer trained on.
+        epochs : int
+            Train epochs.
+        initial_epoch : int
+            Epochs already trained. Learning rate decays by epochs in a cycle of config.EPOCHS.
 
         Returns
         -------
-        None.
+        hist : History
+            Keras history of the epochs.
+            ValueError is raised when the buffer's window has no positions.
 
         '''
         def decay(e):
+            e %= config.EPOCHS
             if e < int(config.EPOCHS * 0.5):
                 lr = 0.02
             elif e < int(config.EPOCHS * 0.8):
@@ -286,23 +262,115 @@ class Network:
 
         lr_decay = LearningRateScheduler(decay)
         print_callback = LambdaCallback(
-            on_epoch_begin = lambda epoch, logs: print('\rTrain: {}/{}'.format(epoch + 1, config.EPOCHS), end='')
+            on_epoch_begin = lambda epoch, logs: print('\rTrain: {}/{}'.format(epoch + 1, initial_epoch + epochs), end='')
         )
 
-        self.load_network()
-        self._load_history(cycle_epoch)
-        hist = self.model.fit(
-            self.history_input,
-            [self.history_policy, self.history_value],
-            batch_size = config.BATCH_SIZE,
-            epochs = config.EPOCHS,
+        buffer.refresh()
+        if not len(buffer):
+            raise ValueError('Replay buffer has no positions in its window. Ingest self matches before training.')
+        # One epoch samples as many positions as the window has.
+        steps = max(1, len(buffer) // config.BATCH_SIZE)
+        if config.TF_DATA:
+            data = make_dataset(buffer)
+        else:
+            data = buffer.batches(config.BATCH_SIZE, steps)
+
+        return self.model.fit(
+            data,
+            steps_per_epoch = steps,
+            epochs = initial_epoch + epochs,
+            initial_epoch = initial_epoch,
             verbose = False,
             callbacks = [lr_decay, print_callback],
         )
+
+    def train(self, cycle_epoch):
+        '''
+
+        Parameters
+        ----------
+        cycle_epoch : int
+            How many epochs done for overall training.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.load_network()
+        buffer = ReplayBuffer(cwd=self.cwd)
+        if cycle_epoch not in buffer.cycles():
+            buffer.ingest(cycle_epoch)
+        hist = self.fit(buffer, config.EPOCHS)
         print()
         self.log.log_loss(hist, cycle_epoch)
         self.save_network(filename='current_network.h5')
 
+    def _compiled(self):
+        '''
+
+        Returns
+        -------
+        infer : tf.function
+            self.model's forward pass traced into a graph.
+            Traced again only when self.model is replaced (built, loaded or cleaned).
+
+        '''
+        if self._infer is None or self._infer[0] is not self.model:
+            model = self.model
+            if config.PREDICT_BUCKETS:
+                # Static batch sizes, one trace per bucket.
+                signature = None
+            else:
+                signature = [tf.TensorSpec(shape=(None, ) + config.INPUT_SHAPE, dtype=tf.float32)]
+
+            @tf.function(input_signature=signature)
+            def infer(xs):
+                policies, values = model(xs, training=False)
+                return policies, values[:, 0]
+
+            self._infer = (model, infer)
+
+        return self._infer[1]
+
+    def predict(self, xs):
+        '''
+
+        Parameters
+        ----------
+        xs : np.ndarray
+            Network inputs. (N, 9, 9, 24)
+
+        Returns
+        -------
+        policies : np.ndarray
+            Policies for all actions. (N, OUTPUT_SHAPE)
+        values : np.ndarray
+            Values. (N,)
+
+        '''
+        # model.predict builds a data adapter every call, which costs more than the network for a few boards.
+        infer = self._compiled()
+        xs = np.asarray(xs, dtype=np.float32)
+        if not config.PREDICT_BUCKETS:
+            policies, values = infer(xs)
+            return policies.numpy(), values.numpy()
+
+        n = len(xs)
+        largest = config.PREDICT_BUCKETS[-1]
+        policies = np.empty((n, self.output_shape), dtype=np.float32)
+        values = np.empty(n, dtype=np.float32)
+        for start in range(0, n, largest):
+            chunk = xs[start:start + largest]
+            bucket = next(b for b in config.PREDICT_BUCKETS if b >= len(chunk))
+            padded = np.zeros((bucket, ) + chunk.shape[1:], dtype=np.float32)
+            padded[:len(chunk)] = chunk
+            p, v = infer(padded)
+            policies[start:start + len(chunk)] = p.numpy()[:len(chunk)]
+            values[start:start + len(chunk)] = v.numpy()[:len(chunk)]
+
+        return policies, values
+
     def save_network(self, filename='best_network.h5'):
         '''
 
@@ -0,0 +1,275 @@
+'''
+Self matches, training and evaluation running at the same time.
+
+train.py plays self matches, trains and evaluates one after another,
+so workers idle while the network trains and the trainer idles while games are played.
+Here workers keep playing self matches with the promoted network,
+a trainer process keeps training on the replay buffer and saves versioned checkpoints,
+and the workers evaluate every new checkpoint against the promoted network between self matches
+until SPRT decides whether it is promoted.
+They only share files on disk:
+records/ and replay/ from self matches, networks/checkpoints/ from the trainer,
+and networks/best_network.h5 which is replaced at once on promotion.
+'''
+import os
+import glob
+import shutil
+import multiprocessing
+import tensorflow as tf
+from networks import Network
+from replay_buffer import ReplayBuffer
+from worker_pool import WorkerPool
+from logs import Log
+from sprt import SPRT
+import config
+
+
+CHECKPOINTS = 'checkpoints'
+
+
+def checkpoint_file(version):
+    '''
+
+    Parameters
+    ----------
+    version : int
+        Checkpoint version.
+
+    Returns
+    -------
+    filename : str
+        Checkpoint's file name in networks/.
+
+    '''
+    return os.path.join(CHECKPOINTS, '{:06d}.h5'.format(version))
+
+
+def checkpoints():
+    '''
+
+    Returns
+    -------
+    versions : list
+        Versions of checkpoints on disk, in ascending order.
+
+    '''
+    names = glob.glob(os.path.join('networks', CHECKPOINTS, '[0-9]*.h5'))
+
+    return sorted(int(os.path.basename(n)[:-3]) for n in names)
+
+
+def _train(stop, epochs):
+    '''
+
+    Parameters
+    ----------
+    stop : multiprocessing.Event
+        Set to stop the trainer after the current checkpoint.
+    epochs : int
+        Train epochs between checkpoints.
+
+    Returns
+    -------
+    None.
+        Target of the trainer process.
+        Trains on the replay buffer as it grows and saves a checkpoint every epochs.
+
+    '''
+    os.makedirs(os.path.join('networks', CHECKPOINTS), exist_ok=True)
+    versions = checkpoints()
+    version = versions[-1] if versions else 0
+    net = Network(load=True, load_file=checkpoint_file(version) if version else 'best_network.h5')
+    buffer = ReplayBuffer()
+
+    while not stop.is_set():
+        cycles = buffer.cycles()
+        # Train config.EPOCHS epochs per cycle at most, as much as train.py does, then wait for self matches.
+        if not cycles or version * epochs >= (cycles[-1] + 1) * config.EPOCHS:
+            stop.wait(1)
+            continue
+
+        try:
+            hist = net.fit(buffer, epochs, initial_epoch=version * epochs)
+        except tf.errors.NotFoundError:
+            # A shard went out of the window while it was read. Weights and optimizer state were
+            # partly updated by then, so they go back to the last checkpoint before training again on the new window.
+            net.load_network(filename=checkpoint_file(version) if version else 'best_network.h5')
+            continue
+        version += 1
+        net.log.log_loss(hist, 'v{}'.format(version))
+
+        # Written under another name and renamed, so workers never load half written checkpoints.
+        tmp = os.path.join(CHECKPOINTS, 'tmp_{:06d}.h5'.format(version))
+        net.save_network(filename=tmp)
+        os.replace(os.path.join('networks', tmp), os.path.join('networks', checkpoint_file(version)))
+
+
+class Orchestrator:
+    '''
+
+    Attributes
+    ----------
+    pool : WorkerPool
+        Worker processes playing self matches and evaluation matches.
+    epochs : int
+        Train epochs between checkpoints.
+    log : Log
+        Logging class.
+    buffer : ReplayBuffer
+        Replay buffer self matches are ingested into.
+
+    '''
+    def __init__(self, pool=None, epochs=None):
+        '''
+
+        Paramators
+        ----------
+        pool : WorkerPool
+            Worker processes. Built when None.
+        epochs : int
+            Train epochs between checkpoints. config.CHECKPOINT_EPOCHS when None.
+
+        '''
+        self.pool = WorkerPool() if pool is None else pool
+        self.epochs = config.CHECKPOINT_EPOCHS if epochs is None else epochs
+        self.log = Log()
+        self.buffer = ReplayBuffer()
+
+    def _promote(self, version):
+        '''
+
+        Parameters
+        ----------
+        version : int
+            Checkpoint version.
+
+        Returns
+        -------
+        None.
+            Replace best_network.h5 by the checkpoint at once.
+            Workers reload it before their next game.
+
+        '''
+        tmp = os.path.join('networks', 'best_network.tmp.h5')
+        shutil.copyfile(os.path.join('networks', checkpoint_file(version)), tmp)
+        os.replace(tmp, os.path.join('networks', 'best_network.h5'))
+
+    def _judge(self, version, sprt):
+        '''
+
+        Parameters
+        ----------
+        version : int
+            Checkpoint version.
+        sprt : SPRT
+            Test of the checkpoint's evaluation matches.
+
+        Returns
+        -------
+        None.
+            The checkpoint is promoted when SPRT accepts it,
+            or when its average reaches config.EVAL_THRESHOLD after config.EVAL_MATCH matches.
+
+        '''
+        promoted = sprt.decision()
+        average = sum(sprt.points) / len(sprt.points) if sprt.points else 0.
+        print('\rEvaluation v{} Average: {} in {} matches => {}'.format(
+            version, average, len(sprt.points), 'promoted' if promoted else 'rejected',
+        ))
+        self.log.log_result(sprt.points, 'v{}'.format(version))
+        if promoted:
+            self._promote(version)
+
+    def run(self, start=0, cycles=None):
+        '''
+
+        Parameters
+        ----------
+        start : int
+            First self match cycle.
+        cycles : int
+            Number of self match cycles, each of config.SELFMATCH games. config.CYCLES - start when None.
+
+        Returns
+        -------
+        None.
+            Returns when the last cycle is ingested and the checkpoint being evaluated is judged.
+            Then the trainer is stopped after its current checkpoint.
+
+        '''
+        cycles = config.CYCLES - start if cycles is None else cycles
+        workers = len(self.pool.processes)
+        context = multiprocessing.get_context('spawn')
+        stop = context.Event()
+        trainer = context.Process(target=_train, args=(stop, self.epochs), daemon=True)
+        trainer.start()
+
+        versions = checkpoints()
+        evaluated = versions[-1] if versions else 0
+        candidate, evals, sprt = None, [], None
+        # Checkpoint file => evaluation matches in flight. Files are not deleted while they are played.
+        running = {}
+        # Self matches of a cycle finish in any order, so they are counted by cycle.
+        next_cycle, next_game, finished = start, 0, {}
+        inflight = 0
+        self.pool.reset_usage()
+
+        try:
+            while inflight or evals or next_cycle < start + cycles:
+                if not trainer.is_alive():
+                    raise RuntimeError('Trainer stopped with exit code {}.'.format(trainer.exitcode))
+
+                # Evaluation matches go first, self matches keep the other workers busy.
+                while inflight < workers and (evals or next_cycle < start + cycles):
+                    if evals:
+                        job = evals.pop()
+                        running[job[1][1]] = running.get(job[1][1], 0) + 1
+                        self.pool.submit(job)
+                    else:
+                        finished.setdefault(next_cycle, 0)
+                        self.pool.submit(('selfmatch', (str(next_cycle), str(next_game))))
+                        next_game += 1
+                        if next_game == config.SELFMATCH:
+                            next_cycle, next_game = next_cycle + 1, 0
+                    inflight += 1
+
+                result = self.pool.collect(timeout=1.)
+                if result is not None:
+                    inflight -= 1
+                    kind, args, point = result
+                    if kind == 'selfmatch':
+                        cycle = int(args[0])
+                        finished[cycle] += 1
+                        if finished[cycle] == config.SELFMATCH:
+                            self.buffer.ingest(cycle)
+                            print('\rSELF MATCH cycle {} ingested'.format(cycle))
+                    else:
+                        running[args[1]] -= 1
+                        # Matches of a checkpoint already judged are ignored.
+                        if candidate is not None and args[1] == checkpoint_file(candidate):
+                            # Tested in submission order, so quick decisive matches don't come first.
+                            if sprt.add(args[2], point if args[0] else 1 - point) is not None \
+                                    or sprt.games == config.EVAL_MATCH:
+                                self._judge(candidate, sprt)
+                                candidate, evals = None, []
+
+                # No new checkpoint is evaluated after the last self match is submitted.
+                if candidate is None and next_cycle < start + cycles:
+                    versions = checkpoints()
+                    if versions and versions[-1] > evaluated:
+                        # Checkpoints saved while another one was evaluated are skipped.
+                        candidate = evaluated = versions[-1]
+                        sprt = SPRT()
+                        for old in versions[:-1]:
+                            if not running.get(checkpoint_file(old)):
+                                os.remove(os.path.join('networks', checkpoint_file(old)))
+                        # Current network plays first in even matches.
+                        evals = [
+                            ('eval_match', (i % 2 == 0, checkpoint_file(candidate), i))
+                            for i in reversed(range(config.EVAL_MATCH))
+                        ]
+        finally:
+            stop.set()
+            trainer.join()
+
+        print(self.pool.usage.report())
@@ -0,0 +1,133 @@
+'''
+Recorder of self match histories.
+
+Boards, policies and values are written into preallocated buffers instead of
+stacking arrays every move. Network inputs are all 0 or 1, so they are kept in uint8.
+'''
+import numpy as np
+import config
+
+
+class GameRecorder:
+    '''
+
+    Attributes
+    ----------
+    chunk : int
+        Rows buffers grow by. A match has at most config.BREAK positions.
+    inputs : np.ndarray
+        Boards. (capacity, 9, 9, 24) uint8
+    policies : np.ndarray
+        Policies for all actions. (capacity, OUTPUT_SHAPE) float32
+    values : np.ndarray
+        Values for the player to move. (capacity,) float32
+    size : int
+        Number of recorded positions.
+    start : int
+        First position of the match being recorded.
+
+    '''
+    def __init__(self, chunk=None):
+        '''
+
+        Paramators
+        ----------
+        chunk : int
+            Rows buffers grow by. config.BREAK when None.
+
+        '''
+        self.chunk = config.BREAK if chunk is None else chunk
+        self.inputs = np.empty((self.chunk, ) + config.INPUT_SHAPE, dtype=np.uint8)
+        self.policies = np.zeros((self.chunk, config.OUTPUT_SHAPE), dtype=np.float32)
+        self.values = np.zeros(self.chunk, dtype=np.float32)
+        self.size = 0
+        self.start = 0
+
+    def _grow(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Double capacity (in chunks) keeping recorded positions.
+
+        '''
+        capacity = len(self.values) + max(self.chunk, len(self.values))
+        for name in ('inputs', 'policies', 'values'):
+            old = getattr(self, name)
+            new = np.zeros((capacity, ) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, board, takables, probs):
+        '''
+
+        Parameters
+        ----------
+        board : Board
+            Board before the action.
+        takables : list
+            Takable actions of the board.
+        probs : numpy.ndarray
+            Monte-Carlo's probabilities only for takable actions.
+
+        Returns
+        -------
+        None.
+
+        '''
+        if self.size == len(self.values):
+            self._grow()
+
+        board.reshape_input(out=self.inputs[self.size])
+        self.policies[self.size] = 0
+        self.policies[self.size, takables] = probs
+        self.size += 1
+
+    def finish(self, value):
+        '''
+
+        Parameters
+        ----------
+        value : int, float
+            Value of the match for the first player.
+
+        Returns
+        -------
+        hist_input : np.ndarray
+            Match's board history. A view of the buffer.
+        hist_policy : np.ndarray
+            Match's policy history. A view of the buffer.
+        hist_value : np.ndarray
+            Match's value history, whose sign alternates every position. A view of the buffer.
+
+        '''
+        start, end = self.start, self.size
+        self.values[start:end] = value
+        self.values[start + 1:end:2] *= -1
+        self.start = end
+
+        return self.inputs[start:end], self.policies[start:end], self.values[start:end]
+
+    def games(self):
+        '''
+
+        Returns
+        -------
+        hists : list
+            [board history, policy history, value history] of all finished matches. Views of the buffers.
+
+        '''
+        return [self.inputs[:self.start], self.policies[:self.start], self.values[:self.start]]
+
+    def clear(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Forget recorded positions. Buffers are kept for the next matches.
+
+        '''
+        self.size = 0
+        self.start = 0
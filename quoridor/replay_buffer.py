@@ -0,0 +1,212 @@
+'''
+Replay buffer of decoded self match positions.
+
+Positions of one cycle are saved as one shard file (.npy of SAMPLE records),
+written to a temporary file and renamed, so readers never see half written shards.
+Shards are memory-mapped, so minibatches are sampled without loading whole shards.
+Only the last config.REPLAY_WINDOW cycles are used.
+'''
+import os
+import glob
+import numpy as np
+from recorder import GameRecorder
+from game_record import GameRecord, RECORDS
+import config
+
+
+REPLAY = 'replay'
+SAMPLE = np.dtype([
+    ('input', np.uint8, config.INPUT_SHAPE),
+    ('policy', np.float32, (config.OUTPUT_SHAPE, )),
+    ('value', np.float32),
+])
+
+
+class ReplayBuffer:
+    '''
+
+    Attributes
+    ----------
+    path : str
+        Directory of shards.
+    records : str
+        Directory of game records.
+    window : int
+        Number of the latest cycles used.
+    shards : dict
+        Cycle => memory-mapped shard in the window.
+    ends : np.ndarray
+        Cumulative number of positions of shards, in order of cycles.
+
+    '''
+    def __init__(self, cwd=None, window=None):
+        '''
+
+        Paramators
+        ----------
+        cwd : str
+            Current directory string. Directories are relative to it.
+        window : int
+            Number of the latest cycles used. config.REPLAY_WINDOW when None.
+
+        '''
+        self.path = REPLAY if cwd is None else os.path.join(cwd, REPLAY)
+        self.records = RECORDS if cwd is None else os.path.join(cwd, RECORDS)
+        self.window = config.REPLAY_WINDOW if window is None else window
+        self.shards = {}
+        self.ends = np.zeros(0, dtype=np.int64)
+        os.makedirs(self.path, exist_ok=True)
+
+    def __len__(self):
+        return int(self.ends[-1]) if len(self.ends) else 0
+
+    def _shard_path(self, cycle):
+        return os.path.join(self.path, '{:06d}.npy'.format(int(cycle)))
+
+    def cycles(self):
+        '''
+
+        Returns
+        -------
+        cycles : list
+            Cycles whose shards are on disk, in ascending order.
+
+        '''
+        names = glob.glob(os.path.join(self.path, '[0-9]*.npy'))
+
+        return sorted(int(os.path.basename(n)[:-4]) for n in names)
+
+    def append(self, cycle, inputs, policies, values):
+        '''
+
+        Parameters
+        ----------
+        cycle : int
+            Cycle of the positions.
+        inputs : np.ndarray
+            Boards. (N, 9, 9, 24)
+        policies : np.ndarray
+            Policies. (N, OUTPUT_SHAPE)
+        values : np.ndarray
+            Values. (N,)
+
+        Returns
+        -------
+        None.
+            The shard appears at once by renaming, and shards out of the window are deleted.
+
+        '''
+        shard = np.empty(len(values), dtype=SAMPLE)
+        shard['input'] = inputs
+        shard['policy'] = policies
+        shard['value'] = values
+
+        path = self._shard_path(cycle)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, shard)
+        os.replace(tmp, path)
+
+        for old in self.cycles()[:-self.window]:
+            try:
+                os.remove(self._shard_path(old))
+            except OSError:
+                # Still mapped by a reader on some platforms. Out of the window anyway.
+                pass
+
+    def ingest(self, cycle):
+        '''
+
+        Parameters
+        ----------
+        cycle : int
+            Cycle whose game records are decoded into a shard.
+
+        Returns
+        -------
+        positions : int
+            Number of positions appended.
+
+        '''
+        recorder = GameRecorder()
+        for path in sorted(glob.glob(os.path.join(self.records, str(cycle), '*.npz'))):
+            GameRecord.load(path).decode(recorder)
+        self.append(cycle, *recorder.games())
+
+        return recorder.start
+
+    def refresh(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Map shards appended since the last refresh and unmap ones out of the window.
+
+        '''
+        cycles = self.cycles()[-self.window:]
+        self.shards = {
+            c: self.shards[c] if c in self.shards else np.load(self._shard_path(c), mmap_mode='r')
+            for c in cycles
+        }
+        self.ends = np.cumsum([len(self.shards[c]) for c in cycles]).astype(np.int64)
+
+    def sample(self, batch, rng=None):
+        '''
+
+        Parameters
+        ----------
+        batch : int
+            Number of positions.
+        rng : np.random.Generator
+            Random generator. New one is used when None.
+
+        Returns
+        -------
+        inputs : np.ndarray
+            Boards. (batch, 9, 9, 24) float32
+        policies : np.ndarray
+            Policies. (batch, OUTPUT_SHAPE)
+        values : np.ndarray
+            Values. (batch,)
+
+        '''
+        rng = np.random.default_rng() if rng is None else rng
+        samples = np.empty(batch, dtype=SAMPLE)
+        # Sorted indices read every shard in file order.
+        idx = np.sort(rng.integers(0, len(self), size=batch))
+        owners = np.searchsorted(self.ends, idx, side='right')
+        starts = np.concatenate([[0], self.ends[:-1]])
+
+        for k, shard in enumerate(self.shards.values()):
+            mask = owners == k
+            if mask.any():
+                samples[mask] = shard[idx[mask] - starts[k]]
+
+        return samples['input'].astype(np.float32), samples['policy'], samples['value']
+
+    def batches(self, batch, steps, rng=None):
+        '''
+
+        Parameters
+        ----------
+        batch : int
+            Number of positions in a minibatch.
+        steps : int
+            Minibatches between refreshes, which is steps of one train epoch.
+        rng : np.random.Generator
+            Random generator. New one is used when None.
+
+        Returns
+        -------
+        generator : generator
+            Endless (inputs, (policies, values)) minibatches for model.fit.
+            Shards appended while training are used from the next refresh.
+
+        '''
+        rng = np.random.default_rng() if rng is None else rng
+        while True:
+            self.refresh()
+            for _ in range(steps):
+                inputs, policies, values = self.sample(batch, rng)
+                yield inputs, (policies, values)
@@ -0,0 +1,395 @@
+'''
+Array backed Monte-Carlo search tree.
+
+Each node is an index of preallocated numpy arrays instead of a Node object.
+Children of a node are stored contiguously, so that selection is
+one vectorized PUCT argmax over [first[i], first[i] + count[i]).
+A child keeps only its parent and action until it is selected first time,
+then its board is built.
+'''
+import numpy as np
+from board import reshape_inputs
+import config
+
+
+class SearchTree:
+    '''
+
+    Attributes
+    ----------
+    cpuct : float
+        c puct constance.
+    eps : float
+        Constance for noise.
+    alpha : float
+        Constance for noise.
+    size : int
+        Number of nodes in this tree. Root is 0.
+    n : np.ndarray
+        How many times each node ever simulated.
+    w : np.ndarray
+        Value each node ever got.
+    p : np.ndarray
+        Policy of the edge from the parent to each node.
+    first : np.ndarray
+        Index of the first child. -1 when the node isn't expanded.
+    count : np.ndarray
+        Number of children.
+    action : np.ndarray
+        Action index from the parent to each node.
+    parent : np.ndarray
+        Index of the parent. -1 for the root.
+    dammy : np.ndarray
+        Is the node dammy (has this node's board already appeared)?
+    boards : list
+        Board of each node. None until the node is selected first time.
+    history : set
+        Match's history contains board's zobrist key.
+
+    '''
+    def __init__(self, board, cpuct=None, capacity=1024):
+        '''
+
+        Paramators
+        ----------
+        board : Board
+            Root board.
+        cpuct : float
+            Constant used for node evaluation. config.C_PUT when None.
+        capacity : int
+            Initial number of nodes arrays can hold. Arrays grow twice when full.
+
+        '''
+        self.cpuct = config.C_PUT if cpuct is None else cpuct
+        self.eps = config.EPS
+        self.alpha = config.ALPHA
+        self.size = 1
+        self.n = np.zeros(capacity, dtype=np.float64)
+        self.w = np.zeros(capacity, dtype=np.float64)
+        self.p = np.zeros(capacity, dtype=np.float64)
+        self.first = np.full(capacity, -1, dtype=np.int64)
+        self.count = np.zeros(capacity, dtype=np.int64)
+        self.action = np.full(capacity, -1, dtype=np.int64)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.dammy = np.zeros(capacity, dtype=bool)
+        self.boards = [board]
+        self.history = set()
+
+    def _grow(self, needed):
+        '''
+
+        Parameters
+        ----------
+        needed : int
+            Number of nodes arrays have to hold.
+
+        Returns
+        -------
+        None.
+
+        '''
+        capacity = len(self.n)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+
+        for name, fill in (('n', 0), ('w', 0), ('p', 0), ('first', -1), ('count', 0), ('action', -1), ('parent', -1), ('dammy', False)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _select(self, i):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Expanded node index.
+
+        Returns
+        -------
+        child : int
+            Child index which has the highest PUCT value.
+
+        '''
+        start = self.first[i]
+        end = start + self.count[i]
+        n = self.n[start:end]
+        u = self.cpuct * self.p[start:end] * np.sqrt(n.sum()) / (1 + n)
+        q = np.divide(-self.w[start:end], n, out=np.zeros_like(n), where=n > 0)
+        values = np.where(self.dammy[start:end], -np.inf, q + u)
+
+        while True:
+            child = start + int(np.argmax(values))
+            if self.boards[child] is not None:
+                return child
+            # Repetition is found when the child is materialised. Select again without it.
+            self._materialise(child)
+            if not self.dammy[child]:
+                return child
+            values[child - start] = -np.inf
+
+    def _materialise(self, i):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Node index selected first time.
+
+        Returns
+        -------
+        None.
+            Build the node's board from its parent's one,
+            and mark it dammy when the board has already appeared in the tree.
+
+        '''
+        board = self.boards[self.parent[i]].next_board(self.action[i])
+        self.boards[i] = board
+        if board.key in self.history:
+            self.dammy[i] = True
+        else:
+            self.history.add(board.key)
+
+    def select_path(self):
+        '''
+
+        Returns
+        -------
+        path : list
+            Node indecs from root to a leaf (not expanded or over) chosen by _select.
+
+        '''
+        i = 0
+        path = [i]
+        while self.first[i] >= 0 and not self.boards[i].is_over():
+            i = self._select(i)
+            path.append(i)
+
+        return path
+
+    def add_virtual_loss(self, path, loss):
+        '''
+
+        Parameters
+        ----------
+        path : list
+            Node indecs built by select_path.
+        loss : int, float
+            Virtual loss. Negative value removes it.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.n[path] += loss
+        self.w[path] += loss
+
+    def backup(self, path, value):
+        '''
+
+        Parameters
+        ----------
+        path : list
+            Node indecs built by select_path.
+        value : float
+            Value of the leaf for the leaf's player.
+
+        Returns
+        -------
+        None.
+
+        '''
+        signs = np.where(np.arange(len(path))[::-1] % 2 == 0, 1.0, -1.0)
+        self.w[path] += value * signs
+        self.n[path] += 1
+
+    def terminal_value(self, i):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Node index whose board is already over.
+
+        Returns
+        -------
+        value : int
+            Value of the board.
+
+        '''
+        return -1 if self.boards[i].is_lose() else 0
+
+    def expand(self, i, policy, takables):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Node index to expand.
+        policy : numpy.ndarray
+            Network's policy for all actions. (OUTPUT_SHAPE,)
+        takables : list
+            Takable actions of the node's board.
+
+        Returns
+        -------
+        None.
+
+        '''
+        policy = policy[takables]
+        policy /= sum(policy) if sum(policy) else 1
+
+        start = self.size
+        end = start + len(takables)
+        self._grow(end)
+        self.first[i] = start
+        self.count[i] = len(takables)
+        self.p[start:end] = policy
+        self.action[start:end] = takables
+        self.parent[start:end] = i
+        self.boards.extend([None] * len(takables))
+        self.size = end
+        if i == 0:
+            self.add_noise()
+
+    def add_noise(self, i=0):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Expanded node index.
+
+        Returns
+        -------
+        None.
+            Mix dirichlet noise into policies of the node's children.
+
+        '''
+        start = self.first[i]
+        end = start + self.count[i]
+        noises = np.random.dirichlet(alpha=[self.alpha] * (end - start))
+        self.p[start:end] = (1 - self.eps) * self.p[start:end] + self.eps * noises
+
+    def advance(self, action):
+        '''
+
+        Parameters
+        ----------
+        action : int
+            Action taken at the root.
+
+        Returns
+        -------
+        tree : SearchTree
+            New tree whose root is the root's child for the action.
+            Statistics of the child's subtree are kept, history and dammy flags
+            are rebuilt only from the subtree, and dirichlet noise is applied
+            to the new root's children when already expanded.
+
+        '''
+        start = self.first[0]
+        children = self.action[start:start + self.count[0]]
+        child = start + int(np.flatnonzero(children == action)[0])
+        if self.boards[child] is None:
+            self._materialise(child)
+
+        # Breadth first order keeps every node's children contiguous.
+        olds = [child]
+        firsts = []
+        for i in olds:
+            if self.first[i] < 0:
+                firsts.append(-1)
+            else:
+                firsts.append(len(olds))
+                olds.extend(range(self.first[i], self.first[i] + self.count[i]))
+
+        tree = SearchTree(self.boards[child], self.cpuct, capacity=len(self.n))
+        size = len(olds)
+        tree.size = size
+        for name in ('n', 'w', 'p', 'count', 'action'):
+            getattr(tree, name)[:size] = getattr(self, name)[olds]
+        tree.first[:size] = firsts
+        index = {old: new for new, old in enumerate(olds)}
+        tree.parent[1:size] = [index[i] for i in self.parent[olds[1:]]]
+        tree.boards = [self.boards[i] for i in olds]
+        for j in range(1, size):
+            if tree.boards[j] is None:
+                continue
+            s = tree.boards[j].key
+            tree.dammy[j] = s in tree.history
+            tree.history.add(s)
+
+        if tree.first[0] >= 0:
+            tree.add_noise()
+
+        return tree
+
+    def search(self, net, simulations, batch, inputs=None):
+        '''
+
+        Parameters
+        ----------
+        net : Neural Network
+            Neural network class defined in network.py.
+            This class has method "predict" for batched inputs.
+        simulations : int
+            Number you want to repeat for root noe evaluation.
+        batch : int
+            Leaves evaluated by the network at once with virtual loss.
+        inputs : np.ndarray
+            Buffer for batched network inputs. (batch, 9, 9, 24)
+
+        Returns
+        -------
+        None.
+
+        '''
+        done = 0
+        while done < simulations:
+            paths = []
+            while len(paths) < min(batch, simulations - done):
+                path = self.select_path()
+                leaf = path[-1]
+                if self.boards[leaf].is_over():
+                    self.backup(path, self.terminal_value(leaf))
+                    done += 1
+                    continue
+                # The same leaf is already waiting for evaluation.
+                if any(leaf == p[-1] for p in paths):
+                    break
+                self.add_virtual_loss(path, config.VIRTUAL_LOSS)
+                paths.append(path)
+
+            if not paths:
+                continue
+            xs = reshape_inputs([self.boards[p[-1]] for p in paths], inputs)
+            policies, values = net.predict(xs)
+            for path, policy, value in zip(paths, policies, values):
+                leaf = path[-1]
+                self.add_virtual_loss(path, -config.VIRTUAL_LOSS)
+                self.expand(leaf, policy, self.boards[leaf].takable_actions())
+                self.backup(path, value)
+            done += len(paths)
+
+    def visits(self, i=0):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Expanded node index.
+
+        Returns
+        -------
+        visits : np.ndarray
+            Simulated times of the node's children, in order of takable_actions.
+
+        '''
+        start = self.first[i]
+
+        return self.n[start:start + self.count[i]].copy()
@@ -1,11 +1,10 @@
 import numpy as np
-import os
-import time
-import subprocess
-from networks import Network
-from montecarlo import MCTS
-from copy import deepcopy
-from board import Board
+from montecarlo import PersistentSearch
+import async_match
+from game_record import GameRecord, record_path
+from worker_pool import WorkerPool
+from replay_buffer import ReplayBuffer
+from bitboard import make_board
 from logs import Log
 import config
 
@@ -17,17 +16,21 @@ class SelfMatch:
     ----------
     log : Log
         Logging class.
+    pool : WorkerPool
+        Worker processes playing self matches. Built on first parallel_match when not given.
 
     '''
-    def __init__(self):
+    def __init__(self, pool=None):
         '''
 
         Paramators
         ----------
-        None.
+        pool : WorkerPool
+            Worker processes shared with Match.
 
         '''
         self.log = Log()
+        self.pool = pool
 
     def first_play_value(self, board):
         '''
@@ -50,34 +53,6 @@ class SelfMatch:
         else:
             return .5
 
-    def _save_history(self, hist_input, hist_policy, hist_value, epochs):
-        '''
-
-        Parameters
-        ----------
-        hist_input : np.ndarray
-            Match's board history.
-        hist_policy : np.ndarray
-            Match's policy history.
-        hist_value : np.ndarray
-            Match's value history.
-
-        Returns
-        -------
-        None.
-
-        '''
-        os.makedirs('histories_input', exist_ok=True)
-        os.makedirs('histories_policy', exist_ok=True)
-        os.makedirs('histories_value', exist_ok=True)
-
-        path = os.path.join('histories_input', '{}.npy'.format(epochs))
-        np.save(path, hist_input)
-        path = os.path.join('histories_policy', '{}.npy'.format(epochs))
-        np.save(path, hist_policy)
-        path = os.path.join('histories_value', '{}.npy'.format(epochs))
-        np.save(path, hist_value)
-
     def match(self, net, algo, simulations, gamma):
         '''
 
@@ -96,49 +71,26 @@ class SelfMatch:
 
         Returns
         -------
-        hist_input : np.ndarray
-            Match's board history.
-        hist_policy : np.ndarray
-            Match's policy history.
-        hist_value : np.ndarray
-            Match's value history.
-        ret : int
-            Match Value.
+        record : GameRecord
+            Actions, visits of every move and value of the match, same as async_match.play_selfmatch.
 
         '''
-        board = Board()
-        hist_input, hist_policy = None, None
+        record = GameRecord()
+        board = make_board()
+        search = PersistentSearch(algo)
 
         while not board.is_over():
-            probs = algo.get_probs(net, board, simulations, gamma)
-            policy = np.zeros(config.OUTPUT_SHAPE)
-            for a, p in zip(board.takable_actions(), probs):
-                policy[a] = p
-
-            inp = board.reshape_input()
-            if hist_input is None:
-                hist_input = inp.copy()
-            else:
-                hist_input = np.vstack([hist_input, inp])
-
-            if hist_policy is None:
-                hist_policy = policy.copy()
-            else:
-                hist_policy = np.vstack([hist_policy, policy])
-
-            action = np.random.choice(board.takable_actions(), p=probs)
-            old_board = deepcopy(board)
-            board = old_board.next_board(action)
-
-        value = self.first_play_value(board)
-        ret = value
-        hist_value = np.zeros(hist_policy.shape[0])
-        for i in range(len(hist_value)):
-            hist_value[i] = value
-            value *= -1
-
-        return hist_input, hist_policy, hist_value, ret
-    
+            probs = search.get_probs(net, board, simulations, gamma)
+            takables = board.takable_actions()
+
+            action = np.random.choice(takables, p=probs)
+            record.add(takables, search.visits, action)
+            board = board.next_board(action)
+            search.advance(action)
+        record.finish(async_match.get_value(board))
+
+        return record
+
     def selfmatch(self, net, algo, matches, simulations, gamma, epoch):
         '''
 
@@ -162,32 +114,19 @@ class SelfMatch:
         Returns
         -------
         None.
+            Records are saved and ingested into the replay buffer as parallel_match does.
 
         '''
-        hist_inputs, hist_policies, hist_values, results = None, None, None, []
+        results = []
         for i in range(matches):
-            print('Self Play Repeats: {}-{}/{}'.format(j, i, matches))
-            hist_input, hist_policy, hist_value, value = self.match(net, algo, simulations, gamma)
-            results.append(value)
+            print('Self Play Repeats: {}-{}/{}'.format(epoch, i, matches))
+            record = self.match(net, algo, simulations, gamma)
+            record.save(record_path(epoch, i))
+            # First player's value (1, 0, -1) => point (1, .5, 0).
+            results.append((record.value + 1) / 2)
 
-            if hist_inputs is None:
-                hist_inputs = hist_input.copy()
-            else:
-                hist_inputs = np.vstack([hist_inputs, hist_input])
-
-            if hist_policies is None:
-                hist_policies = hist_policy.copy()
-            else:
-                hist_policies = np.vstack([hist_policies, hist_policy])
-
-            if hist_values is None:
-                hist_values = hist_value.copy()
-            else:
-                hist_values = np.append(hist_values, hist_value)
-
-        self.log.log_result(results, epoches)
-        self._save_history(hist_inputs, hist_policies, hist_values, epoches * config.PARALLEL_MATCH + j)
-        
+        self.log.log_result(results, epoch)
+        ReplayBuffer().ingest(epoch)
 
     def parallel_match(self, epoch):
         '''
@@ -202,13 +141,20 @@ class SelfMatch:
         None.
 
         '''
-        for i in range(config.SELFMATCH // config.PARALLEL_MATCH):
-            rs = []
-            for process in range(config.PARALLEL_MATCH):
-                sh = 'python async_match.py {} {} {}'.format('selfmatch', epoch, i * config.PARALLEL_MATCH + process)
-                r = subprocess.Popen(sh, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                rs.append(r)
-            for r in rs:
-                r.wait()
-                print('\rSELF MATCH {} / {}'.format(i * config.PARALLEL_MATCH + process + 1, config.SELFMATCH), end='')
+        if self.pool is None:
+            self.pool = WorkerPool()
+        self.pool.reset_usage()
+        if config.VECTOR_GAMES:
+            # Every job plays VECTOR_GAMES matches at once, whose records are numbered from i.
+            jobs = [
+                ('vector_selfmatch', (str(epoch), str(i), min(config.VECTOR_GAMES, config.SELFMATCH - i)))
+                for i in range(0, config.SELFMATCH, config.VECTOR_GAMES)
+            ]
+        else:
+            jobs = [('selfmatch', (str(epoch), str(i))) for i in range(config.SELFMATCH)]
+        for i, _ in enumerate(self.pool.run(jobs)):
+            print('\rSELF MATCH {} / {}'.format(i + 1, len(jobs)), end='')
         print()
+        print(self.pool.usage.report())
+
+        ReplayBuffer().ingest(epoch)
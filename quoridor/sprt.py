@@ -0,0 +1,138 @@
+'''
+Sequential probability ratio test for gating new networks.
+
+Evaluation points (win 1, draw .5, lose 0) are tested one by one,
+H0: the candidate scores p0 against the best network, H1: it scores p1.
+The test stops as soon as the log likelihood ratio leaves (lower, upper).
+Points must be tested in the order matches were submitted, not the order they finish:
+short matches are more often decisive, so testing them first biases the test.
+When the matches run out first, the average point is compared to a fixed threshold.
+'''
+import numpy as np
+import config
+
+
+class SPRT:
+    '''
+
+    Attributes
+    ----------
+    p0 : float
+        Candidate's expected point under H0.
+    p1 : float
+        Candidate's expected point under H1.
+    lower : float
+        H0 is accepted when the log likelihood ratio goes down to it.
+    upper : float
+        H1 is accepted when the log likelihood ratio goes up to it.
+    llr : float
+        Log likelihood ratio of points so far.
+    games : int
+        Number of points so far.
+    points : list
+        Points tested so far, in submission order.
+    pending : dict
+        Submission index => point of matches finished before an earlier one.
+    accepted : bool
+        True when H1 is accepted, False when H0 is accepted, None until decided.
+
+    '''
+    def __init__(self, p0=None, p1=None, alpha=None, beta=None):
+        '''
+
+        Paramators
+        ----------
+        p0 : float
+            Candidate's expected point under H0. config.SPRT_P0 when None.
+        p1 : float
+            Candidate's expected point under H1. config.SPRT_P1 when None.
+        alpha : float
+            Probability of accepting H1 when H0 is true. config.SPRT_ALPHA when None.
+        beta : float
+            Probability of accepting H0 when H1 is true. config.SPRT_BETA when None.
+
+        '''
+        self.p0 = config.SPRT_P0 if p0 is None else p0
+        self.p1 = config.SPRT_P1 if p1 is None else p1
+        alpha = config.SPRT_ALPHA if alpha is None else alpha
+        beta = config.SPRT_BETA if beta is None else beta
+        self.lower = np.log(beta / (1 - alpha))
+        self.upper = np.log((1 - beta) / alpha)
+        self.llr = 0.
+        self.games = 0
+        self.points = []
+        self.pending = {}
+        self.accepted = None
+
+    def update(self, point):
+        '''
+
+        Parameters
+        ----------
+        point : float
+            Candidate's point of a match. Win 1, draw .5, lose 0.
+
+        Returns
+        -------
+        accepted : bool
+            True when H1 is accepted, False when H0 is accepted, None until decided.
+            Points after the decision are ignored.
+
+        '''
+        if self.accepted is not None:
+            return self.accepted
+
+        # A draw counts as half a win and half a loss.
+        self.llr += point * np.log(self.p1 / self.p0) + (1 - point) * np.log((1 - self.p1) / (1 - self.p0))
+        self.games += 1
+        self.points.append(point)
+        if self.llr >= self.upper:
+            self.accepted = True
+        elif self.llr <= self.lower:
+            self.accepted = False
+
+        return self.accepted
+
+    def add(self, index, point):
+        '''
+
+        Parameters
+        ----------
+        index : int
+            Submission index of the match, counted from 0.
+        point : float
+            Candidate's point of the match. Win 1, draw .5, lose 0.
+
+        Returns
+        -------
+        accepted : bool
+            Same as update. Points are kept until every earlier match has finished,
+            so the test only stops where all earlier matches are tested.
+
+        '''
+        self.pending[index] = point
+        while self.accepted is None and self.games in self.pending:
+            self.update(self.pending.pop(self.games))
+
+        return self.accepted
+
+    def decision(self, threshold=None):
+        '''
+
+        Parameters
+        ----------
+        threshold : float
+            Average point needed for promotion when the test hasn't decided. config.EVAL_THRESHOLD when None.
+
+        Returns
+        -------
+        accepted : bool
+            accepted when decided, otherwise whether the average point reaches threshold.
+            Used when the evaluation runs out of matches before the test decides.
+
+        '''
+        if self.accepted is not None:
+            return self.accepted
+
+        threshold = config.EVAL_THRESHOLD if threshold is None else threshold
+        return bool(self.points) and np.mean(self.points) >= threshold
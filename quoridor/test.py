@@ -1,12 +1,28 @@
 import numpy as np
-from board import Board
+import time
+from board import Board, reshape_inputs
+from bitboard import BitBoard
+from vector_board import VectorBoard
 from match import Match
 from selfmatch import SelfMatch
-from montecarlo import MCTS
+from montecarlo import MCTS, PersistentSearch
+from game_record import GameRecord
+from recorder import GameRecorder
 from networks import Network
 import config
 
 
+class FakeNetwork:
+    '''Fixed linear network for checks which don't need a trained model.'''
+    def __init__(self):
+        self.weights = np.random.default_rng(0).random((np.prod(config.INPUT_SHAPE), config.OUTPUT_SHAPE + 1))
+
+    def predict(self, xs):
+        ys = np.asarray(xs).reshape(len(xs), -1) @ self.weights
+        policies = np.exp((ys[:, :-1] - ys[:, :-1].max(axis=1, keepdims=True)) / 10)
+        return policies / policies.sum(axis=1, keepdims=True), np.tanh(ys[:, -1] / 1000 - 1)
+
+
 if __name__ == '__main__':
     ''' # Sample Game(by random)
     def random_action(board):
@@ -45,17 +61,8 @@ if __name__ == '__main__':
 
     #'''
 
-    #''' # Sample Network 
-    net = Network(
-        config.INPUT_SHAPE,
-        config.OUTPUT_SHAPE,
-        config.FILTER,
-        config.KERNEL,
-        config.STRIDE,
-        config.INITIALIZER,
-        config.REGULARIZER,
-        config.RES_NUM,
-    )
+    ''' # Sample Network
+    net = Network()
     #'''
 
     ''' # Sample Monte-Carlo Game Play
@@ -101,6 +108,191 @@ if __name__ == '__main__':
     )
     #'''
 
+    #''' # Sample BitBoard equivalence (by random)
+    times = 100
+    for i in range(times):
+        board, bitboard = Board(), BitBoard()
+        while not board.is_over():
+            takables = board.takable_actions()
+            assert takables == bitboard.takable_actions()
+            assert np.array_equal(board.reshape_input(), bitboard.reshape_input())
+            assert board.board_to_str() == bitboard.board_to_str()
+            assert board.is_lose() == bitboard.is_lose() and board.is_first() == bitboard.is_first()
+
+            action = np.random.choice(takables)
+            board = board.next_board(action)
+            bitboard = bitboard.next_board(action)
+
+        assert bitboard.is_over() and board.is_lose() == bitboard.is_lose()
+        print('\rBitBoard equivalence: {}/{}'.format(i + 1, times), end='')
+    print()
+    #'''
+
+    #''' # Sample VectorBoard equivalence (by random)
+    times, games = 4, 32
+    for i in range(times):
+        vector_board, boards = VectorBoard(games), [Board() for _ in range(games)]
+        while not vector_board.is_over().all():
+            masks, inputs = vector_board.takable_actions(), vector_board.reshape_input()
+            lose, over = vector_board.is_lose(), vector_board.is_over()
+            actions = np.full(games, -1)
+            for j, board in enumerate(boards):
+                assert over[j] == board.is_over() and lose[j] == board.is_lose()
+                if board.is_over():
+                    assert not masks[j].any()
+                    continue
+                takables = board.takable_actions()
+                assert np.flatnonzero(masks[j]).tolist() == takables
+                assert np.array_equal(inputs[j], board.reshape_input()[0])
+                assert vector_board.board(j).key == board.key
+
+                actions[j] = np.random.choice(takables)
+                boards[j] = board.next_board(actions[j])
+            vector_board.next_board(actions)
+        print('\rVectorBoard equivalence: {}/{}'.format(i + 1, times), end='')
+    print()
+    #'''
+
+    #''' # Sample push/pop equivalence with next_board (by random)
+    def same(a, b):
+        return a.key == b.key and a.takable_actions() == b.takable_actions() \
+            and np.array_equal(a.reshape_input(), b.reshape_input())
+
+    times = 10
+    for i in range(times):
+        for board in (Board(), BitBoard()):
+            pushed = type(board)()
+            while not board.is_over():
+                takables = board.takable_actions()
+                for action in np.random.choice(takables, min(8, len(takables)), replace=False):
+                    pushed.push(action)
+                    assert same(pushed, board.next_board(action))
+                    assert pushed.pop() == action and same(pushed, board)
+
+                action = np.random.choice(takables)
+                board = board.next_board(action)
+                pushed.push(action)
+                assert same(pushed, board)
+        print('\rpush/pop equivalence: {}/{}'.format(i + 1, times), end='')
+    print()
+    #'''
+
+    #''' # Sample SearchTree equivalence with Node (by fixed fake network)
+    net, array_tree = FakeNetwork(), config.ARRAY_TREE
+    for batch in (1, 8):
+        board = Board()
+        searches = {tree: PersistentSearch(MCTS(batch=batch)) for tree in (False, True)}
+        for turn in range(20):
+            visits = []
+            for tree, search in searches.items():
+                # Both searches draw the same root noise.
+                config.ARRAY_TREE = tree
+                np.random.seed(turn)
+                search.get_probs(net, board, 60, 1)
+                visits.append(np.asarray(search.visits))
+            assert np.array_equal(*visits), (batch, turn, visits)
+
+            action = np.random.RandomState(turn).choice(board.takable_actions())
+            for tree, search in searches.items():
+                config.ARRAY_TREE = tree
+                np.random.seed(100 + turn)
+                search.advance(action)
+            board = board.next_board(action)
+            if board.is_over():
+                break
+        print('SearchTree equivalence: batch {}'.format(batch))
+    config.ARRAY_TREE = array_tree
+    #'''
+
+    #''' # Sample transposition visits (by fixed fake network)
+    net, array_tree, transposition = FakeNetwork(), config.ARRAY_TREE, config.TRANSPOSITION
+    config.ARRAY_TREE, config.TRANSPOSITION = False, True
+    for batch in (1, 8):
+        board, search, hits = Board(), PersistentSearch(MCTS(batch=batch)), 0
+        for turn in range(30):
+            search.get_probs(net, board, 100, 1)
+            # Every expanded node counts its own evaluation and the visits of its edges,
+            # however many parents share it.
+            nodes, seen = [search.root], {id(search.root)}
+            for node in nodes:
+                assert node.children is None or node.n == 1 + sum(node.edge_n), turn
+                for child in node.children or []:
+                    if child is not None and id(child) not in seen:
+                        seen.add(id(child))
+                        nodes.append(child)
+            hits = max(hits, search.root.table.hits)
+
+            action = np.random.choice(board.takable_actions())
+            search.advance(action)
+            board = board.next_board(action)
+            if board.is_over():
+                break
+        assert hits > 0
+        print('Transposition visits: batch {}, {} hits'.format(batch, hits))
+    config.ARRAY_TREE, config.TRANSPOSITION = array_tree, transposition
+    #'''
+
+    #''' # Sample GameRecord round trip (by random)
+    times = 20
+    for i in range(times):
+        record, recorder, board = GameRecord(), GameRecorder(), Board()
+        while not board.is_over():
+            takables = board.takable_actions()
+            action = np.random.choice(takables)
+            visits = np.random.randint(0, 3, len(takables))
+            visits[takables.index(action)] += 1
+            record.add(takables, visits, action)
+            recorder.add(board, takables, visits / visits.sum())
+            board = board.next_board(action)
+        record.finish(np.random.choice([-1, 0, 1]))
+
+        loaded = GameRecord.loads(record.dumps())
+        assert loaded.actions == record.actions and loaded.value == record.value
+        assert all(np.array_equal(a, b) and np.array_equal(v, w) for (a, v), (b, w) in zip(loaded.moves, record.moves))
+        for decoded, expected in zip(loaded.decode(gamma=1), recorder.finish(record.value)):
+            assert np.allclose(decoded, expected)
+        print('\rGameRecord round trip: {}/{}'.format(i + 1, times), end='')
+    print()
+    #'''
+
+    ''' # Sample predict latency (model.predict vs Network.predict, with and without config.PREDICT_BUCKETS)
+    boards, board = [], Board()
+    while len(boards) < 64:
+        boards.append(board)
+        board = board.next_board(np.random.choice(board.takable_actions()))
+        if board.is_over():
+            board = Board()
+    xs = reshape_inputs(boards)
+
+    def latency(predict, batch, times=20):
+        predict(xs[:batch])
+        began = time.perf_counter()
+        for _ in range(times):
+            predict(xs[:batch])
+        return (time.perf_counter() - began) / times * 1000
+
+    def predictor(net, buckets):
+        def predict(xs):
+            config.PREDICT_BUCKETS = buckets
+            return net.predict(xs)
+        return predict
+
+    buckets = config.PREDICT_BUCKETS or (1, 8, 64)
+    predicts = {(): predictor(Network(load=True), ()), buckets: predictor(Network(load=True), buckets)}
+    model = Network(load=True).model
+    for batch in (1, 8, 64):
+        policies, values = model.predict(xs[:batch], verbose=0)
+        times = [latency(lambda xs: model.predict(xs, verbose=0), batch)]
+        for predict in predicts.values():
+            p, v = predict(xs[:batch])
+            assert np.allclose(p, policies, atol=1e-5) and np.allclose(v, values[:, 0], atol=1e-5)
+            times.append(latency(predict, batch))
+        print('batch {:2d}: model.predict {:.1f} ms, compiled {:.1f} ms, bucketed{} {:.1f} ms'.format(
+            batch, times[0], times[1], buckets, times[2],
+        ))
+    # Sample Result (RES_NUM 1, FILTER 16, 1 CPU) => batch 1: 132 / 1.0 / 0.9 ms, batch 64: 125 / 2.6 / 3.7 ms
+    #'''
+
     ''' # Sample Evaluation
     net = Network(load=True)
     match = Match()
@@ -2,18 +2,25 @@ import glob
 from match import Match
 from networks import Network
 from selfmatch import SelfMatch
+from worker_pool import WorkerPool
+from orchestrator import Orchestrator
 import config
 
 
 if __name__ == '__main__':
     # Network, Algorithm, Match & Selfmatch Instances
-    net = Network()
-    match = Match()
-    selfmatch = SelfMatch()
-    start = len(glob.glob('./histories_input/*'))
+    pool = WorkerPool()
+    match = Match(pool)
+    selfmatch = SelfMatch(pool)
+    start = len(glob.glob('./records/*'))
 
-    for i in range(start, config.CYCLES, 1):
-        print('********** Train for {} / {} **********'.format(i + 1, config.CYCLES))
-        selfmatch.parallel_match(i)
-        net.train(i)
-        match.parallel_evaluate(i)
+    if config.ASYNC_PIPELINE:
+        Orchestrator(pool).run(start)
+    else:
+        net = Network()
+        for i in range(start, config.CYCLES, 1):
+            print('********** Train for {} / {} **********'.format(i + 1, config.CYCLES))
+            selfmatch.parallel_match(i)
+            net.train(i)
+            match.parallel_evaluate(i)
+    pool.close()
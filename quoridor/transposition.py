@@ -0,0 +1,100 @@
+'''
+Transposition table for Monte-Carlo tree search.
+
+Positions reached through different move orders share one Node,
+so that the search tree becomes a DAG.
+Entries are keyed by (zobrist key, turn). A position can only be reached again
+at the same turn by a different move order, never by a cycle, so the DAG keeps acyclic.
+'''
+from collections import OrderedDict
+import config
+
+
+class TranspositionTable:
+    '''
+
+    Attributes
+    ----------
+    size : int
+        Max number of entries. The least recently used entry is evicted when full.
+    entries : OrderedDict
+        (zobrist key, turn) => Node. Ordered from least recently used.
+    hits : int
+        How many times get found an entry.
+
+    '''
+    def __init__(self, size=None):
+        '''
+
+        Paramators
+        ----------
+        size : int
+            Max number of entries. config.TRANSPOSITION_SIZE when None.
+
+        '''
+        self.size = config.TRANSPOSITION_SIZE if size is None else size
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, board):
+        '''
+
+        Parameters
+        ----------
+        board : Board
+            Board to look up.
+
+        Returns
+        -------
+        node : Node
+            Node stored for the board's position. None when not stored.
+
+        '''
+        key = (board.key, board.turn)
+        node = self.entries.get(key)
+        if node is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return node
+
+    def put(self, node):
+        '''
+
+        Parameters
+        ----------
+        node : Node
+            Node to store for its board's position.
+
+        Returns
+        -------
+        None.
+            Evicted nodes stay in the tree. Only later transpositions to them
+            are no longer shared.
+
+        '''
+        key = (node.board.key, node.board.turn)
+        self.entries[key] = node
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def retain(self, ids):
+        '''
+
+        Parameters
+        ----------
+        ids : set
+            ids of nodes still in the tree.
+
+        Returns
+        -------
+        None.
+            Entries of other nodes are dropped, so positions of branches
+            cut off by a new root aren't shared with their old history.
+
+        '''
+        self.entries = OrderedDict((k, node) for k, node in self.entries.items() if id(node) in ids)
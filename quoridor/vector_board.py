@@ -0,0 +1,430 @@
+'''
+Vectorized Board for N games.
+
+Like bitboard.BitBoard, every state is kept in first player's view (= absolute view),
+and actions are the same as Board's ones, which are defined in each game's self pawn's view.
+
+vertical_edges   : (N, LENGTH, LENGTH) [n, v, h] is True when the gap between (v, h) and (v, h + 1) is blocked.
+horizontal_edges : (N, LENGTH, LENGTH) [n, v, h] is True when the gap between (v, h) and (v + 1, h) is blocked.
+vertical_walls   : (N, LENGTH - 1, LENGTH - 1) [n, v, h] is True when vertical wall is built on (v, h).
+horizontal_walls : (N, LENGTH - 1, LENGTH - 1) [n, v, h] is True when horizontal wall is built on (v, h).
+'''
+import numpy as np
+from board import NEIGHBOURS, SIDES
+from bitboard import BitBoard
+from config import LENGTH, BREAK, WALLS, OUTPUT_SHAPE
+
+
+SQUARES = LENGTH * LENGTH
+SLOTS = (LENGTH - 1) * (LENGTH - 1)
+NEIGHBOUR_TABLE = np.array(NEIGHBOURS, dtype=np.int64)
+
+
+def _build_wall_edges():
+    '''
+
+    Returns
+    -------
+    vertical : np.ndarray
+        (2 * SLOTS, LENGTH, LENGTH) vertical gaps blocked by each wall slot.
+        [0, SLOTS) are vertical walls, [SLOTS, 2 * SLOTS) are horizontal walls.
+    horizontal : np.ndarray
+        (2 * SLOTS, LENGTH, LENGTH) horizontal gaps blocked by each wall slot.
+
+    '''
+    vertical = np.zeros(shape=(2 * SLOTS, LENGTH, LENGTH), dtype=bool)
+    horizontal = np.zeros(shape=(2 * SLOTS, LENGTH, LENGTH), dtype=bool)
+    for slot in range(SLOTS):
+        v, h = divmod(slot, LENGTH - 1)
+        vertical[slot, v:v + 2, h] = True
+        horizontal[SLOTS + slot, v, h:h + 2] = True
+
+    return vertical, horizontal
+
+
+WALL_VERTICAL_EDGES, WALL_HORIZONTAL_EDGES = _build_wall_edges()
+
+
+def _pack_rows(mask):
+    '''
+
+    Parameters
+    ----------
+    mask : np.ndarray
+        (..., LENGTH) or (..., LENGTH - 1) bool array.
+
+    Returns
+    -------
+    rows : np.ndarray
+        (...) uint16 array. Bit h is 1 when mask[..., h] is True.
+
+    '''
+    weights = (1 << np.arange(mask.shape[-1])).astype(np.uint16)
+
+    return (mask * weights).sum(axis=-1, dtype=np.uint16)
+
+
+def _flood(reach, open_up, open_right):
+    '''
+
+    Parameters
+    ----------
+    reach : np.ndarray
+        (M, LENGTH) uint16 start squares packed by row. This is updated in place.
+    open_up : np.ndarray
+        (M, LENGTH - 1) uint16 passable gaps between (v, h) and (v + 1, h) packed by row.
+    open_right : np.ndarray
+        (M, LENGTH) uint16 passable gaps between (v, h) and (v, h + 1) packed by row.
+
+    Returns
+    -------
+    reach : np.ndarray
+        (M, LENGTH) uint16 reachable squares packed by row.
+
+    '''
+    while True:
+        before = reach.copy()
+        reach[:, 1:] |= reach[:, :-1] & open_up
+        reach[:, :-1] |= reach[:, 1:] & open_up
+        reach |= (reach & open_right) << 1
+        reach |= (reach >> 1) & open_right
+        if np.array_equal(before, reach):
+            return reach
+
+
+def _to_bits(mask):
+    '''
+
+    Parameters
+    ----------
+    mask : np.ndarray
+        Bool array.
+
+    Returns
+    -------
+    bits : int
+        Bit i is 1 when mask.ravel()[i] is True.
+
+    '''
+    return int.from_bytes(np.packbits(mask.ravel(), bitorder='little').tobytes(), 'little')
+
+
+class VectorBoard:
+    '''
+
+    Attributes
+    ----------
+    n : int
+        Number of games.
+    pawns : np.ndarray
+        (N, 2) squares of (first pawn, second pawn) in first pawn's view.
+    walls : np.ndarray
+        (N, 2) walls of (first pawn, second pawn).
+    vertical_edges : np.ndarray
+        (N, LENGTH, LENGTH) blocked vertical gaps.
+    horizontal_edges : np.ndarray
+        (N, LENGTH, LENGTH) blocked horizontal gaps.
+    vertical_walls : np.ndarray
+        (N, LENGTH - 1, LENGTH - 1) built vertical walls.
+    horizontal_walls : np.ndarray
+        (N, LENGTH - 1, LENGTH - 1) built horizontal walls.
+    turn : np.ndarray
+        (N,) match turns.
+
+    '''
+    def __init__(self, n):
+        '''
+
+        Paramators
+        ----------
+        n : int
+            Number of games.
+
+        '''
+        self.n = n
+        self.pawns = np.zeros(shape=(n, 2), dtype=np.int64)
+        self.walls = np.zeros(shape=(n, 2), dtype=np.int64)
+        self.vertical_edges = np.zeros(shape=(n, LENGTH, LENGTH), dtype=bool)
+        self.horizontal_edges = np.zeros(shape=(n, LENGTH, LENGTH), dtype=bool)
+        self.vertical_walls = np.zeros(shape=(n, LENGTH - 1, LENGTH - 1), dtype=bool)
+        self.horizontal_walls = np.zeros(shape=(n, LENGTH - 1, LENGTH - 1), dtype=bool)
+        self.turn = np.ones(shape=n, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask=None):
+        '''
+
+        Parameters
+        ----------
+        mask : np.ndarray
+            (N,) games to reset to the initial board. All games when None.
+
+        Returns
+        -------
+        None.
+
+        '''
+        mask = np.ones(shape=self.n, dtype=bool) if mask is None else mask
+        mid = LENGTH // 2
+        self.pawns[mask] = (mid, SQUARES - 1 - mid)
+        self.walls[mask] = WALLS
+        self.vertical_edges[mask] = False
+        self.horizontal_edges[mask] = False
+        self.vertical_walls[mask] = False
+        self.horizontal_walls[mask] = False
+        self.turn[mask] = 1
+
+    def board(self, i):
+        '''
+
+        Parameters
+        ----------
+        i : int
+            Game index.
+
+        Returns
+        -------
+        board : BitBoard
+            BitBoard which has the same state as game i.
+
+        '''
+        return BitBoard(
+            pawns = tuple(int(p) for p in self.pawns[i]),
+            walls = tuple(int(w) for w in self.walls[i]),
+            vertical_edges = _to_bits(self.vertical_edges[i]),
+            horizontal_edges = _to_bits(self.horizontal_edges[i]),
+            vertical_walls = _to_bits(self.vertical_walls[i]),
+            horizontal_walls = _to_bits(self.horizontal_walls[i]),
+            turn = int(self.turn[i]),
+        )
+
+    def is_first(self):
+        return self.turn % 2 == 1
+
+    def is_lose(self):
+        '''
+
+        Returns
+        -------
+        lose : np.ndarray
+            (N,) whether other pawn has already reached its goal.
+
+        '''
+        return np.where(
+            self.is_first(),
+            self.pawns[:, 1] < LENGTH,
+            self.pawns[:, 0] >= SQUARES - LENGTH,
+        )
+
+    def is_draw(self):
+        return self.turn >= BREAK
+
+    def is_over(self):
+        return self.is_lose() | self.is_draw()
+
+    def _players(self):
+        '''
+
+        Returns
+        -------
+        me : np.ndarray
+            (N,) 0 when first pawn is to move else 1.
+        first : np.ndarray
+            (N,) whether first pawn is to move.
+
+        '''
+        first = self.is_first()
+
+        return np.where(first, 0, 1), first
+
+    def _passable(self):
+        '''
+
+        Returns
+        -------
+        passable : np.ndarray
+            (N, SQUARES, 4) whether pawn can move from square toward
+            [forward, left, backward, right] in first pawn's view.
+
+        '''
+        passable = np.zeros(shape=(self.n, LENGTH, LENGTH, 4), dtype=bool)
+        passable[:, :-1, :, 0] = ~self.horizontal_edges[:, :-1, :]
+        passable[:, :, :-1, 1] = ~self.vertical_edges[:, :, :-1]
+        passable[:, 1:, :, 2] = ~self.horizontal_edges[:, :-1, :]
+        passable[:, :, 1:, 3] = ~self.vertical_edges[:, :, :-1]
+
+        return passable.reshape(self.n, SQUARES, 4)
+
+    def movable(self):
+        '''
+
+        Returns
+        -------
+        movables : np.ndarray
+            (N, 8) takable actions for moving pawn in self pawn's view.
+            [forward, left, backward, right, jump_forward, jump_left, jump_backward, jump_right]
+
+        '''
+        idx = np.arange(self.n)
+        me, first = self._players()
+        own = self.pawns[idx, me]
+        other = self.pawns[idx, 1 - me]
+        passable = self._passable()
+        movables = np.zeros(shape=(self.n, 8), dtype=bool)
+
+        for i in range(4):
+            k = np.where(first, i, (i + 2) % 4)
+            ok = passable[idx, own, k]
+            nxt = np.maximum(NEIGHBOUR_TABLE[own, k], 0)
+            occupied = ok & (nxt == other)
+            movables[:, i] = ok & ~occupied
+
+            straight = passable[idx, nxt, k]
+            movables[:, i + 4] |= occupied & straight
+            for j in SIDES[i]:
+                kj = np.where(first, j, (j + 2) % 4)
+                movables[:, j + 4] |= occupied & ~straight & passable[idx, nxt, kj]
+
+        return movables
+
+    def blockable(self):
+        '''
+
+        Returns
+        -------
+        blockable : np.ndarray
+            (N, 2 * SLOTS) blockable indecs in self pawn's view.
+            [block_idx(vertical)...] + [block_idx(horizontal)...]
+
+        '''
+        me, first = self._players()
+        # Whether walls don't overlap with gaps or crossing walls already built.
+        crossed = (self.vertical_walls | self.horizontal_walls).reshape(self.n, SLOTS)
+        vertical = ~(self.vertical_edges[:, :-1, :-1] | self.vertical_edges[:, 1:, :-1]).reshape(self.n, SLOTS)
+        horizontal = ~(self.horizontal_edges[:, :-1, :-1] | self.horizontal_edges[:, :-1, 1:]).reshape(self.n, SLOTS)
+        candidates = np.hstack([vertical & ~crossed, horizontal & ~crossed])
+        candidates &= (self.walls[np.arange(self.n), me] > 0)[:, np.newaxis]
+
+        # Flood both pawns on every candidate at once.
+        games, slots = np.nonzero(candidates)
+        vertical_edges = self.vertical_edges[games] | WALL_VERTICAL_EDGES[slots]
+        horizontal_edges = self.horizontal_edges[games] | WALL_HORIZONTAL_EDGES[slots]
+        open_up = np.tile(_pack_rows(~horizontal_edges[:, :-1, :]), (2, 1))
+        open_right = np.tile(_pack_rows(~vertical_edges[:, :, :-1]), (2, 1))
+        reach = np.zeros(shape=(2 * len(games), LENGTH), dtype=np.uint16)
+        for i, pawns in enumerate((self.pawns[games, 0], self.pawns[games, 1])):
+            v, h = divmod(pawns, LENGTH)
+            reach[i * len(games) + np.arange(len(games)), v] = (1 << h).astype(np.uint16)
+        reach = _flood(reach, open_up, open_right)
+        goalable = (reach[:len(games), -1] != 0) & (reach[len(games):, 0] != 0)
+        candidates[games, slots] = goalable
+
+        # First pawn's view to self pawn's view.
+        second = ~first
+        candidates[second, :SLOTS] = candidates[second, SLOTS - 1::-1]
+        candidates[second, SLOTS:] = candidates[second, :SLOTS - 1:-1]
+
+        return candidates
+
+    def takable_actions(self):
+        '''
+
+        Returns
+        -------
+        actions : np.ndarray
+            (N, OUTPUT_SHAPE) legal action mask. Indecs are defined in Board.takable_actions.
+            Games already over have no takable action.
+
+        '''
+        actions = np.hstack([self.movable(), self.blockable()])
+        actions[self.is_over()] = False
+
+        return actions
+
+    def next_board(self, actions):
+        '''
+
+        Parameters
+        ----------
+        actions : np.ndarray
+            (N,) action indecs defined in takable_actions.
+            Games already over or having negative action are left as they are.
+
+        Returns
+        -------
+        None. Boards are updated in place.
+
+        '''
+        actions = np.asarray(actions)
+        active = ~self.is_over() & (actions >= 0)
+        idx = np.arange(self.n)
+        me, first = self._players()
+
+        # Move Pawn
+        i = np.where(actions < 4, actions, actions - 4) % 4
+        k = np.where(first, i, (i + 2) % 4)
+        base = np.where(actions < 4, self.pawns[idx, me], self.pawns[idx, 1 - me])
+        moved = active & (actions < 8)
+        self.pawns[idx[moved], me[moved]] = NEIGHBOUR_TABLE[base[moved], k[moved]]
+
+        # Build Wall
+        built = active & (actions >= 8) & (actions < OUTPUT_SHAPE)
+        slot = (actions - 8) % SLOTS
+        slot = np.where(first, slot, SLOTS - 1 - slot)
+        v, h = divmod(slot, LENGTH - 1)
+        vertical = built & (actions < SLOTS + 8)
+        horizontal = built & (actions >= SLOTS + 8)
+        self.vertical_edges[idx[vertical], v[vertical], h[vertical]] = True
+        self.vertical_edges[idx[vertical], v[vertical] + 1, h[vertical]] = True
+        self.vertical_walls[idx[vertical], v[vertical], h[vertical]] = True
+        self.horizontal_edges[idx[horizontal], v[horizontal], h[horizontal]] = True
+        self.horizontal_edges[idx[horizontal], v[horizontal], h[horizontal] + 1] = True
+        self.horizontal_walls[idx[horizontal], v[horizontal], h[horizontal]] = True
+        self.walls[idx[built], me[built]] -= 1
+
+        self.turn[active] += 1
+
+    def reshape_input(self, out=None):
+        '''
+
+        Parameters
+        ----------
+        out : np.ndarray
+            Buffer to write in. (N, 9, 9, 24) float32 array.
+            New buffer is allocated when None.
+
+        Returns
+        -------
+        array : np.ndarray
+            (N, 9, 9, 24) network inputs, the same as Board.reshape_input of each game.
+
+        '''
+        array = np.empty(shape=(self.n, LENGTH, LENGTH, 4 + WALLS * 2), dtype=np.float32) if out is None else out
+        idx = np.arange(self.n)
+        me, first = self._players()
+        second = ~first
+
+        # Self pawn in self view, other pawn in other's own view.
+        own = np.where(first, self.pawns[:, 0], SQUARES - 1 - self.pawns[:, 1])
+        other = np.where(first, SQUARES - 1 - self.pawns[:, 1], self.pawns[:, 0])
+        array[..., :2] = 0
+        array[idx, own // LENGTH, own % LENGTH, 0] = 1
+        array[idx, other // LENGTH, other % LENGTH, 1] = 1
+
+        open_vertical = ~self.vertical_edges[:, :, :-1]
+        open_vertical[second] = open_vertical[second, ::-1, ::-1]
+        open_horizontal = ~self.horizontal_edges[:, :-1, :]
+        open_horizontal[second] = open_horizontal[second, ::-1, ::-1]
+        array[:, :, :-1, 2] = open_vertical
+        array[:, :, -1, 2] = 0
+        array[:, :-1, :, 3] = open_horizontal
+        array[:, -1, :, 3] = 0
+
+        # Wall planes. walls_self ones and walls_other ones.
+        walls_self = self.walls[idx, me]
+        walls_other = self.walls[idx, 1 - me]
+        planes = np.arange(WALLS)
+        array[..., 4:4 + WALLS] = (planes < walls_self[:, np.newaxis])[:, np.newaxis, np.newaxis, :]
+        array[..., 4 + WALLS:] = (planes < walls_other[:, np.newaxis])[:, np.newaxis, np.newaxis, :]
+
+        return array
@@ -0,0 +1,340 @@
+'''
+Long-lived worker processes for self matches and evaluation matches.
+
+Each worker loads networks once and keeps them over jobs.
+A network is reloaded only when its file in networks/ has changed.
+Jobs are pulled from one queue, so a worker starts the next game
+as soon as its game is over, and results are streamed back as games finish.
+With config.INFERENCE_SERVER, the pool also runs an inference server
+and workers play self matches through it instead of loading best_network.h5.
+'''
+import os
+import time
+import queue
+import traceback
+import numpy as np
+import multiprocessing
+from networks import Network
+from montecarlo import MCTS
+import async_match
+from inference_server import InferenceClient, start_server, check_server, stop_server
+from game_record import record_path
+import config
+
+
+def _load(nets, filename, slot=None):
+    '''
+
+    Parameters
+    ----------
+    nets : dict
+        slot => (file stamp, Network) the worker keeps.
+    filename : str
+        Model file's name in networks/.
+    slot : str
+        Key the network is kept by. filename when None.
+        Versioned checkpoints share one slot, so only the latest one is kept.
+
+    Returns
+    -------
+    net : Network
+        Network for the file. Loaded only when the file has changed since the last load.
+        The loaded network is kept while the file is missing.
+
+    '''
+    slot = filename if slot is None else slot
+    try:
+        stat = os.stat(os.path.join('networks', filename))
+    except FileNotFoundError:
+        if slot in nets and nets[slot][0][0] == filename:
+            return nets[slot][1]
+        raise
+    # Renaming current_network.h5 to best_network.h5 keeps the mtime, so inode is compared too.
+    stamp = (filename, stat.st_mtime_ns, stat.st_ino, stat.st_size)
+    if slot in nets and nets[slot][0] == stamp:
+        return nets[slot][1]
+
+    if slot in nets:
+        net = nets[slot][1]
+        net.load_network(filename=filename)
+    else:
+        net = Network(load=True, load_file=filename)
+    nets[slot] = (stamp, net)
+
+    return net
+
+
+def _work(worker, jobs, results, ring=None):
+    '''
+
+    Parameters
+    ----------
+    worker : int
+        Index of the worker.
+    jobs : multiprocessing.Queue
+        ('selfmatch', (epoch, process)), ('vector_selfmatch', (epoch, first process, games))
+        or ('eval_match', (first, candidate file, index)). None stops the worker.
+        index is the submission index of the evaluation match, only passed back with the result.
+    results : multiprocessing.Queue
+        (kind, args, result, error, (worker, seconds, cpu seconds, games)) is put for every job.
+        result is the first player's value, a list of them for vector_selfmatch. error is traceback string or None.
+    ring : RingBuffer
+        Worker's ring of the inference server. Self matches predict through it when given.
+
+    Returns
+    -------
+    None.
+        Target of worker processes.
+
+    '''
+    nets = {}
+    algo = MCTS()
+    client = None if ring is None else InferenceClient(ring)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+
+        kind, args = job
+        began, cpu = time.perf_counter(), time.process_time()
+        try:
+            if kind == 'selfmatch':
+                net = _load(nets, 'best_network.h5') if client is None else client
+                record = async_match.play_selfmatch(net, algo)
+                record.save(record_path(*args))
+                result = record.value
+            elif kind == 'vector_selfmatch':
+                epoch, start, games = args
+                net = _load(nets, 'best_network.h5') if client is None else client
+                records = async_match.play_vector_selfmatch(net, algo, games)
+                for i, record in enumerate(records):
+                    record.save(record_path(epoch, int(start) + i))
+                result = [record.value for record in records]
+            else:
+                first = args[0]
+                current_net = _load(nets, args[1], 'candidate')
+                best_net = _load(nets, 'best_network.h5')
+                players = [current_net, best_net] if first else [best_net, current_net]
+                result = async_match.play_eval(players, algo, kind)
+            error = None
+        except Exception:
+            result, error = None, traceback.format_exc()
+        games = args[2] if kind == 'vector_selfmatch' else 1
+        usage = (worker, time.perf_counter() - began, time.process_time() - cpu, games)
+        results.put((kind, args, result, error, usage))
+
+
+class Usage:
+    '''
+
+    Attributes
+    ----------
+    games : np.ndarray
+        Games played by each worker.
+    busy : np.ndarray
+        Seconds each worker spent on games.
+    cpu : np.ndarray
+        CPU seconds each worker spent on games. nan when not measured.
+    began : float
+        time.perf_counter() when counting began.
+
+    '''
+    def __init__(self, workers):
+        '''
+
+        Paramators
+        ----------
+        workers : int
+            Number of workers.
+
+        '''
+        self.games = np.zeros(workers, dtype=np.int64)
+        self.busy = np.zeros(workers)
+        self.cpu = np.zeros(workers)
+        self.began = time.perf_counter()
+
+    def add(self, worker, busy, cpu=np.nan, games=1):
+        '''
+
+        Parameters
+        ----------
+        worker : int
+            Index of the worker.
+        busy : float
+            Seconds the game took.
+        cpu : float
+            CPU seconds the game took.
+        games : int
+            Games played in the time.
+
+        Returns
+        -------
+        None.
+
+        '''
+        self.games[worker] += games
+        self.busy[worker] += busy
+        self.cpu[worker] += cpu
+
+    def report(self):
+        '''
+
+        Returns
+        -------
+        report : str
+            Busy and CPU time of each worker over the wall time, and games per hour.
+
+        '''
+        wall = time.perf_counter() - self.began
+        lines = []
+        for i, (g, b, c) in enumerate(zip(self.games, self.busy, self.cpu)):
+            line = 'Worker {}: {} games, busy {:.1%}'.format(i, g, b / wall)
+            lines.append(line if np.isnan(c) else '{}, cpu {:.1%}'.format(line, c / wall))
+        lines.append('{} games in {:.0f}s => {:.1f} games/hour, busy {:.1%}'.format(
+            self.games.sum(), wall, self.games.sum() / wall * 3600, self.busy.sum() / (wall * len(self.busy)),
+        ))
+
+        return '\n'.join(lines)
+
+
+class WorkerPool:
+    '''
+
+    Attributes
+    ----------
+    jobs : multiprocessing.Queue
+        Queue workers pull jobs from.
+    results : multiprocessing.Queue
+        Queue workers put results to.
+    processes : list
+        Worker processes.
+    server : tuple
+        Inference server built by inference_server.start_server. None without config.INFERENCE_SERVER.
+    usage : Usage
+        Games and busy time of workers since the last reset_usage.
+
+    '''
+    def __init__(self, workers=None):
+        '''
+
+        Paramators
+        ----------
+        workers : int
+            Number of worker processes. config.PARALLEL_MATCH when None.
+
+        '''
+        workers = config.PARALLEL_MATCH if workers is None else workers
+        # Workers import TensorFlow by themselves instead of forking a process which already uses it.
+        context = multiprocessing.get_context('spawn')
+        self.jobs = context.Queue()
+        self.results = context.Queue()
+        self.server = start_server(workers) if config.INFERENCE_SERVER else None
+        rings = [None] * workers if self.server is None else self.server[2]
+        self.processes = [
+            context.Process(target=_work, args=(i, self.jobs, self.results, rings[i]), daemon=True)
+            for i in range(workers)
+        ]
+        for p in self.processes:
+            p.start()
+        self.usage = Usage(workers)
+
+    def reset_usage(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Count usage from now.
+
+        '''
+        self.usage = Usage(len(self.processes))
+
+    def run(self, jobs):
+        '''
+
+        Parameters
+        ----------
+        jobs : list
+            Jobs for _work.
+
+        Returns
+        -------
+        results : generator
+            (kind, args, result) in order games finish.
+            Workers pull the next job as soon as their game is over, so every worker has a game until jobs run out.
+
+        '''
+        for job in jobs:
+            self.submit(job)
+
+        for _ in range(len(jobs)):
+            yield self.collect()
+
+    def submit(self, job):
+        '''
+
+        Parameters
+        ----------
+        job : tuple
+            Job for _work.
+
+        Returns
+        -------
+        None.
+            The job is played by the first idle worker.
+
+        '''
+        self.jobs.put(job)
+
+    def collect(self, timeout=None):
+        '''
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds to wait for a result. Wait until one comes when None.
+
+        Returns
+        -------
+        result : tuple
+            (kind, args, result) of a finished job. None when timed out.
+            RuntimeError is raised when a worker has stopped.
+
+        '''
+        waited = 0.
+        while True:
+            # Wake up every second to raise for dead workers and to mark a dead inference server down.
+            step = 1. if timeout is None else min(1., timeout - waited)
+            try:
+                kind, args, result, error, usage = self.results.get(timeout=step)
+                break
+            except queue.Empty:
+                waited += step
+                for i, p in enumerate(self.processes):
+                    if not p.is_alive():
+                        raise RuntimeError('Worker {} stopped with exit code {}.'.format(i, p.exitcode))
+                if self.server is not None:
+                    check_server(self.server)
+                if timeout is not None and waited >= timeout:
+                    return None
+        self.usage.add(*usage)
+        if error is not None:
+            raise RuntimeError('{} {} failed in a worker.\n{}'.format(kind, args, error))
+
+        return kind, args, result
+
+    def close(self):
+        '''
+
+        Returns
+        -------
+        None.
+            Stop workers after jobs already queued, then the inference server.
+
+        '''
+        for _ in self.processes:
+            self.jobs.put(None)
+        for p in self.processes:
+            p.join()
+        if self.server is not None:
+            stop_server(self.server)
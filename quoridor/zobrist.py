@@ -0,0 +1,56 @@
+'''
+Zobrist keys for board positions.
+
+Every key is defined in first player's view (= absolute view),
+so that the same position has the same key whichever player's view the board has.
+Player 0 is first player and player 1 is second player.
+'''
+import random
+from config import LENGTH, WALLS
+
+
+_random = random.Random(20210829)
+
+# PAWN[player][square]
+PAWN = [[_random.getrandbits(64) for _ in range(LENGTH * LENGTH)] for _ in range(2)]
+# VERTICAL[slot], HORIZONTAL[slot]. slot = v * (LENGTH - 1) + h
+VERTICAL = [_random.getrandbits(64) for _ in range((LENGTH - 1) * (LENGTH - 1))]
+HORIZONTAL = [_random.getrandbits(64) for _ in range((LENGTH - 1) * (LENGTH - 1))]
+# WALLS_LEFT[player][walls]
+WALLS_LEFT = [[_random.getrandbits(64) for _ in range(WALLS + 1)] for _ in range(2)]
+# Xored when second player is to move.
+SECOND = _random.getrandbits(64)
+
+
+def board_key(pawns, walls, vertical, horizontal, first):
+    '''
+
+    Parameters
+    ----------
+    pawns : tuple
+        (first pawn's square, second pawn's square) in first pawn's view.
+    walls : tuple
+        (first pawn's walls, second pawn's walls).
+    vertical : iterable
+        Slots where vertical walls are built in first pawn's view.
+    horizontal : iterable
+        Slots where horizontal walls are built in first pawn's view.
+    first : bool
+        Is first player to move.
+
+    Returns
+    -------
+    key : int
+        64bit zobrist key.
+
+    '''
+    key = PAWN[0][pawns[0]] ^ PAWN[1][pawns[1]]
+    key ^= WALLS_LEFT[0][walls[0]] ^ WALLS_LEFT[1][walls[1]]
+    for slot in vertical:
+        key ^= VERTICAL[slot]
+    for slot in horizontal:
+        key ^= HORIZONTAL[slot]
+    if not first:
+        key ^= SECOND
+
+    return key